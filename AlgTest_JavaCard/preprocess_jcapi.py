@@ -1,7 +1,28 @@
 import os
+import re
 import sys
+import json
 import shutil
+import argparse
 import subprocess
+from multiprocessing import Pool
+
+# Variant directories src<version>/ are generated from src/, only new or changed files are processed. Files without
+# any change for the variant are hard links to the files of src/ (copies where links are not possible), so edit the
+# sources only in src/ - editing a variant file in place changes the file in src/ as well.
+# Lines of the sources marked by an API marker comment (e.g., '... //jc304') are commented out in the versions without
+# the API. Line with several markers is enabled only if all its APIs are enabled.
+API_MARKERS = ['//jc304', '//jc305']
+# API version, enabled APIs; the version is built from src<version>/ by ant target build<version> into
+# !uploader/AlgTest_<version>.cap (see jcbuild.xml)
+API_VERSIONS = [
+    ('222', []),  # JC 2.2.2 API
+    ('304', ['//jc304']),  # JC 3.0.4 API
+    ('305', ['//jc304', '//jc305']),  # JC 3.0.5 API
+]
+STATE_FILE_NAME = '.preprocess_jcapi.json'  # stored in the variant directory, outside of the built sources
+BUILD_STAMP_FILE_NAME = '.preprocess_jcapi.build.json'  # state of the variant sources of the last successful build
+STATE_VERSION = 2
 
 
 def search_files(folder):
@@ -9,55 +30,212 @@ def search_files(folder):
         yield from [os.path.join(root, x) for x in files]
 
 
-def process_file(file_name, enable_api_map):
-    with open(file_name, 'r') as f:
-        lines = f.readlines()
+def get_enable_api_map(enabled_apis):
+    return {api: api in enabled_apis for api in API_MARKERS}
 
-    output_lines = []
-    for line in lines:
-        output_line = line
-        for api in enable_api_map.keys():
-            if line.find(api) != -1:
-                # we found line with api to enable or disable
-                if enable_api_map[api]:
-                    # make sure there is no '//' at the begin of the line
-                    if line.startswith('//'):
-                        output_line = line[2:]
-                else:
-                    # add '//' at the beginning of line (if not already)
-                    if not line.startswith('//'):
-                        output_line = '//' + line
 
-        output_lines.append(output_line)
+def compile_markers(apis):
+    # longer markers first, so a marker which is a prefix of another one does not hide it
+    return re.compile('|'.join(re.escape(api) for api in sorted(apis, key=len, reverse=True)))
 
-    with open(file_name, 'w') as f:
-        f.writelines(output_lines)
 
+def find_marked_lines(lines, marker_pattern):
+    """
+    @returns list of (line index, set of markers on the line) for all lines with at least one marker
+    """
+    marked_lines = []
+    for index, line in enumerate(lines):
+        markers = marker_pattern.findall(line)
+        if markers:
+            marked_lines.append((index, set(markers)))
+    return marked_lines
 
-def process_api_version(source_dir, target_dir, build_name, enable_api_map):
-    if os.path.isdir(target_dir):
-        shutil.rmtree(target_dir)
-    shutil.copytree(source_dir, target_dir)
-    for file_name in search_files(target_dir):
-        process_file(file_name, enable_api_map)
 
-    returned_text = subprocess.check_output('ant -f jcbuild.xml ' + build_name, shell=True, universal_newlines=True)
-    print(returned_text)
+def toggle_line(line, enable):
+    if enable:
+        # make sure there is no '//' at the begin of the line
+        return line[2:] if line.startswith('//') else line
+    # add '//' at the beginning of line (if not already)
+    return line if line.startswith('//') else '//' + line
 
-    #os.system('ant -f jcbuild.xml ' + build_name)
 
+def apply_markers(lines, marked_lines, enable_api_map):
+    output_lines = list(lines)
+    for index, markers in marked_lines:
+        output_lines[index] = toggle_line(lines[index], all(enable_api_map[api] for api in markers))
+    return output_lines
 
-def main(argv):
-    # JC 2.2.2 API
-    process_api_version('src/', 'src222/', 'build222', {'//jc304': False, '//jc305': False})
-    # JC 3.0.4 API
-    process_api_version('src/', 'src304/', 'build304', {'//jc304': True, '//jc305': False})
-    # JC 3.0.5 API
-    process_api_version('src/', 'src305/', 'build305', {'//jc304': True, '//jc305': True})
 
+def process_lines(lines, enable_api_map):
+    return apply_markers(lines, find_marked_lines(lines, compile_markers(enable_api_map)), enable_api_map)
+
+
+def process_file(file_name, enable_api_map):
+    with open(file_name, 'r') as f:
+        lines = f.readlines()
+
+    output_lines = process_lines(lines, enable_api_map)
+    if output_lines != lines:
+        with open(file_name, 'w') as f:
+            f.writelines(output_lines)
+
+
+def load_json(file_name):
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_state(target_dir, enable_api_map):
+    # source file stats of the last run, valid only for the same enabled APIs
+    state = load_json(os.path.join(target_dir, STATE_FILE_NAME))
+    if state is None or state.get('version') != STATE_VERSION or state.get('apis') != enable_api_map:
+        return {}
+    return state['files']
+
+
+def save_json(file_name, values):
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(values, f, indent=1, sort_keys=True)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def save_state(target_dir, enable_api_map, files):
+    save_json(os.path.join(target_dir, STATE_FILE_NAME), {'version': STATE_VERSION, 'apis': enable_api_map,
+                                                         'files': files})
+
+
+def link_or_copy(source_file, target_file):
+    # unchanged file shares the content with the source, falls back to copy where hard links are not possible
+    if os.path.isfile(target_file) and os.path.samefile(source_file, target_file):
+        return  # already linked (rename of a link over the same file would do nothing)
+    temp_file = target_file + '.tmp'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    try:
+        os.link(source_file, temp_file)
+    except OSError:
+        shutil.copy2(source_file, temp_file)
+    os.replace(temp_file, target_file)
+
+
+def write_file(target_file, lines):
+    # written as a new file, so a hard link to the source is never modified
+    with open(target_file + '.tmp', 'w') as f:
+        f.writelines(lines)
+    os.replace(target_file + '.tmp', target_file)
+
+
+def update_variants(source_dir, variants):
+    """
+    Brings all variant directories up to date with source_dir. Only new or changed source files are processed, every
+    such file is read and scanned for markers once for all variants.
+    @param variants: list of (target directory, enable api map)
+    @returns number of updated and removed files for every variant
+    """
+    marker_pattern = compile_markers(API_MARKERS)
+    old_files = []
+    for target_dir, enable_api_map in variants:
+        os.makedirs(target_dir, exist_ok=True)
+        old_files.append(load_state(target_dir, enable_api_map))
+
+    files = {}
+    updated = [0] * len(variants)
+    for source_file in search_files(source_dir):
+        rel_path = os.path.relpath(source_file, source_dir)
+        stat = os.stat(source_file)
+        files[rel_path] = [stat.st_size, stat.st_mtime_ns]
+        outdated = [index for index, (target_dir, _) in enumerate(variants)
+                    if old_files[index].get(rel_path) != files[rel_path] or
+                    not os.path.isfile(os.path.join(target_dir, rel_path))]
+        if not outdated:
+            continue
+
+        with open(source_file, 'r') as f:
+            lines = f.readlines()
+        marked_lines = find_marked_lines(lines, marker_pattern)
+        for index in outdated:
+            target_dir, enable_api_map = variants[index]
+            target_file = os.path.join(target_dir, rel_path)
+            os.makedirs(os.path.dirname(target_file), exist_ok=True)
+            output_lines = apply_markers(lines, marked_lines, enable_api_map)
+            if output_lines == lines:
+                link_or_copy(source_file, target_file)
+            else:
+                write_file(target_file, output_lines)
+            updated[index] += 1
+
+    # files removed from the sources (or left from a run without state)
+    removed = [0] * len(variants)
+    for index, (target_dir, enable_api_map) in enumerate(variants):
+        for target_file in list(search_files(target_dir)):
+            rel_path = os.path.relpath(target_file, target_dir)
+            if rel_path not in (STATE_FILE_NAME, BUILD_STAMP_FILE_NAME) and rel_path not in files:
+                os.remove(target_file)
+                removed[index] += 1
+        save_state(target_dir, enable_api_map, files)
+    return list(zip(updated, removed))
+
+
+def is_build_up_to_date(target_dir, build_output):
+    # output was built from the current variant sources (by this script, not an older or checked-in file)
+    stamp = load_json(os.path.join(target_dir, BUILD_STAMP_FILE_NAME))
+    return stamp is not None and os.path.isfile(build_output) and \
+        stamp['state'] == load_json(os.path.join(target_dir, STATE_FILE_NAME)) and \
+        stamp['output mtime'] == os.stat(build_output).st_mtime_ns
+
+
+def build_api_version(build_name, target_dir, build_output):
+    """
+    Builds the variant unless its output is up to date, the build stamp is written only after a successful build
+    @raises subprocess.CalledProcessError if the build fails
+    """
+    if is_build_up_to_date(target_dir, build_output):
+        return '{} is up to date'.format(build_output)
+
+    state = load_json(os.path.join(target_dir, STATE_FILE_NAME))
+    output = subprocess.check_output('ant -f jcbuild.xml ' + build_name, shell=True, universal_newlines=True)
+    if os.path.isfile(build_output):
+        save_json(os.path.join(target_dir, BUILD_STAMP_FILE_NAME),
+                  {'state': state, 'output mtime': os.stat(build_output).st_mtime_ns})
+    return output
+
+
+def build_api_version_args(args):
+    return build_api_version(*args)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Prepares sources for all JC API versions and builds them.')
+    parser.add_argument('--force', action='store_true', help='regenerate all sources and rebuild all versions')
+    parser.add_argument('--no-build', action='store_true', help='only prepare the sources, do not run ant')
+    parser.add_argument('--jobs', type=int, default=len(API_VERSIONS), help='number of versions built in parallel')
+    args = parser.parse_args(argv[1:])
+
+    variants = [('src{}/'.format(version), get_enable_api_map(enabled_apis)) for version, enabled_apis in API_VERSIONS]
+    if args.force:
+        for target_dir, _ in variants:
+            if os.path.isdir(target_dir):
+                shutil.rmtree(target_dir)
+    changes = update_variants('src/', variants)
+    for (target_dir, _), (updated, removed) in zip(variants, changes):
+        print('{}: {} files updated, {} removed'.format(target_dir, updated, removed))
+
+    if not args.no_build:
+        tasks = [('build' + version, target_dir, '!uploader/AlgTest_{}.cap'.format(version))
+                 for (version, _), (target_dir, _) in zip(API_VERSIONS, variants)]
+        if args.jobs > 1:
+            with Pool(min(args.jobs, len(tasks))) as pool:
+                results = pool.map(build_api_version_args, tasks)
+        else:
+            results = [build_api_version_args(task) for task in tasks]
+        for result in results:
+            print(result)
 
     print('All files processed and converted')
 
 
 if __name__ == '__main__':
-    main(sys.argv)
\ No newline at end of file
+    main(sys.argv)
@@ -0,0 +1,485 @@
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import click
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pool, get_context
+
+import process_results
+
+
+def generate_ops_names(count: int, rnd: random.Random):
+    # names in the style of template lists, e.g. TYPE_AES LENGTH_AES_128 ALG_AES_BLOCK_128_CBC_NOPAD Cipher_doFinal()
+    key_types = ['AES', 'DES', 'RSA_PUBLIC', 'RSA_CRT_PRIVATE', 'EC_FP_PRIVATE', 'DSA_PRIVATE', 'HMAC', 'KOREAN_SEED']
+    modes = ['CBC_NOPAD', 'ECB_NOPAD', 'CBC_ISO9797_M2', 'PKCS1', 'SHA_256', 'SHA_512', 'CTR', 'CCM']
+    methods = ['Cipher_doFinal()', 'Cipher_update()', 'Cipher_init()', 'Signature_sign()', 'Signature_verify()',
+               'Key_setKey()', 'KeyPair_genKeyPair()']
+    names = []
+    while len(names) < count:
+        key_type = rnd.choice(key_types)
+        name = 'TYPE_{} LENGTH_{}_{} ALG_{}_{} {}'.format(key_type, key_type.split('_')[0], rnd.choice([128, 256, 1024, 2048]),
+                                                         key_type.split('_')[0], rnd.choice(modes), rnd.choice(methods))
+        names.append('{}_{}\n'.format(name, len(names)))  # keep names unique
+    return names
+
+
+def generate_measurement(rnd: random.Random, method_name: str, data_length: int, status: str = None):
+    # lines of one measurement in the same format as PerformanceTesting.perftest_measure writes
+    lines = ['', 'method name:; ' + method_name,
+             'measurement config:;appletPrepareINS;34;appletMeasureINS;41;config;00 15 00 02 ff ff ff ff ff ff 00 06 '
+             '{:02x} {:02x} ff ff ff ff 00 05 00 01'.format(data_length >> 8, data_length & 0xff)]
+    if status is not None:
+        lines.append(status if status.startswith('UNKONWN_ERROR') else status + ';')  # untranslated code has no ';'
+        return lines
+
+    baseline = [rnd.uniform(1, 2) for _ in range(5)]
+    lines.append('baseline measurements (ms):;' + ''.join('{:.2f};'.format(value) for value in baseline))
+    lines.append('baseline stats (ms):;avg:;{:.2f};min:;{:.2f};max:;{:.2f};'.format(sum(baseline) / len(baseline),
+                                                                                   min(baseline), max(baseline)))
+    num_repeat_operation = rnd.choice([1, 5, 50])
+    op_time = rnd.uniform(0.5, 50)
+    noise = rnd.choice([0.01, 0.2])
+    raw = [round(op_time * num_repeat_operation * rnd.uniform(1 - noise, 1 + noise), 2) for _ in range(5)]
+    lines.append('operation raw measurements (ms):;' + ''.join('{:.2f};'.format(value) for value in raw))
+    total_iterations = num_repeat_operation * len(raw)
+    avg_op = sum(raw) / total_iterations
+    min_op = min(raw) / num_repeat_operation
+    max_op = max(raw) / num_repeat_operation
+    check = ';CHECK' if min_op / avg_op < 0.95 or max_op / avg_op > 1.05 else ''
+    lines.append('operation stats (ms/op):;avg op:;{:.2f};min op:;{:.2f};max op:;{:.2f};{}'.format(avg_op, min_op, max_op, check))
+    lines.append('operation info:;data length;{};total iterations;{};total invocations;{};'.format(
+        data_length, total_iterations, total_iterations))
+    return lines
+
+
+def get_synthetic_ops_name(category: str, op_index: int):
+    return 'TYPE_{0}_{1} ALG_{0}_{1} {2}_op()'.format(category.replace(' ', '_'), op_index, category.replace(' ', ''))
+
+
+def generate_profile(rnd: random.Random, index: int, num_ops: int = 8, variable_data: bool = False,
+                     legacy: bool = False):
+    # synthetic performance profile (list of lines) with INFO, JCSystem and CPLC blocks and all measurement categories
+    # legacy profile contains issues repaired by the fixers - untranslated error codes, some operation names without
+    # underscores and variable data lengths missing in method names
+    lines = ['INFO: This file was generated by AlgTest utility. See http://www.fi.muni.cz/~xsvenda/jcsupport.html for more results, source codes and other details.;',
+             'Tested and provided by; insert your name please.;',
+             'Execution date/time; 2020/01/01 10:00:00',
+             'AlgTestJClient version; 1.8.0',
+             'AlgTest applet version; 1.8',
+             'Used reader; Generic Reader 0',
+             'Card ATR; 3b fe 18 00 00 80 31 fe 45 {:02x}'.format(index & 0xff),
+             'Card name; Vendor{} Card {}'.format(index % 7, index),
+             'Card provider; please insert link/description of shop where card was bought',
+             'Used protocol; T=1',
+             'High-power mode supported (relevant only to SIM cards according to ETSI 102 221); no',
+             '',
+             'JCSystem.getVersion()[Major.Minor];3.0;',
+             'JCSystem.isObjectDeletionSupported;yes;',
+             'JCSystem.MEMORY_TYPE_PERSISTENT;>32767B;',
+             '',
+             'JavaCard support version;3.0.4;',
+             '',
+             'CPLC; 9f7f2a' + ''.join('{:02x}'.format(rnd.randint(0, 255)) for _ in range(42)),
+             'CPLC.ICFabricator;{};'.format(rnd.choice(['4790', '4090', '0005', '3060', '4180', '5354'])),
+             'CPLC.ICType;{:04x}'.format(rnd.randint(0, 0xffff)),
+             'CPLC.OperatingSystemID;{}'.format(rnd.choice(['4791', '1291', '4700', 'd001', '8211', '86aa'])),
+             'CPLC.OperatingSystemReleaseDate;{}'.format(rnd.choice(['0078', '2081', '1102', '0000', '6351'])),
+             'CPLC.OperatingSystemReleaseLevel;{:04x}'.format(rnd.randint(0, 0xffff)),
+             '']
+    for category in process_results.MEASUREMENT_CATEGORIES:
+        lines += ['', category]
+        for op_index in range(num_ops):
+            method_name = get_synthetic_ops_name(category, op_index)
+            error = 'UNKONWN_ERROR-card_has_return_value;f101' if legacy else 'CryptoException_ILLEGAL_VALUE (f101)'
+            status = rnd.choices([None, 'NO_SUCH_ALGORITHM', error], [0.8, 0.15, 0.05])[0]
+            if legacy and rnd.random() < 0.1:
+                method_name = method_name.replace('_', ' ')
+            if variable_data:
+                lines += ['', '', '{} - {} - variable data - BEGIN'.format(category, method_name)]
+                for data_length in [16, 32, 64, 128, 256, 512]:
+                    name = method_name if legacy else '{};{};'.format(method_name, data_length)
+                    lines += generate_measurement(rnd, name, data_length, status)
+                lines += ['', '', '{} - {} - variable data - END'.format(category, method_name)]
+            else:
+                lines += generate_measurement(rnd, method_name, 256, status)
+        lines += ['', '', category + ' - END']
+    lines += ['', '', 'Total test time:; 1234 seconds.',
+              '', 'Total human interventions (retries with physical resets etc.):; 0',
+              '', 'Total reconnects to card:; 2']
+    return lines
+
+
+def linear_find_first(line: str, names_no_underscore: list):
+    # reference implementation - linear scan over all template names for every line
+    for i, name in enumerate(names_no_underscore):
+        if line.find(name) != -1:
+            return i
+    return -1
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--sizes", "sizes", type=str, default='10,100,500,1000,5000', show_default=True,
+              help="Comma separated numbers of operations in the template list.")
+@click.option("--lines", "num_lines", type=int, default=2000, show_default=True, help="Number of measured lines.")
+def underscores(sizes: str, num_lines: int):
+    """Per-line cost of fix_missing_underscores matching as the template list grows."""
+    rnd = random.Random(42)
+    print('{:>8} {:>14} {:>14} {:>10}'.format('names', 'linear (us)', 'indexed (us)', 'build (ms)'))
+    for size in [int(size) for size in sizes.split(',')]:
+        names = generate_ops_names(size, rnd)
+        names_no_underscore = [name.replace('_', ' ').strip() for name in names]
+        # mix of correct lines (no match at all) and lines with missing underscores (match somewhere in the list)
+        lines = []
+        for _ in range(num_lines):
+            name = rnd.choice(names).strip()
+            lines.append('method name:; ' + (name.replace('_', ' ') if rnd.random() < 0.2 else name) + '\n')
+
+        build_time = timeit.timeit(lambda: process_results.MultiPatternMatcher(names_no_underscore), number=1)
+        matcher = process_results.MultiPatternMatcher(names_no_underscore)
+        for line in lines:
+            assert matcher.find_first(line) == linear_find_first(line, names_no_underscore)
+
+        linear_time = timeit.timeit(lambda: [linear_find_first(line, names_no_underscore) for line in lines], number=1)
+        indexed_time = timeit.timeit(lambda: [matcher.find_first(line) for line in lines], number=1)
+        print('{:>8} {:>14.2f} {:>14.2f} {:>10.2f}'.format(size, linear_time / num_lines * 1e6,
+                                                           indexed_time / num_lines * 1e6, build_time * 1e3))
+
+
+def hold_profiles_in_memory(args: tuple):
+    # runs in a fresh process, returns peak RSS (kB) after holding all parsed profiles in memory
+    # profiles are parsed into Measurement records, compact=False expands them back into item dicts
+    num_profiles, num_ops, compact = args
+    import resource  # not available on Windows
+
+    rnd = random.Random(1)
+    profiles = []
+    for index in range(num_profiles):
+        values = process_results.parse_profile(generate_profile(rnd, index, num_ops), 'profile{}'.format(index))
+        if not compact:
+            values['Measurements'] = {category: {method_name: item.to_item() for method_name, item in items.items()}
+                                      for category, items in values['Measurements'].items()}
+        profiles.append(values)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss  # ru_maxrss is in bytes on macOS
+
+
+@cli.command()
+@click.option("--profiles", "num_profiles", type=int, default=5000, show_default=True, help="Number of synthetic profiles.")
+@click.option("--ops", "num_ops", type=int, default=8, show_default=True, help="Number of operations per category.")
+def memory(num_profiles: int, num_ops: int):
+    """Peak RSS of parsed profiles held in memory as item dicts vs. Measurement records."""
+    results = {}
+    for name, args in [('empty', (0, num_ops, False)), ('dict', (num_profiles, num_ops, False)),
+                       ('Measurement', (num_profiles, num_ops, True))]:
+        with Pool(1, maxtasksperchild=1) as pool:  # fresh process for each measurement
+            results[name] = pool.apply(hold_profiles_in_memory, (args,))
+
+    print('{} profiles, {} measurements each'.format(num_profiles, num_ops * len(process_results.MEASUREMENT_CATEGORIES)))
+    for name in ['dict', 'Measurement']:
+        print('{:>12}: peak RSS {:8.1f} MB ({:8.1f} MB above empty process)'.format(
+            name, results[name] / 1024, (results[name] - results['empty']) / 1024))
+
+
+def write_corpus(directory: str, num_files: int, num_ops: int = 8, variable_fraction: float = 0.3,
+                 legacy_fraction: float = 0.2, seed: int = 1):
+    # synthetic results directory as processed by process_results and cplc - profiles and template lists
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for index in range(num_files):
+        variable_data = rnd.random() < variable_fraction
+        legacy = rnd.random() < legacy_fraction
+        file_name = 'card{:05d}_PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}.csv'.format(
+            index, 'DATADEPEND' if variable_data else 'DATAFIXED')
+        with open(os.path.join(directory, file_name), 'w') as f:
+            f.writelines(line + '\n' for line in generate_profile(rnd, index, num_ops, variable_data, legacy))
+
+    ops_names = [get_synthetic_ops_name(category, op_index) + '\n'
+                 for category in process_results.MEASUREMENT_CATEGORIES for op_index in range(num_ops)]
+    for test_type in ['DATAFIXED', 'DATADEPEND']:
+        template_file_name = 'template____PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}__already_measured.list'.format(test_type)
+        with open(os.path.join(directory, template_file_name), 'w') as f:
+            f.writelines(ops_names)
+
+
+def get_files_size(directory: str, extension: str):
+    files = process_results.get_files_to_process(directory, extension)
+    return len(files), sum(os.path.getsize(filename) for filename in files)
+
+
+def run_pipeline_stage(stage: str, directory: str, jobs: int):
+    import cplc
+
+    if stage == 'fix_error_codes':
+        process_results.fix_error_codes(directory, jobs)
+    elif stage == 'fix_missing_underscores':
+        process_results.fix_missing_underscores(directory, process_results.create_sorted_already_measured_list(directory),
+                                                jobs)
+    elif stage == 'fix_missing_variable_data_lengths':
+        process_results.fix_missing_variable_data_lengths(directory, jobs)
+    elif stage == 'convert_to_json':
+        process_results.convert_to_json(directory, jobs)
+    elif stage == 'repair_and_convert_to_json':
+        repairs = [process_results.repair_error_codes,
+                   process_results.get_missing_underscores_repair(
+                       process_results.create_sorted_already_measured_list(directory)),
+                   process_results.repair_missing_variable_data_lengths]
+        process_results.repair_and_convert_to_json(directory, repairs, jobs)
+    elif stage == 'prepare_missing_measurements':
+        process_results.prepare_missing_measurements(directory, jobs)
+    elif stage == 'build_operation_index':
+        process_results.build_operation_index(directory, jobs)
+    elif stage == 'compute_stats':
+        process_results.compute_stats(directory, jobs)
+    elif stage == 'cplc':
+        cplc.process_jcalgtest_files(directory, {}, [])
+
+
+def measure_pipeline_stage(args: tuple):
+    # runs in a fresh process, returns wall time (s) and peak RSS (kB) of the stage including worker processes
+    stage, directory, jobs, output_dir = args
+    import resource  # not available on Windows
+
+    os.chdir(output_dir)  # compute_stats writes its results into the working directory
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())  # also output of worker processes of the stage
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        run_pipeline_stage(stage, directory, jobs)
+        elapsed = time.perf_counter() - start
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return elapsed, peak_rss // 1024 if sys.platform == 'darwin' else peak_rss  # ru_maxrss is in bytes on macOS
+
+
+# stage, corpus copy the stage runs on, extension of the stage inputs
+PIPELINE_STAGES = [
+    ('fix_error_codes', 'separate', '.csv'),
+    ('fix_missing_underscores', 'separate', '.csv'),
+    ('fix_missing_variable_data_lengths', 'separate', '.csv'),
+    ('convert_to_json', 'separate', '.csv'),
+    ('repair_and_convert_to_json', 'pipeline', '.csv'),  # fused repairs and conversion as run by process_results
+    ('prepare_missing_measurements', 'pipeline', '.json'),
+    ('build_operation_index', 'pipeline', '.json'),
+    ('compute_stats', 'pipeline', '.json'),
+    ('cplc', 'corpus', '.csv'),
+]
+
+
+@cli.command()
+@click.option("--files", "num_files", type=click.IntRange(min=1), default=200, show_default=True,
+              help="Number of synthetic profiles.")
+@click.option("--ops", "num_ops", type=click.IntRange(min=1), default=8, show_default=True,
+              help="Number of operations per category.")
+@click.option("--variable-fraction", "variable_fraction", type=click.FloatRange(0, 1), default=0.3, show_default=True,
+              help="Fraction of profiles with variable data lengths.")
+@click.option("--legacy-fraction", "legacy_fraction", type=click.FloatRange(0, 1), default=0.2, show_default=True,
+              help="Fraction of profiles with issues repaired by the fixers.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used by the stages.")
+@click.option("--work-dir", "work_dir", type=str, help="Directory for the corpus, temporary directory if not given.")
+@click.option("--baseline", "baseline_file", type=str, default='benchmark_baseline.json', show_default=True,
+              help="Stored results to compare with.")
+@click.option("--save-baseline", "save_baseline", is_flag=True, default=False,
+              help="Store the results as the new baseline.")
+@click.option("--tolerance", "tolerance", type=float, default=0.25, show_default=True,
+              help="Fail if a stage is slower than the baseline by more than this fraction.")
+def pipeline(num_files: int, num_ops: int, variable_fraction: float, legacy_fraction: float, jobs: int, work_dir: str,
+             baseline_file: str, save_baseline: bool, tolerance: float):
+    """Throughput and peak memory of every processing stage on a synthetic corpus."""
+    parameters = {'files': num_files, 'ops': num_ops, 'variable fraction': variable_fraction,
+                  'legacy fraction': legacy_fraction, 'jobs': jobs}
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix='jcalgtest_benchmark_')
+    try:
+        corpus_dir = os.path.join(work_dir, 'corpus', '')
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+        write_corpus(corpus_dir, num_files, num_ops, variable_fraction, legacy_fraction)
+        for copy in ['separate', 'pipeline']:
+            shutil.rmtree(os.path.join(work_dir, copy), ignore_errors=True)
+            shutil.copytree(corpus_dir, os.path.join(work_dir, copy))
+        output_dir = os.path.join(work_dir, 'output')
+        os.makedirs(output_dir, exist_ok=True)
+
+        results = {}
+        for stage, copy, extension in PIPELINE_STAGES:
+            directory = os.path.join(work_dir, copy, '')
+            num_stage_files, size = get_files_size(directory, extension)
+            # fresh process without memory of the previous stages, executor workers (unlike Pool workers) may start
+            # worker processes of the stage
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+                elapsed, peak_rss = executor.submit(measure_pipeline_stage, (stage, directory, jobs, output_dir)).result()
+            results[stage] = {'seconds': elapsed, 'files/s': num_stage_files / elapsed,
+                              'MB/s': size / elapsed / 1024 / 1024, 'peak RSS MB': peak_rss / 1024}
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    baseline = None
+    if os.path.isfile(baseline_file) and not save_baseline:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != parameters:
+            print('WARNING: baseline was measured with different parameters {}'.format(baseline['parameters']))
+
+    print('{} profiles, {} operations per category, {} jobs'.format(num_files, num_ops, jobs))
+    print('{:>34} {:>9} {:>9} {:>8} {:>12} {:>12}'.format('stage', 'seconds', 'files/s', 'MB/s', 'peak RSS MB',
+                                                          'vs baseline'))
+    regressions = []
+    for stage, result in results.items():
+        change = ''
+        if baseline is not None and stage in baseline['stages']:
+            ratio = result['files/s'] / baseline['stages'][stage]['files/s']
+            change = '{:+.1f} %'.format((ratio - 1) * 100)
+            if ratio < 1 - tolerance:
+                regressions.append(stage)
+        print('{:>34} {:>9.3f} {:>9.1f} {:>8.2f} {:>12.1f} {:>12}'.format(stage, result['seconds'], result['files/s'],
+                                                                        result['MB/s'], result['peak RSS MB'], change))
+
+    if save_baseline:
+        with open(baseline_file, 'w') as f:
+            json.dump({'parameters': parameters, 'stages': results}, f, indent=2)
+    if regressions:
+        raise click.ClickException('slower than baseline: ' + ', '.join(regressions))
+
+
+def linear_find(value: str, entries: list, default):
+    # reference implementation - chain of find() tests in the table order, as the lookups were originally written
+    for key, result in entries:
+        if value.find(key) != -1:
+            return result
+    return default
+
+
+def linear_find_nested(value: str, nested_value: str, entries: list):
+    for key, nested_entries in entries:
+        if value.find(key) != -1:
+            for nested_key, result in nested_entries:
+                if nested_value.find(nested_key) != -1:
+                    return result
+    return ''
+
+
+def linear_cplc_lookups(card: dict):
+    import cplc_decode
+
+    fab, ictype, os_id, os_date = card['ICFabricator'], card['ICType'], card['OperatingSystemID'], card['OperatingSystemReleaseDate']
+    return (linear_find(fab, cplc_decode.IC_FABRICATORS, 'unknown (' + fab + ')'),
+            linear_find(card['CardName'], cplc_decode.CARD_VENDORS, ('unknown vendor', None)),
+            linear_find(os_id.lower(), cplc_decode.OPERATING_SYSTEMS, ''),
+            linear_find_nested(os_id, os_date, cplc_decode.OPERATING_SYSTEM_RELEASES),
+            linear_find_nested(fab.lower(), ictype.lower(), cplc_decode.IC_TYPES))
+
+
+def cplc_lookups(card: dict):
+    import cplc_decode
+
+    fab, ictype, os_id, os_date = card['ICFabricator'], card['ICType'], card['OperatingSystemID'], card['OperatingSystemReleaseDate']
+    return (cplc_decode.get_fab_name(fab), cplc_decode.get_vendor_name(card['CardName']), cplc_decode.get_os_name(os_id),
+            cplc_decode.get_osiddate_name(os_id, os_date), cplc_decode.get_ictype_name(fab, ictype))
+
+
+def clear_cplc_caches():
+    import cplc_decode
+
+    for lookup in [cplc_decode.get_fab_name, cplc_decode.get_vendor_name, cplc_decode.get_os_name,
+                   cplc_decode.get_osiddate_name, cplc_decode.get_ictype_name]:
+        lookup.cache_clear()
+
+
+@cli.command("cplc")
+@click.argument("directory", type=str, default='../Profiles/results/')
+@click.option("--repeat", "repeat", type=int, default=7, show_default=True,
+              help="Lookups of all cards are repeated (as when rendering graphs for all vendors).")
+def cplc_benchmark(directory: str, repeat: int):
+    """Cost of CPLC decoding lookups (fabricator, vendor, OS, OS date, IC type) for all cards in DIRECTORY."""
+    import cplc
+
+    files_with_cplc = {}
+    files_without_cplc = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        cplc.process_jcalgtest_files(directory, files_with_cplc, files_without_cplc)
+    cards = [card for card in files_with_cplc.values()
+             if all(item in card for item in ['ICFabricator', 'ICType', 'OperatingSystemID', 'OperatingSystemReleaseDate'])]
+    if not cards:
+        raise click.ClickException('No cards with CPLC found in ' + directory)
+
+    clear_cplc_caches()
+    for card in cards:
+        assert cplc_lookups(card) == linear_cplc_lookups(card), card['CardName']
+
+    num_lookups = len(cards) * repeat
+    linear_time = timeit.timeit(lambda: [linear_cplc_lookups(card) for card in cards], number=repeat)
+
+    def table_lookups():
+        clear_cplc_caches()
+        return [cplc_lookups(card) for card in cards]
+    table_time = timeit.timeit(table_lookups, number=repeat)
+    memoized_time = timeit.timeit(lambda: [cplc_lookups(card) for card in cards], number=repeat)
+
+    print('{} cards with CPLC, {} repetitions'.format(len(cards), repeat))
+    print('{:>10} {:>16}'.format('lookups', 'per card (us)'))
+    for name, time in [('linear', linear_time), ('table', table_time), ('memoized', memoized_time)]:
+        print('{:>10} {:>16.2f}'.format(name, time / num_lookups * 1e6))
+
+
+def measure_import_time(module: str):
+    # cumulative import time (us) of module and all modules imported by it, measured in a fresh interpreter
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    imports = []  # (nesting level, name, cumulative time) in the order of completed imports
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative)))
+
+    # modules imported by module are listed right before it with deeper nesting
+    index = max(index for index, (_, name, _) in enumerate(imports) if name == module)
+    imported = {}
+    for level, name, cumulative in reversed(imports[:index]):
+        if level <= imports[index][0]:
+            break
+        imported[name] = cumulative
+    return imports[index][2], imported
+
+
+@cli.command()
+@click.option("--module", "module", type=str, default='cplc_decode', show_default=True, help="Module to import.")
+@click.option("--repeat", "repeat", type=int, default=5, show_default=True, help="Number of measurements (best is used).")
+@click.option("--max-ms", "max_ms", type=float, default=30.0, show_default=True,
+              help="Fail if the import takes longer.")
+@click.option("--forbidden", "forbidden", type=str, default='graphviz,matplotlib,numpy', show_default=True,
+              help="Comma separated modules which must not be imported.")
+def imports(module: str, repeat: int, max_ms: float, forbidden: str):
+    """Import time of MODULE (python -X importtime), guards the decoding helpers against heavy imports."""
+    measurements = [measure_import_time(module) for _ in range(repeat)]
+    best_time, imported = min(measurements, key=lambda measurement: measurement[0])
+    print('{}: {:.2f} ms (best of {})'.format(module, best_time / 1000, repeat))
+    slowest = sorted(((time, name) for name, time in imported.items()), reverse=True)[:5]
+    for time, name in slowest:
+        print('  {:>10.2f} ms {}'.format(time / 1000, name))
+
+    heavy = [name for name in forbidden.split(',') if name and name in imported]
+    if heavy:
+        raise click.ClickException('{} imports {}'.format(module, ', '.join(heavy)))
+    if best_time / 1000 > max_ms:
+        raise click.ClickException('import of {} takes {:.2f} ms, limit is {:.2f} ms'.format(module, best_time / 1000, max_ms))
+
+
+if __name__ == "__main__":
+    cli()
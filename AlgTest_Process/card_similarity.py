@@ -0,0 +1,138 @@
+# Similarity of cards based on their performance profiles (Python counterpart of SIMILARITY mode of AlgTestProcess).
+# Every card is described by a vector over all measured operations (method name and data length):
+#   support status - +1 supported (OK), -1 not supported (NO_SUCH_ALGORITHM, FUNC_NOT_SUPPORTED), 0 unknown (error,
+#                    not measured)
+#   log avg op time - natural logarithm of average operation time, only for operations measured OK
+# Distance of two cards is the fraction of differently supported operations (out of operations with known support on
+# both cards) plus root mean square difference of log avg op times (over operations measured on both cards).
+# Distances are computed as matrix products for blocks of cards, so memory stays linear in the number of cards.
+import json
+import click
+import process_results
+
+DEFAULT_CHUNK_SIZE = 512
+
+
+def build_feature_matrix(table: dict):
+    """
+    @param table: columnar measurement table (see process_results.build_measurement_table)
+    @returns card names, operation names, support status matrix (int8) and log avg op time matrix (NaN if not
+             measured), both cards x operations. Profiles with the same card name are merged, first measurement wins.
+    """
+    import numpy as np
+
+    data_length = np.char.mod(';%d', table['data_length'])
+    operation_keys = np.where(table['data_length'] >= 0, np.char.add(table['method'], data_length), table['method'])
+    cards, card_index = np.unique(table['card'], return_inverse=True)
+    operations, operation_index = np.unique(operation_keys, return_inverse=True)
+
+    # first measurement of every (card, operation)
+    _, first = np.unique(card_index * len(operations) + operation_index, return_index=True)
+    card_index = card_index[first]
+    operation_index = operation_index[first]
+    status = table['status'][first]
+    avg_op = table['avg_op'][first]
+
+    supported = status == 'OK'
+    not_supported = (status == 'NO_SUCH_ALGORITHM') | (np.char.find(status, 'FUNC_NOT_SUPPORTED') != -1)
+    support = np.zeros((len(cards), len(operations)), dtype=np.int8)
+    support[card_index, operation_index] = np.where(supported, 1, np.where(not_supported, -1, 0))
+
+    log_time = np.full((len(cards), len(operations)), np.nan)
+    measured = supported & np.isfinite(avg_op) & (avg_op > 0)
+    log_time[card_index[measured], operation_index[measured]] = np.log(avg_op[measured])
+
+    return cards.tolist(), operations.tolist(), support, log_time
+
+
+def prepare_features(support, log_time):
+    """
+    @returns dense float matrices used by compute_distances: known support, support, measured, times, squared times
+    """
+    import numpy as np
+
+    measured = np.isfinite(log_time).astype(np.float64)
+    # differences do not change by shifting all times of an operation, centered values lower the rounding errors
+    with np.errstate(invalid='ignore'):
+        operation_means = np.nan_to_num(np.nansum(log_time, axis=0) / measured.sum(axis=0))
+    times = np.nan_to_num(log_time - operation_means)
+    return (support != 0).astype(np.float64), support.astype(np.float64), measured, times, times ** 2
+
+
+def compute_distances(features: tuple, rows: slice):
+    """
+    Distances of cards in rows to all cards
+    @param features: matrices as returned by prepare_features
+    @returns distance, support distance, time distance and number of operations measured on both cards, all as
+             matrices rows x cards. Cards without any operation measured on both cards have infinite distance.
+    """
+    import numpy as np
+
+    known, support, measured, times, times_squared = features
+    known_common = known[rows] @ known.T
+    mismatches = (known_common - support[rows] @ support.T) / 2  # agreeing operation adds 1, differing -1
+    common = measured[rows] @ measured.T
+    squared_diffs = times_squared[rows] @ measured.T + measured[rows] @ times_squared.T - 2 * (times[rows] @ times.T)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        support_distance = np.where(known_common > 0, mismatches / known_common, 1.0)
+        time_distance = np.where(common > 0, np.sqrt(np.maximum(squared_diffs, 0) / common), np.inf)
+    return support_distance + time_distance, support_distance, time_distance, common.astype(np.int64)
+
+
+def find_similar_cards(cards: list, support, log_time, top_k: int = 5, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    @returns hash map of card name -> list of top_k most similar other cards (nearest first) with their distances
+    """
+    import numpy as np
+
+    similar = {}
+    features = prepare_features(support, log_time)
+    k = min(top_k, len(cards) - 1)
+    for start in range(0, len(cards), chunk_size):
+        rows = slice(start, min(start + chunk_size, len(cards)))
+        distance, support_distance, time_distance, common = compute_distances(features, rows)
+        distance[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = np.inf  # card itself
+
+        if k <= 0:
+            nearest = np.zeros((rows.stop - rows.start, 0), dtype=np.int64)
+        else:
+            nearest = np.argpartition(distance, k - 1, axis=1)[:, :k]
+            nearest = np.take_along_axis(nearest, np.argsort(np.take_along_axis(distance, nearest, axis=1), axis=1,
+                                                             kind='stable'), axis=1)
+        for row, card in enumerate(cards[rows]):
+            similar[card] = [{'card': cards[other],
+                              'distance': float(distance[row, other]),
+                              'support distance': float(support_distance[row, other]),
+                              'time distance': float(time_distance[row, other]),
+                              'common operations': int(common[row, other])}
+                             for other in nearest[row] if np.isfinite(distance[row, other])]
+    return similar
+
+
+@click.command()
+@click.argument("source", required=True, type=click.Path(exists=True))
+@click.option("--output", "output_file", type=str, default='similarity.json', show_default=True,
+              help="Output JSON with similar cards for every card.")
+@click.option("--top-k", "top_k", type=click.IntRange(min=1), default=5, show_default=True,
+              help="Number of the most similar cards reported for every card.")
+@click.option("--chunk-size", "chunk_size", type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="Number of cards compared to all others at once.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used to read the profiles.")
+def main(source: str, output_file: str, top_k: int, chunk_size: int, jobs: int):
+    """Top-k similar cards for every card, SOURCE is a directory with profile JSONs or a columnar table (.npz)."""
+    if source.endswith('.npz'):
+        table = process_results.load_measurement_table(source)
+    else:
+        table = process_results.build_measurement_table(source, jobs)
+
+    cards, operations, support, log_time = build_feature_matrix(table)
+    print('{} cards, {} operations'.format(len(cards), len(operations)))
+    similar = find_similar_cards(cards, support, log_time, top_k, chunk_size)
+    with open(output_file, 'w') as f:
+        json.dump(similar, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
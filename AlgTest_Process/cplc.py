@@ -1,14 +1,25 @@
 #%%
+import click
 import random
-import graphviz, re, time, os, sys, glob, json, ntpath
-import matplotlib.cbook as cbook
-from pathlib import Path
-from graphviz import Digraph
-
-# CPLC info collected from:
-# 1. own analysis
-# 2. https://www.javatips.net/api/bankomatinfos-master/src/at/zweng/bankomatinfos/iso7816emv/CPLC.java
-# 3. NIST FIPS140, Common Criteria certificates
+import os, json, ntpath
+from multiprocessing import Pool
+import cplc_decode
+import cplc_stats
+from profile_reader import hash_file
+# graphviz is imported only when the graphs are created or rendered
+
+# CPLC info decoding tables (and their sources) are in cplc_decode.py
+
+# fields printed as CPLC.<field> lines by AlgTestJClient (CardMngr.PrintCPLCInfo)
+CPLC_FIELDS = ['ICFabricator', 'ICType', 'OperatingSystemID', 'OperatingSystemReleaseDate',
+               'OperatingSystemReleaseLevel', 'ICFabricationDate', 'ICSerialNumber', 'ICBatchIdentifier',
+               'ICModuleFabricator', 'ICModulePackagingDate', 'ICCManufacturer', 'ICEmbeddingDate', 'ICPrePersonalizer',
+               'ICPrePersonalizationEquipmentDate', 'ICPrePersonalizationEquipmentID', 'ICPersonalizer',
+               'ICPersonalizationDate', 'ICPersonalizationEquipmentID']
+CPLC_CACHE_FILE_NAME = 'cplc_cache.json'
+DEFAULT_RESULTS_DIR = os.path.join('..', 'Profiles', 'results')
+DEFAULT_OUTPUT_DIR = 'test-output'
+CPLC_CACHE_VERSION = 3  # increase when read_cplc_values changes, older cache is then dropped
 
 def search_files(folder):    
     for root, dirs, files in os.walk(folder):
@@ -20,189 +31,6 @@ def path_leaf(path):
     return tail or ntpath.basename(head)
 
 
-def get_fab_name(icfab):
-    """
-    Returns human-readable name of fabricator based on provided ICFabricator id
-    @param icfab: string realization of 2 bytes ICFabricator (in hexadecimal, e.g., '4090')
-    @returns human-readable fabricator string
-    """
-    if icfab.find('0003') != -1: return 'Renesas' # https://www.cryptsoft.com/fips140/vendors/140sp485.pdf
-    if icfab.find('0005') != -1: return 'Infineon' # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
-    if icfab.find('008c') != -1: return 'Tongxin' # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
-    if icfab.find('2050') != -1: return 'Philips' # https://www.commoncriteriaportal.org/files/epfiles/ANSSI-CC-2007-02-M02fr.pdf, pp. 2
-    if icfab.find('3060') != -1: return 'Renesas'
-    if icfab.find('4070') != -1: return 'NXP' # https://csrc.nist.rip/groups/STM/cmvp/documents/140-1/140sp/140sp963.pdf, pp. 4
-    if icfab.find('4090') != -1: return 'Infineon'
-    if icfab.find('4180') != -1: return 'Atmel'
-    if icfab.find('4250') != -1: return 'Samsung'
-    if icfab.find('4790') != -1: return 'NXP'
-    if icfab.find('4830') != -1: return 'Infineon'
-    if icfab.find('5354') != -1: return 'STMicro' # Feitian D11CR https://docs.google.com/spreadsheets/d/10s3dA_qGvWMajv8RhCWa00x-h-1Dx6SdF9rEKN-1RIg/edit#gid=952816161
-    if icfab.find('0004') != -1: return 'Philips' # Philips P8WE5032, https://www.commoncriteriaportal.org/files/epfiles/2000_06.pdf
-
-    #if icfab == '4220': return '?? Palmera V3'
-
-    return 'unknown (' + icfab + ')'
-
-
-def get_vendor_name(cardname):
-    """
-    Returns human-readable name of card vendor based on provided card name
-    @param cardname: string with card name, e.g., 'NXP JCOP J2A080 80K'
-    @returns human-readable vendor string
-    """
-    if cardname.find('Feitian') != -1: return 'Feitian', None
-    if cardname.find('FeiTian') != -1: return 'Feitian', None
-    if cardname.find('G+D') != -1: return 'G&D', None
-    if cardname.find('Oberthur') != -1: return 'Oberthur', 'Idemia'
-    if cardname.find('Idemia') != -1: return 'Idemia', None
-    if cardname.find('Gemalto') != -1: return 'Gemalto', None
-    if cardname.find('Gemplus') != -1: return 'Gemplus', 'Gemalto'
-    if cardname.find('Athena') != -1: return 'Athena', 'NXP'
-    if cardname.find('Axalto') != -1: return 'Axalto', 'Gemalto'
-    if cardname.find('Cyberflex') != -1: return 'Schlumberger', 'Gemalto'
-    if cardname.find('Taisys') != -1: return 'Taisys', None
-    if cardname.find('Athena') != -1: return 'Athena', 'NXP'
-    if cardname.find('Fidesmo') != -1: return 'Fidesmo', None
-    if cardname.find('Infineon') != -1: return 'Infineon', None
-    if cardname.find('NXP') != -1: return 'NXP', None
-    if cardname.find('PIVKey') != -1: return 'Taglio', None
-    if cardname.find('Tongxin') != -1: return 'Tongxin', None
-
-    return 'unknown vendor', None
-
-
-def get_os_name(os_id):
-    """
-    Returns human-readable name of operating system based on provided OperatingSystemID
-    @param os_id: string realization of 2 bytes OperatingSystemID (in hexadecimal, e.g., '1291')
-    @returns human-readable OS string
-    """
-    os_id = os_id.lower()
-    if os_id.find('0000') != -1: return '(not provided)'
-    if os_id.find('ffff') != -1: return '(not provided)'
-    if os_id.find('0011') != -1: return 'Schlumberger'
-    if os_id.find('0027') != -1: return 'STM027'
-    if os_id.find('0230') != -1: return 'G230'
-    if os_id.find('1291') != -1: return 'Gemplus/Gemalto TOP'
-    if os_id.find('1671') != -1: return 'G&D Sm@rtCafe'
-    if os_id.find('1981') != -1: return 'Schlumberger'
-    if os_id.find('2041') != -1: return 'Axalto'
-    if os_id.find('3231') != -1: return 'Gemplus TOP'
-    if os_id.find('4041') != -1: return 'Oberthur OCS'
-    if os_id.find('4051') != -1: return 'IBM JCOP2'
-    if os_id.find('4070') != -1: return 'JCOP ?'
-    if os_id.find('4091') != -1: return 'Trusted Logic jTOP'
-    if os_id.find('4700') != -1: return 'NXP JCOP3&4'
-    if os_id.find('4791') != -1: return 'NXP JCOP2'
-    if os_id.find('4A5A') != -1: return 'JCOP ?'
-    if os_id.find('544c') != -1: return 'Trusted Logic jTOP'
-    if os_id.find('8211') != -1: return 'Athena SCS OS'
-    if os_id.find('8231') != -1: return 'Oberthur OCS'
-    if os_id.find('86aa') != -1: return 'JavaCOS'
-    if os_id.find('a006') != -1: return 'G&D Sm@rtCafe'
-    if os_id.find('d000') != -1: return 'Gemalto OS'
-    if os_id.find('d001') != -1: return 'G&D Sm@rtCafe 7'
-    if os_id.find('010b') != -1: return 'FT-JCOS'
-    if os_id.find('25c3') != -1: return 'FT-JCOS'
-    if os_id.find('4654') != -1: return 'FT-JCOS'
-    if os_id.find('4090') != -1: return 'Secora ID S'
-    return ''
-
-
-def get_osiddate_name(os_id, os_date):
-    """
-    Returns human-readable name of operating system based on provided OperatingSystemID and OperatingSystemReleaseDate
-    @param os_id: string realization of 2 bytes OperatingSystemID (in hexadecimal, e.g., '1291')
-    @param os_date: string realization of 2 bytes OperatingSystemReleaseDate (in hexadecimal, e.g., '6138')
-    @returns human-readable os string with release date (if known)
-    """
-    if os_id.find('4051') != -1: 
-        if os_date.find('5158') != -1:return 'JCOP 2.2 (2005)'
-        if os_date.find('6138') != -1:return 'JCOP 2.2.1 (2006)'
-        if os_date.find('6345') != -1:return 'JCOP 2.3.1 (2006)'
-        if os_date.find('7095') != -1:return 'JCOP 2.3.1R? (2007)'
-    if os_id.find('4700') != -1:
-        if os_date.find('0000') != -1:return 'JCOP4 (2018)'
-        if os_date.find('e4d8') != -1:return 'JCOP3 (2015)'
-    if os_id.find('4791') != -1: 
-        if os_date.find('7351') != -1:return 'JCOP 2.3.2 (2007)'
-        if os_date.find('8102') != -1:return 'JCOP 2.?.? (2008)'
-        if os_date.find('0078') != -1:return 'JCOP 2.4.1 (2010)'
-        if os_date.find('2081') != -1:return 'JCOP 2.4.2R2 (2012)'
-        if os_date.find('2348') != -1:return 'JCOP 2.4.2R3 (2012)'
-    if os_id.find('1671') != -1:
-        if os_date.find('7354') != -1: return 'G&D Sm@rtCafe (2007)'
-        if os_date.find('8197') != -1: return 'G&D Sm@rtCafe (2008)'
-        if os_date.find('1146') != -1: return 'G&D Sm@rtCafe (2011)'
-    if os_id.find('d001') != -1:
-        if os_date.find('4021') != -1: return 'G&D Sm@rtCafe (2014)'
-        if os_date.find('4212') != -1: return 'G&D Sm@rtCafe (2014)'
-    if os_id.find('a006') != -1:
-        if os_date.find('3311') != -1: return 'G&D Sm@rtCafe (2003)'
-    if os_id.find('8211') != -1:
-        if os_date.find('0352') != -1:return 'Athena (2010)'
-        if os_date.find('6351') != -1:return 'Athena/JCOP3 (2016)'
-    if os_id.find('544c') != -1:
-        if os_date.find('2151') != -1: return 'Trusted Logic jTOP (2012)'
-    if os_id.find('4091') != -1:
-        if os_date.find('2013') != -1: return 'Trusted Logic jTOP (2012)'
-        if os_date.find('3234') != -1: return 'Trusted Logic jTOP (2003)'
-    if os_id.find('86aa') != -1:
-        if os_date.find('6028') != -1: return 'JavaCOS (2016)'
-        if os_date.find('6083') != -1: return 'JavaCOS (2016)'
-        if os_date.find('6153') != -1: return 'JavaCOS (2016)'
-        if os_date.find('6188') != -1: return 'JavaCOS (2016)'
-        if os_date.find('7311') != -1: return 'JavaCOS (2017)'
-    if os_id.find('1291') != -1:
-        if os_date.find('3349') != -1: return 'Gemplus TOP (2003)'
-        if os_date.find('0356') != -1: return 'Gemplus TOP (2000)'
-        if os_date.find('1102') != -1: return 'Gemalto TOP (2011)'
-        if os_date.find('6095') != -1: return 'Gemplus TOP (2006)'
-        if os_date.find('5181') != -1: return 'Gemplus TOP (2005)'
-        if os_date.find('4214') != -1: return 'Gemplus TOP (2004)'
-    if os_id.find('3231') != -1:
-        if os_date.find('0300') != -1: return 'Gemplus TOP (2000)'
-    if os_id.find('8231') != -1:
-        if os_date.find('5343') != -1: return 'Oberthur OCS (2015)'
-        if os_date.find('8150') != -1: return 'Oberthur OCS (2008)'
-    if os_id.find('4041') != -1:
-        if os_date.find('4091') != -1: return 'Oberthur OCS (2004)'
-        if os_date.find('5273') != -1: return 'Oberthur OCS (2005)'
-    if os_id.find('0011') != -1:
-        if os_date.find('5273') != -1: return 'Schlumberger (2000)'
-    if os_id.find('2041') != -1:
-        if os_date.find('5314') != -1: return 'Axalto (2005)'
-    if os_id.find('1981') != -1:
-        if os_date.find('3052') != -1: return 'Schlumberger (2003)'
-    if os_id.find('0000') != -1:
-        if os_date.find('9021') != -1: return 'TongXin JCOS (2019)' # THD-89 uses an in-house JCOS that the chip manufacturer TongXin Microelectronics (TMC) also wrote in-house. The OS ID is not set.
-
-    return ''
-
-
-def get_ictype_name(icfab, ictype):
-    icfab = icfab.lower()
-    ictype = ictype.lower()
-    if icfab.find('0003') != -1:
-        if ictype.find('0307') != -1: return 'Renesas AE46C1'   # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
-    if icfab.find('0004') != -1:
-        if ictype.find('0015') != -1: return 'Philips P8WE5032'  # Philips P8WE5032, https://www.commoncriteriaportal.org/files/epfiles/2000_06.pdf
-    if icfab.find('0005') != -1:
-        if ictype.find('0045') != -1: return 'Infineon M7892 B11'   # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
-    if icfab.find('0005') != -1:
-        if ictype.find('0045') != -1: return 'Infineon M7892 B11'   # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
-    if icfab.find('008c') != -1:
-        if ictype.find('0089') != -1: return 'Tongxin THD89'   # https://www.commoncriteriaportal.org/files/epfiles/2017-28%20INF-2492.pdf
-    if icfab.find('4070') != -1:
-        if ictype.find('5072') != -1: return 'NXP P5CD144'   # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2774.pdf
-    if icfab.find('5354') != -1:
-        if ictype.find('0033') != -1: return 'STM ST31 ARM'  # Feitian D11CR https://docs.google.com/spreadsheets/d/10s3dA_qGvWMajv8RhCWa00x-h-1Dx6SdF9rEKN-1RIg/edit#gid=952816161
-    if icfab.find('4180') != -1:
-        if ictype.find('0106') != -1: return 'Atmel AT90SC25672RCT'  # https://csrc.nist.gov/CSRC/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp925.pdf
-    return ''
-
-
 def get_random_color():
     """
     Returns randomly selected color out of defined
@@ -221,78 +49,157 @@ def get_random_edge_style():
     return edge_styles[random.randint(0, len(edge_styles) - 1)]
 
 
-def process_jcalgtest_files(walk_dir, files_with_cplc, files_without_cplc):
+def read_cplc_values(filename):
+    """
+    Reads CPLC info from the provided card profile, the whole file is read as concatenated profiles (e.g., of several
+    sessions) can contain more CPLC blocks and the last value of every field wins.
+    @param filename: path to the profile
+    @returns hash map with CPLC_FIELDS present in the profile and CardName, None if the profile has no CPLC info
+    """
+    values = {}
+    has_cplc = False
+    with open(filename) as f:
+        for line in f:
+            items = line.split(':')
+            if len(items) < 2:
+                items = line.split(';')
+                if len(items) < 2:
+                    continue
+
+            if items[0].find('ICFabricator') > -1:
+                has_cplc = True
+
+            items[0] = items[0].replace('CPLC.', '')
+
+            values[items[0]] = items[1].strip().strip(',')
+
+    if not has_cplc:
+        return None
+
+    cplc_values = {field: values[field] for field in CPLC_FIELDS if field in values}
+    filenameshort = path_leaf(filename)
+    pos = filenameshort.find('ALGSUPPORT')
+    if pos == -1:
+        pos = filenameshort.find('_3b')
+    if pos == -1:
+        pos = filenameshort.find('_3B')
+    cplc_values['CardName'] = filenameshort[:pos].replace('_', ' ')
+    return cplc_values
+
+
+def get_decoding_version():
+    # decoded names in the cache are valid while the decoding tables and functions are the same
+    return '-'.join(hash_file(module.__file__)[:16] for module in [cplc_decode, cplc_stats])
+
+
+def read_decoded_cplc_values(filename):
+    """
+    @returns CPLC values of the profile (see read_cplc_values) together with the decoded names (see
+             cplc_stats.decode_cplc_values), None if the profile has no CPLC info
+    """
+    values = read_cplc_values(filename)
+    if values is not None:
+        values.update(cplc_stats.decode_cplc_values(values))
+    return values
+
+
+def load_cplc_cache(cache_file):
+    """
+    @param cache_file: path to the cache written by save_cplc_cache
+    @returns hash map of file path -> entry with size, mtime, sha256 and CPLC values (with decoded names) of the file,
+             empty if no cache. Names are decoded again from the cached values if the decoding changed.
+    """
+    if cache_file is None or not os.path.isfile(cache_file):
+        return {}
+    with open(cache_file) as f:
+        cache = json.load(f)
+    if cache.get('version') != CPLC_CACHE_VERSION:
+        return {}
+    if cache.get('decoding') != get_decoding_version():
+        for entry in cache['files'].values():
+            if entry['values'] is not None:
+                entry['values'].update(cplc_stats.decode_cplc_values(entry['values']))
+    return cache['files']
+
+
+def save_cplc_cache(cache_file, cache):
+    temp_file_name = cache_file + '.tmp'
+    with open(temp_file_name, 'w') as f:
+        json.dump({'version': CPLC_CACHE_VERSION, 'decoding': get_decoding_version(), 'files': cache}, f, indent=1)
+    os.replace(temp_file_name, cache_file)
+
+
+def get_cached_cplc_entry(cache, filename):
+    """
+    Returns cache entry of the file if the file was not changed since it was cached (same size and mtime or hash)
+    """
+    entry = cache.get(filename)
+    if entry is None:
+        return None
+    stat = os.stat(filename)
+    if entry['size'] != stat.st_size:
+        return None
+    if entry['mtime'] != stat.st_mtime_ns:
+        if entry['sha256'] != hash_file(filename):
+            return None
+        entry['mtime'] = stat.st_mtime_ns  # only touched, content is the same
+    return entry
+
+
+def process_jcalgtest_files(walk_dir, files_with_cplc, files_without_cplc, cache_file=None):
     """
     Recursively reads files with CPLC info from the provided directory.
     @param walk_dir: directory with stored results for cards
     @param files_with_cplc: list which will contain hash maps for the cards with CPLC defined
     @param files_without_cplc: list of card names without the CPLC info
+    @param cache_file: if provided, CPLC info of the files is stored there and only new or changed files are read again
     """
-    files = []
-    print(json.dumps(list(search_files(walk_dir)), indent=2))
-    
+    cache = load_cplc_cache(cache_file)
+    updated_cache = {}
+    num_cached = 0
+
     for filename in search_files(walk_dir):
         if not os.path.isfile(filename):
             continue
-            
-        files.append(filename)
-        print(filename)
-        
-        with open(filename) as f:
-            values = {}
-            has_cplc = False
-            for line in f:
-                items = line.split(':')
-                if len(items) < 2:
-                    items = line.split(';')
-                    if len(items) < 2:
-                        continue
-                
-                if items[0].find('ICFabricator') > -1:
-                    has_cplc = True
-                
-                items[0] = items[0].replace('CPLC.', '')
-                
-                values[items[0]] = items[1].strip().strip(',')
-
-            filenameshort = path_leaf(filename)
-            if has_cplc: 
-                pos = filenameshort.find('ALGSUPPORT')
-                if pos == -1:
-                    pos = filenameshort.find('_3b')
-                if pos == -1:
-                    pos = filenameshort.find('_3B')
-                
-                
-                values['CardName'] = filenameshort[:pos]
-                values['CardName'] = values['CardName'].replace('_', ' ')
-                files_with_cplc[filename] =  values
-            else:
-                files_without_cplc.append(filenameshort)
-                            
+
+        entry = get_cached_cplc_entry(cache, filename)
+        if entry is None:
+            print(filename)
+            stat = os.stat(filename)
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                     'sha256': hash_file(filename) if cache_file is not None else None,
+                     'values': read_decoded_cplc_values(filename)}
+        else:
+            num_cached += 1
+        updated_cache[filename] = entry  # entries of removed files are dropped
+
+        if entry['values'] is not None:
+            files_with_cplc[filename] = entry['values']
+        else:
+            files_without_cplc.append(path_leaf(filename))
+
+    if cache_file is not None:
+        save_cplc_cache(cache_file, updated_cache)
+        print('CPLC info of {} files taken from {}'.format(num_cached, cache_file))
+
+
 #%%
 
 # Pick suitable seed so that different lines in graph are rendered with different colors/types (needs manual testing)
 random.seed(10)
 
 
-def generate_graph(cplc_list, vendor_name_filter):
+def build_cplc_graph(cplc_list):
     """
-    Visualize CPLC information from the list of cards
+    Builds graph model of CPLC information of all cards in one pass, views for vendors are derived from it by filtering
     @param cplc_list: list of hash maps (with CPLC metadata) for the cards to process and visualize
-    @param vendor_name_filter: if empty string '', then all vendors are printed, otherwise only the provided vendor is generated
+    @returns list of cards (each with vendor tag, nodes and edges of its path in graph) and list of CSV formatted lines
     """
-    dot2 = Digraph(comment='Vendor={}, CPLC from JCAlgTest.org'.format(vendor_name_filter))
-    graph_label = ''
-    #graph_label = 'Vendor={}, CPLC visualization (JCAlgTest.org database)\n'.format(vendor_name_filter)
-    graph_label += 'ICFabricator → ICFab_ICType → OperatingSystemID → OperatingSystemID_OSReleaseDate → OSReleaseLevel → CardName → Original vendor → Current vendor\n.'
-    dot2.attr('graph', label=graph_label, labelloc='t', fontsize='33')
-    dot2.attr(rankdir='LR', size='8,5')
-
+    cards = []
     ic_fabs_types = []  # information in CSV format
     for file_cplc in cplc_list:
         cplc_values = cplc_list[file_cplc]
-    
+
         if 'ICFabricator' in cplc_values:
             fab = cplc_values['ICFabricator']
             ictype = cplc_values['ICType']
@@ -307,113 +214,202 @@ def generate_graph(cplc_list, vendor_name_filter):
             if len(fab) > 2:
                 # Prepare CSV entry
                 ic_fabs_types.append('{}:{}:{}:{}:  {}'.format(fab, ictype, os_id, os_date, cardname))
-                
-                # Prepare .dot source 
+
+                # Prepare nodes and edges
                 dotfab = ' ICFab_' + fab
                 dottype = ' ICType_' + ictype
                 dotosid = ' OSID_' + os_id
                 dotosdate = ' OSDate_' + os_date
                 dotosdatelevel = dotosdate + ' OSLevel_' + os_level
 
-                if get_vendor_name(cardname)[1] == None:
-                    vendor_name_temp = get_vendor_name(cardname)[0]
+                names = cplc_stats.get_decoded_values(cplc_values)
+                vendor, vendor_current = names['VendorName'], names['CurrentVendorName']
+                if vendor_current is not None:
+                    vendor_name_curr = '\'' + vendor_current + '\''
+                    vendor_name = 'v=' + vendor
                 else:
-                    vendor_name_temp = get_vendor_name(cardname)[1]
-
-                if vendor_name_filter == '' or vendor_name_filter == vendor_name_temp:
-                    #ICFab_ICType -> OSID_OSDate -> CardName -> Vendor
-                    dot2.attr('node', color='lightgray')
-                    dot2.attr('node', style='filled')
-                    dot2.attr('node', fontsize='20')
-                    dot2.node(get_fab_name(fab))
-                    vendor, vendor_current = get_vendor_name(cardname)
-                    if vendor_current is not None:
-                        vendor_name_curr = '\'' + vendor_current + '\''
-                        vendor_name = 'v=' + vendor
-                    else:
-                        vendor_name = 'v=' + vendor
-                        vendor_name_curr = '\'' + vendor + '\''
-
-                    dot2.node(vendor_name)
-                    dot2.attr('node', fontsize='30')
-                    dot2.node(vendor_name_curr)
-                    dot2.attr('node', fontsize='20')
-                    dot2.node(dotosid, dotosid + '\n' + get_os_name(os_id))
-                    dot2.attr('node', color='lightgray')
-                    dot2.attr('node', style='solid')
-                    dot2.attr('node', fontsize='14')
-                    dot2.node(dotfab+dottype, '{}\n{}'.format(dotfab+dottype, get_ictype_name(fab, ictype)))
-                    dot2.node(dotosid+dotosdate, dotosid+dotosdate + '\n' + get_osiddate_name(os_id, os_date))
-                    dot2.node(dotosdatelevel, os_level)
-                    dot2.node(cardname)
-                    
-                    dot2.attr('edge', color='lightgray')
-                    # assign connection line color and type correctly to allow for tracking the 
-                    rndcolor = get_random_color()
-                    rndedgestyle = get_random_edge_style()
-                    dot2.edge(get_fab_name(fab), dotfab+dottype, color=rndcolor, style=rndedgestyle)
-                    dot2.edge(dotfab+dottype, dotosid, color=rndcolor, style=rndedgestyle)
-                    dot2.edge(dotosid, dotosid+dotosdate, color=rndcolor, style=rndedgestyle)
-                    dot2.edge(dotosid+dotosdate, dotosdatelevel, color=rndcolor, style=rndedgestyle)
-                    dot2.edge(dotosdatelevel, cardname, color=rndcolor, style=rndedgestyle)
-                    #dot2.edge(dotosid+dotosdate, cardname, color=rndcolor, style=rndedgestyle)
-                    dot2.edge(cardname, vendor_name, color=rndcolor, style=rndedgestyle)
-                    if vendor_name != vendor_name_curr:
-                        dot2.edge(vendor_name, vendor_name_curr, color=rndcolor, style=rndedgestyle)
-
-    # Generate dot graph using GraphViz into pdf 
-    vendor_name_filter = vendor_name_filter.replace('/', '_')
-    dot2.render('test-output/cplc_{}'.format(vendor_name_filter), view=True)
+                    vendor_name = 'v=' + vendor
+                    vendor_name_curr = '\'' + vendor + '\''
+
+                #ICFab_ICType -> OSID_OSDate -> CardName -> Vendor
+                # nodes as (name, label, style, fontsize)
+                nodes = [(names['FabricatorName'], None, 'filled', '20'),
+                         (vendor_name, None, 'filled', '20'),
+                         (vendor_name_curr, None, 'filled', '30'),
+                         (dotosid, dotosid + '\n' + names['OSName'], 'filled', '20'),
+                         (dotfab+dottype, '{}\n{}'.format(dotfab+dottype, names['ICTypeName']), 'solid', '14'),
+                         (dotosid+dotosdate, dotosid+dotosdate + '\n' + names['OSReleaseName'], 'solid', '14'),
+                         (dotosdatelevel, os_level, 'solid', '14'),
+                         (cardname, None, 'solid', '14')]
+                edges = [(names['FabricatorName'], dotfab+dottype),
+                         (dotfab+dottype, dotosid),
+                         (dotosid, dotosid+dotosdate),
+                         (dotosid+dotosdate, dotosdatelevel),
+                         (dotosdatelevel, cardname),
+                         #(dotosid+dotosdate, cardname),
+                         (cardname, vendor_name)]
+                if vendor_name != vendor_name_curr:
+                    edges.append((vendor_name, vendor_name_curr))
+
+                cards.append({'vendor': vendor if vendor_current is None else vendor_current,
+                              'nodes': nodes, 'edges': edges})
 
-    # Print CSV formated lines
     ic_fabs_types.sort()
+    return cards, ic_fabs_types
+
+
+def create_vendor_graph(cards, vendor_name_filter):
+    """
+    Creates graph of cards from the graph model
+    @param cards: list of cards as returned by build_cplc_graph
+    @param vendor_name_filter: if empty string '', then all vendors are included, otherwise only the provided vendor
+    @returns Digraph with the cards of the vendor
+    """
+    from graphviz import Digraph
+
+    dot2 = Digraph(comment='Vendor={}, CPLC from JCAlgTest.org'.format(vendor_name_filter))
+    graph_label = ''
+    #graph_label = 'Vendor={}, CPLC visualization (JCAlgTest.org database)\n'.format(vendor_name_filter)
+    graph_label += 'ICFabricator → ICFab_ICType → OperatingSystemID → OperatingSystemID_OSReleaseDate → OSReleaseLevel → CardName → Original vendor → Current vendor\n.'
+    dot2.attr('graph', label=graph_label, labelloc='t', fontsize='33')
+    dot2.attr(rankdir='LR', size='8,5')
+
+    for card in cards:
+        if vendor_name_filter == '' or vendor_name_filter == card['vendor']:
+            for name, label, style, fontsize in card['nodes']:
+                dot2.attr('node', color='lightgray', style=style, fontsize=fontsize)
+                dot2.node(name, label)
+
+            dot2.attr('edge', color='lightgray')
+            # assign connection line color and type correctly to allow for tracking the
+            rndcolor = get_random_color()
+            rndedgestyle = get_random_edge_style()
+            for tail, head in card['edges']:
+                dot2.edge(tail, head, color=rndcolor, style=rndedgestyle)
+
+    return dot2
+
+
+def get_vendor_graph_file_name(vendor_name_filter, output_dir=DEFAULT_OUTPUT_DIR):
+    return os.path.join(output_dir, 'cplc_{}'.format(vendor_name_filter.replace('/', '_')))
+
+
+def render_graph(task):
+    """
+    Renders dot source of the graph (in a worker process)
+    @param task: tuple of dot source, output file name (of the dot source), list of output formats and flag whether
+                 to open the result in viewer. Format 'dot' stores only the dot source, layout can be run later.
+    """
+    import graphviz
+
+    source, file_name, formats, view = task
+    graph = graphviz.Source(source)
+    for output_format in formats:
+        if output_format == 'dot':
+            graph.save(file_name)
+        else:
+            graph.render(file_name, format=output_format, view=view)
+            view = False  # open only the first rendered format
+
+
+def generate_graph(cplc_list, vendor_name_filter):
+    """
+    Visualize CPLC information from the list of cards
+    @param cplc_list: list of hash maps (with CPLC metadata) for the cards to process and visualize
+    @param vendor_name_filter: if empty string '', then all vendors are printed, otherwise only the provided vendor is generated
+    """
+    cards, ic_fabs_types = build_cplc_graph(cplc_list)
+
+    # Generate dot graph using GraphViz into pdf
+    dot2 = create_vendor_graph(cards, vendor_name_filter)
+    dot2.render(get_vendor_graph_file_name(vendor_name_filter), view=True)
+
+    # Print CSV formated lines
     for pair in ic_fabs_types:
         print(pair)
 
 
 def compute_item_stats(files_with_cplc: dict, cplc_item: str):
-    ic_stats = {}
-    for file in files_with_cplc:
-        icvalue = files_with_cplc[file][cplc_item]
-        if icvalue not in ic_stats:
-            ic_stats[icvalue] = 0
-        ic_stats[icvalue] += 1
+    """
+    @returns hash map of values of the CPLC item -> number of cards, the most frequent first
+    """
+    values, counts = cplc_stats.count_values(cplc_stats.build_cplc_table(files_with_cplc)[cplc_item])
+    return dict(zip(values, counts.tolist()))
 
-    return ic_stats
 
+def compute_stats(files_with_cplc: dict, stats_dir=None):
+    """
+    Prints the most frequent fabricators, IC types and OS IDs
+    @param files_with_cplc: hash map of file name -> CPLC values of the card
+    @param stats_dir: if provided, all statistics (counts, cross-tabulations, trends) are stored there as CSV and JSON
+    """
+    table = cplc_stats.build_cplc_table(files_with_cplc)  # table of cards is built only once for all statistics
+    for cplc_item, title in [('ICFabricator', 'ICFabricators'), ('ICType', 'ICType'), ('OperatingSystemID', 'OperatingSystemID')]:
+        values, counts = cplc_stats.count_values(table[cplc_item])
+        print('{} (total {}x)'.format(title, len(values)))
+        print(dict(zip(values, counts.tolist())))
 
-def compute_stats(files_with_cplc: dict):
-    ic_fabricators = compute_item_stats(files_with_cplc, 'ICFabricator')
-    print('ICFabricators (total {}x)'.format(len(ic_fabricators)))
-    print(dict(sorted(ic_fabricators.items(), key=lambda item: item[1], reverse=True)))
-    ic_types = compute_item_stats(files_with_cplc, 'ICType')
-    print('ICType (total {}x)'.format(len(ic_types)))
-    print(dict(sorted(ic_types.items(), key=lambda item: item[1], reverse=True)))
-    ic_oses = compute_item_stats(files_with_cplc, 'OperatingSystemID')
-    print('OperatingSystemID (total {}x)'.format(len(ic_oses)))
-    print(dict(sorted(ic_oses.items(), key=lambda item: item[1], reverse=True)))
+    if stats_dir is not None:
+        cplc_stats.export_cplc_stats(cplc_stats.compute_cplc_stats(table), stats_dir)
 
 
-def render_all_vendors():
+def render_all_vendors(walk_dir=DEFAULT_RESULTS_DIR, output_dir=DEFAULT_OUTPUT_DIR, formats=('pdf',), view=True,
+                       jobs=None, cache_file=CPLC_CACHE_FILE_NAME, stats_dir=None):
+    """
+    Renders graphs for all vendors, graph model is built once and the graphs are rendered in parallel
+    @param walk_dir: directory with stored results for cards
+    @param output_dir: directory for the rendered graphs
+    @param formats: output formats of graphs (e.g., 'pdf', 'svg', 'png'), 'dot' stores only the dot source
+    @param view: if True, rendered graphs are opened in viewer
+    @param jobs: number of worker processes used for rendering (default: one per vendor)
+    @param cache_file: file with cached CPLC info of already processed files (None to disable cache)
+    @param stats_dir: directory for CPLC statistics in CSV and JSON (None to only print the basic statistics)
+    """
     files_with_cplc = {}
     files_without_cplc = []
-    
-    walk_dir = '..\\Profiles\\results\\'
-    process_jcalgtest_files(walk_dir, files_with_cplc, files_without_cplc)
-    compute_stats(files_with_cplc)
+
+    process_jcalgtest_files(walk_dir, files_with_cplc, files_without_cplc, cache_file)
+    compute_stats(files_with_cplc, stats_dir)
 
     vendors = ['', 'NXP', 'Infineon', 'Gemalto', 'Feitian', 'G&D', 'Idemia']
     #vendors = ['']
     #vendors = ['G&D']
-    for vendor in vendors:
-        generate_graph(files_with_cplc, vendor)
+    cards, ic_fabs_types = build_cplc_graph(files_with_cplc)
+    # graphs are created in the order of vendors, so random colors of lines are the same as for separate rendering
+    tasks = [(create_vendor_graph(cards, vendor).source, get_vendor_graph_file_name(vendor, output_dir), formats, view)
+             for vendor in vendors]
+    pool = Pool(jobs if jobs is not None else len(tasks))
+    try:
+        pool.map(render_graph, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Print CSV formated lines
+    for pair in ic_fabs_types:
+        print(pair)
 
     print('Cards with CPLC: {}'.format(len(files_with_cplc)))
     print('Cards without CPLC: {}'.format(len(files_without_cplc)))
 
 
-def main():
-    render_all_vendors()
+@click.command()
+@click.option("--input-dir", "input_dir", type=click.Path(exists=True, file_okay=False), default=DEFAULT_RESULTS_DIR,
+              show_default=True, help="Directory with stored results for cards.")
+@click.option("--output-dir", "output_dir", type=click.Path(file_okay=False), default=DEFAULT_OUTPUT_DIR,
+              show_default=True, help="Directory for the rendered graphs.")
+@click.option("--format", "formats", type=click.Choice(['pdf', 'svg', 'png', 'dot']), multiple=True, default=['pdf'],
+              show_default=True, help="Output format, can be repeated. 'dot' stores only the dot source without layout.")
+@click.option("--view/--no-view", "view", default=True, show_default=True,
+              help="Open rendered graphs in viewer.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), help="Number of rendering processes [default: one per vendor].")
+@click.option("--cache-file", "cache_file", type=click.Path(dir_okay=False), default=CPLC_CACHE_FILE_NAME,
+              show_default=True, help="Cache with CPLC info of already processed files.")
+@click.option("--no-cache", "no_cache", is_flag=True, default=False, help="Read all files again, do not use the cache.")
+@click.option("--stats-dir", "stats_dir", type=click.Path(file_okay=False),
+              help="Store CPLC statistics (counts, cross-tabulations, trends) as CSV and JSON into this directory.")
+def main(input_dir, output_dir, formats, view, jobs, cache_file, no_cache, stats_dir):
+    render_all_vendors(input_dir, output_dir, formats, view, jobs, None if no_cache else cache_file, stats_dir)
 
 
 if __name__ == "__main__":
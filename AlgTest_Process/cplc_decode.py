@@ -0,0 +1,260 @@
+# Decoding of CPLC values and card names into human-readable names, without heavy dependencies (graphviz etc.),
+# so it can be imported as a library by other tools. Used by cplc.py for visualization of CPLC info.
+#
+# CPLC info collected from:
+# 1. own analysis
+# 2. https://www.javatips.net/api/bankomatinfos-master/src/at/zweng/bankomatinfos/iso7816emv/CPLC.java
+# 3. NIST FIPS140, Common Criteria certificates
+import functools
+import re
+
+
+# Lookup tables, entries are matched in the given order as substrings of the provided value (first match wins).
+# Values are usually exactly 4 hex characters, which are resolved by exact dict lookup (see SubstringTable).
+
+IC_FABRICATORS = [
+    ('0003', 'Renesas'),  # https://www.cryptsoft.com/fips140/vendors/140sp485.pdf
+    ('0005', 'Infineon'),  # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
+    ('008c', 'Tongxin'),  # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
+    ('2050', 'Philips'),  # https://www.commoncriteriaportal.org/files/epfiles/ANSSI-CC-2007-02-M02fr.pdf, pp. 2
+    ('3060', 'Renesas'),
+    ('4070', 'NXP'),  # https://csrc.nist.rip/groups/STM/cmvp/documents/140-1/140sp/140sp963.pdf, pp. 4
+    ('4090', 'Infineon'),
+    ('4180', 'Atmel'),
+    ('4250', 'Samsung'),
+    ('4790', 'NXP'),
+    ('4830', 'Infineon'),
+    ('5354', 'STMicro'),  # Feitian D11CR https://docs.google.com/spreadsheets/d/10s3dA_qGvWMajv8RhCWa00x-h-1Dx6SdF9rEKN-1RIg/edit#gid=952816161
+    ('0004', 'Philips'),  # Philips P8WE5032, https://www.commoncriteriaportal.org/files/epfiles/2000_06.pdf
+    #('4220', '?? Palmera V3'),
+]
+
+CARD_VENDORS = [
+    ('Feitian', ('Feitian', None)),
+    ('FeiTian', ('Feitian', None)),
+    ('G+D', ('G&D', None)),
+    ('Oberthur', ('Oberthur', 'Idemia')),
+    ('Idemia', ('Idemia', None)),
+    ('Gemalto', ('Gemalto', None)),
+    ('Gemplus', ('Gemplus', 'Gemalto')),
+    ('Athena', ('Athena', 'NXP')),
+    ('Axalto', ('Axalto', 'Gemalto')),
+    ('Cyberflex', ('Schlumberger', 'Gemalto')),
+    ('Taisys', ('Taisys', None)),
+    ('Fidesmo', ('Fidesmo', None)),
+    ('Infineon', ('Infineon', None)),
+    ('NXP', ('NXP', None)),
+    ('PIVKey', ('Taglio', None)),
+    ('Tongxin', ('Tongxin', None)),
+]
+
+OPERATING_SYSTEMS = [  # matched against lowercase OperatingSystemID
+    ('0000', '(not provided)'),
+    ('ffff', '(not provided)'),
+    ('0011', 'Schlumberger'),
+    ('0027', 'STM027'),
+    ('0230', 'G230'),
+    ('1291', 'Gemplus/Gemalto TOP'),
+    ('1671', 'G&D Sm@rtCafe'),
+    ('1981', 'Schlumberger'),
+    ('2041', 'Axalto'),
+    ('3231', 'Gemplus TOP'),
+    ('4041', 'Oberthur OCS'),
+    ('4051', 'IBM JCOP2'),
+    ('4070', 'JCOP ?'),
+    ('4091', 'Trusted Logic jTOP'),
+    ('4700', 'NXP JCOP3&4'),
+    ('4791', 'NXP JCOP2'),
+    ('4A5A', 'JCOP ?'),  # never matches lowercase id
+    ('544c', 'Trusted Logic jTOP'),
+    ('8211', 'Athena SCS OS'),
+    ('8231', 'Oberthur OCS'),
+    ('86aa', 'JavaCOS'),
+    ('a006', 'G&D Sm@rtCafe'),
+    ('d000', 'Gemalto OS'),
+    ('d001', 'G&D Sm@rtCafe 7'),
+    ('010b', 'FT-JCOS'),
+    ('25c3', 'FT-JCOS'),
+    ('4654', 'FT-JCOS'),
+    ('4090', 'Secora ID S'),
+]
+
+OPERATING_SYSTEM_RELEASES = [  # OperatingSystemID -> OperatingSystemReleaseDate table, both matched as given
+    ('4051', [('5158', 'JCOP 2.2 (2005)'),
+              ('6138', 'JCOP 2.2.1 (2006)'),
+              ('6345', 'JCOP 2.3.1 (2006)'),
+              ('7095', 'JCOP 2.3.1R? (2007)')]),
+    ('4700', [('0000', 'JCOP4 (2018)'),
+              ('e4d8', 'JCOP3 (2015)')]),
+    ('4791', [('7351', 'JCOP 2.3.2 (2007)'),
+              ('8102', 'JCOP 2.?.? (2008)'),
+              ('0078', 'JCOP 2.4.1 (2010)'),
+              ('2081', 'JCOP 2.4.2R2 (2012)'),
+              ('2348', 'JCOP 2.4.2R3 (2012)')]),
+    ('1671', [('7354', 'G&D Sm@rtCafe (2007)'),
+              ('8197', 'G&D Sm@rtCafe (2008)'),
+              ('1146', 'G&D Sm@rtCafe (2011)')]),
+    ('d001', [('4021', 'G&D Sm@rtCafe (2014)'),
+              ('4212', 'G&D Sm@rtCafe (2014)')]),
+    ('a006', [('3311', 'G&D Sm@rtCafe (2003)')]),
+    ('8211', [('0352', 'Athena (2010)'),
+              ('6351', 'Athena/JCOP3 (2016)')]),
+    ('544c', [('2151', 'Trusted Logic jTOP (2012)')]),
+    ('4091', [('2013', 'Trusted Logic jTOP (2012)'),
+              ('3234', 'Trusted Logic jTOP (2003)')]),
+    ('86aa', [('6028', 'JavaCOS (2016)'),
+              ('6083', 'JavaCOS (2016)'),
+              ('6153', 'JavaCOS (2016)'),
+              ('6188', 'JavaCOS (2016)'),
+              ('7311', 'JavaCOS (2017)')]),
+    ('1291', [('3349', 'Gemplus TOP (2003)'),
+              ('0356', 'Gemplus TOP (2000)'),
+              ('1102', 'Gemalto TOP (2011)'),
+              ('6095', 'Gemplus TOP (2006)'),
+              ('5181', 'Gemplus TOP (2005)'),
+              ('4214', 'Gemplus TOP (2004)')]),
+    ('3231', [('0300', 'Gemplus TOP (2000)')]),
+    ('8231', [('5343', 'Oberthur OCS (2015)'),
+              ('8150', 'Oberthur OCS (2008)')]),
+    ('4041', [('4091', 'Oberthur OCS (2004)'),
+              ('5273', 'Oberthur OCS (2005)')]),
+    ('0011', [('5273', 'Schlumberger (2000)')]),
+    ('2041', [('5314', 'Axalto (2005)')]),
+    ('1981', [('3052', 'Schlumberger (2003)')]),
+    # THD-89 uses an in-house JCOS that the chip manufacturer TongXin Microelectronics (TMC) also wrote in-house. The OS ID is not set.
+    ('0000', [('9021', 'TongXin JCOS (2019)')]),
+]
+
+IC_TYPES = [  # ICFabricator -> ICType table, matched against lowercase values
+    ('0003', [('0307', 'Renesas AE46C1')]),  # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
+    ('0004', [('0015', 'Philips P8WE5032')]),  # Philips P8WE5032, https://www.commoncriteriaportal.org/files/epfiles/2000_06.pdf
+    ('0005', [('0045', 'Infineon M7892 B11')]),  # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2327.pdf
+    ('008c', [('0089', 'Tongxin THD89')]),  # https://www.commoncriteriaportal.org/files/epfiles/2017-28%20INF-2492.pdf
+    ('4070', [('5072', 'NXP P5CD144')]),  # https://csrc.nist.gov/csrc/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp2774.pdf
+    ('5354', [('0033', 'STM ST31 ARM')]),  # Feitian D11CR https://docs.google.com/spreadsheets/d/10s3dA_qGvWMajv8RhCWa00x-h-1Dx6SdF9rEKN-1RIg/edit#gid=952816161
+    ('4180', [('0106', 'Atmel AT90SC25672RCT')]),  # https://csrc.nist.gov/CSRC/media/projects/cryptographic-module-validation-program/documents/security-policies/140sp925.pdf
+]
+
+
+class SubstringTable:
+    """
+    Ordered table of (key, result) pairs, lookup returns result of the first key found as substring of the value.
+    All keys of a table have the same length, so a value of that length can match only the key equal to it and
+    is resolved by an exact dict lookup. Other values are scanned in the table order.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.key_length = len(entries[0][0])
+        assert all(len(key) == self.key_length for key, _ in entries)
+        self.exact = {}
+        for key, result in entries:
+            self.exact.setdefault(key, []).append(result)
+
+    def find_all(self, value):
+        """
+        @param value: string to search the keys in
+        @returns results of all matching entries in the table order
+        """
+        if len(value) == self.key_length:
+            return self.exact.get(value, [])
+        if len(value) < self.key_length:
+            return []
+        return [result for key, result in self.entries if value.find(key) != -1]
+
+    def find(self, value, default):
+        """
+        @param value: string to search the keys in
+        @param default: returned if no key matches
+        @returns result of the first matching entry
+        """
+        results = self.find_all(value)
+        return results[0] if results else default
+
+
+class OrderedPatternMatcher:
+    """
+    Single compiled regex for table of arbitrary substrings (e.g., vendor names in card names).
+    Every position of the value is checked by lookahead with patterns in the table order, so the first entry of
+    the table occurring anywhere in the value is found in a single scan.
+    """
+    def __init__(self, entries):
+        self.results = [result for _, result in entries]
+        self.regex = re.compile('(?=(?:' + '|'.join('({})'.format(re.escape(key)) for key, _ in entries) + '))')
+
+    def find(self, value, default):
+        best = len(self.results)
+        for match in self.regex.finditer(value):
+            best = min(best, match.lastindex - 1)
+            if best == 0:
+                break
+        return self.results[best] if best < len(self.results) else default
+
+
+IC_FABRICATORS_TABLE = SubstringTable(IC_FABRICATORS)
+CARD_VENDORS_MATCHER = OrderedPatternMatcher(CARD_VENDORS)
+OPERATING_SYSTEMS_TABLE = SubstringTable(OPERATING_SYSTEMS)
+OPERATING_SYSTEM_RELEASES_TABLE = SubstringTable([(os_id, SubstringTable(dates))
+                                                  for os_id, dates in OPERATING_SYSTEM_RELEASES])
+IC_TYPES_TABLE = SubstringTable([(icfab, SubstringTable(ictypes)) for icfab, ictypes in IC_TYPES])
+
+
+@functools.lru_cache(maxsize=None)
+def get_fab_name(icfab):
+    """
+    Returns human-readable name of fabricator based on provided ICFabricator id
+    @param icfab: string realization of 2 bytes ICFabricator (in hexadecimal, e.g., '4090')
+    @returns human-readable fabricator string
+    """
+    return IC_FABRICATORS_TABLE.find(icfab, 'unknown (' + icfab + ')')
+
+
+@functools.lru_cache(maxsize=None)
+def get_vendor_name(cardname):
+    """
+    Returns human-readable name of card vendor based on provided card name
+    @param cardname: string with card name, e.g., 'NXP JCOP J2A080 80K'
+    @returns human-readable vendor string
+    """
+    return CARD_VENDORS_MATCHER.find(cardname, ('unknown vendor', None))
+
+
+@functools.lru_cache(maxsize=None)
+def get_os_name(os_id):
+    """
+    Returns human-readable name of operating system based on provided OperatingSystemID
+    @param os_id: string realization of 2 bytes OperatingSystemID (in hexadecimal, e.g., '1291')
+    @returns human-readable OS string
+    """
+    return OPERATING_SYSTEMS_TABLE.find(os_id.lower(), '')
+
+
+@functools.lru_cache(maxsize=None)
+def get_osiddate_name(os_id, os_date):
+    """
+    Returns human-readable name of operating system based on provided OperatingSystemID and OperatingSystemReleaseDate
+    @param os_id: string realization of 2 bytes OperatingSystemID (in hexadecimal, e.g., '1291')
+    @param os_date: string realization of 2 bytes OperatingSystemReleaseDate (in hexadecimal, e.g., '6138')
+    @returns human-readable os string with release date (if known)
+    """
+    # all OS ids matching os_id are tried in the table order until a date matches
+    for dates in OPERATING_SYSTEM_RELEASES_TABLE.find_all(os_id):
+        name = dates.find(os_date, None)
+        if name is not None:
+            return name
+    return ''
+
+
+@functools.lru_cache(maxsize=None)
+def get_ictype_name(icfab, ictype):
+    """
+    Returns human-readable name of IC type based on provided ICFabricator and ICType
+    @param icfab: string realization of 2 bytes ICFabricator (in hexadecimal, e.g., '4790')
+    @param ictype: string realization of 2 bytes ICType (in hexadecimal, e.g., '5072')
+    @returns human-readable IC type string (if known)
+    """
+    ictype = ictype.lower()
+    for ictypes in IC_TYPES_TABLE.find_all(icfab.lower()):
+        name = ictypes.find(ictype, None)
+        if name is not None:
+            return name
+    return ''
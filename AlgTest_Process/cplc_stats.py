@@ -0,0 +1,193 @@
+# Statistics over CPLC info of all cards: counts of values, cross-tabulations and time trends.
+# Table of cards x CPLC fields (as returned by cplc.process_jcalgtest_files) is built once as NumPy columns,
+# all statistics are then computed by vectorized grouping over the columns.
+import csv
+import json
+import os
+import re
+from cplc_decode import get_fab_name, get_vendor_name, get_os_name, get_osiddate_name, get_ictype_name, \
+    OPERATING_SYSTEM_RELEASES_TABLE
+
+CPLC_TABLE_FIELDS = ['CardName', 'ICFabricator', 'ICType', 'OperatingSystemID', 'OperatingSystemReleaseDate',
+                     'OperatingSystemReleaseLevel']
+COUNTED_FIELDS = ['ICFabricator', 'Fabricator', 'ICType', 'OperatingSystemID', 'OS', 'Vendor', 'OSReleaseYear']
+CROSSTABS = [('Fabricator', 'OS'), ('OperatingSystemID', 'OperatingSystemReleaseDate'), ('Vendor', 'ICType')]
+TREND = ('OSReleaseYear', 'OS')  # time trend, number of cards with OS released in given year
+UNKNOWN_YEAR = 'unknown'
+# human-readable names decoded from CPLC values of the card, stored with the values in CPLC cache (see cplc.py)
+DECODED_FIELDS = ['FabricatorName', 'ICTypeName', 'OSName', 'OSReleaseName', 'OSReleaseYear', 'VendorName',
+                  'CurrentVendorName']
+
+
+def get_current_vendor_name(cardname):
+    vendor, vendor_current = get_vendor_name(cardname)
+    return vendor if vendor_current is None else vendor_current
+
+
+def get_year_digit(os_date):
+    """
+    @param os_date: string realization of 2 bytes OperatingSystemReleaseDate in CPLC 'Y DDD' format (last digit of the
+                    year and day in that year, e.g., '6138')
+    @returns last digit of the year, None if os_date is not a valid Y DDD date
+    """
+    if re.fullmatch(r'[0-9]{4}', os_date) is None or not 1 <= int(os_date[1:]) <= 366:
+        return None
+    return int(os_date[0])
+
+
+def get_os_release_year(os_id, os_date):
+    """
+    Returns year of OS release decoded from OperatingSystemReleaseDate. The date carries only the last digit of the
+    year, the decade is taken from the known release with the same date (see cplc_decode.get_osiddate_name), otherwise
+    from the closest known release of the same OS. Year of the known release is used for dates not in Y DDD format.
+    @param os_id: string realization of 2 bytes OperatingSystemID
+    @param os_date: string realization of 2 bytes OperatingSystemReleaseDate
+    @returns year string, UNKNOWN_YEAR if not known
+    """
+    year_digit = get_year_digit(os_date)
+    match = re.search(r'\((\d{4})\)', get_osiddate_name(os_id, os_date))
+    if year_digit is None:
+        return match.group(1) if match else UNKNOWN_YEAR
+
+    if match:
+        known_years = [int(match.group(1))]
+    else:
+        known_years = [int(year) for dates in OPERATING_SYSTEM_RELEASES_TABLE.find_all(os_id)
+                       for _, name in dates.entries for year in re.findall(r'\((\d{4})\)', name)]
+    if not known_years:
+        return UNKNOWN_YEAR
+    years = [known_year // 10 * 10 + year_digit for known_year in known_years]
+    return str(min(years, key=lambda year: (min(abs(year - known_year) for known_year in known_years), year)))
+
+
+def decode_cplc_values(cplc_values):
+    """
+    Decodes CPLC values of the card into human-readable names (see cplc_decode)
+    @param cplc_values: hash map of CPLC fields and CardName of the card (as returned by cplc.read_cplc_values)
+    @returns hash map of DECODED_FIELDS -> name, CurrentVendorName is None if the vendor was not acquired
+    """
+    fab, ictype, os_id, os_date = [cplc_values.get(field, '')
+                                   for field in ['ICFabricator', 'ICType', 'OperatingSystemID', 'OperatingSystemReleaseDate']]
+    vendor, vendor_current = get_vendor_name(cplc_values.get('CardName', ''))
+    return {'FabricatorName': get_fab_name(fab),
+            'ICTypeName': get_ictype_name(fab, ictype),
+            'OSName': get_os_name(os_id),
+            'OSReleaseName': get_osiddate_name(os_id, os_date),
+            'OSReleaseYear': get_os_release_year(os_id, os_date),
+            'VendorName': vendor,
+            'CurrentVendorName': vendor_current}
+
+
+def get_decoded_values(cplc_values):
+    # names stored with the values (see decode_cplc_values), decoded now if not stored
+    if all(field in cplc_values for field in DECODED_FIELDS):
+        return cplc_values
+    return decode_cplc_values(cplc_values)
+
+
+def map_unique(function, *columns):
+    """
+    Applies function to all rows of the columns, evaluated only once for every distinct combination of values
+    @returns column with results
+    """
+    import numpy as np
+
+    keys = columns[0] if len(columns) == 1 else np.char.add(np.char.add(columns[0], '\x1f'), columns[1])
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    results = [function(*key.split('\x1f')) for key in unique_keys.tolist()]
+    return np.array(results, dtype=np.str_)[inverse] if results else np.array([], dtype=np.str_)
+
+
+def build_cplc_table(files_with_cplc: dict):
+    """
+    Builds table of all cards with CPLC fields and decoded names as NumPy columns
+    @param files_with_cplc: hash map of file name -> CPLC values of the card
+    @returns hash map of column name -> NumPy array with one item per card (missing values are '')
+    """
+    import numpy as np
+
+    cards = list(files_with_cplc.values())
+    table = {field: np.array([card.get(field, '') for card in cards], dtype=np.str_) for field in CPLC_TABLE_FIELDS}
+    if all(field in card for card in cards for field in DECODED_FIELDS):
+        # names decoded when the cards were read, taken from the CPLC cache
+        table['Fabricator'] = np.array([card['FabricatorName'] for card in cards], dtype=np.str_)
+        table['OS'] = np.array([card['OSName'] for card in cards], dtype=np.str_)
+        table['Vendor'] = np.array([card['VendorName'] if card['CurrentVendorName'] is None else
+                                    card['CurrentVendorName'] for card in cards], dtype=np.str_)
+        table['OSReleaseYear'] = np.array([card['OSReleaseYear'] for card in cards], dtype=np.str_)
+        return table
+
+    table['Fabricator'] = map_unique(get_fab_name, table['ICFabricator'])
+    table['OS'] = map_unique(get_os_name, table['OperatingSystemID'])
+    table['Vendor'] = map_unique(get_current_vendor_name, table['CardName'])
+    table['OSReleaseYear'] = map_unique(get_os_release_year, table['OperatingSystemID'],
+                                        table['OperatingSystemReleaseDate'])
+    return table
+
+
+def count_values(column):
+    """
+    @param column: NumPy array of values
+    @returns list of distinct values and NumPy array of their counts, the most frequent first (equally frequent values
+             in the order of first occurrence)
+    """
+    import numpy as np
+
+    values, first_index, counts = np.unique(column, return_index=True, return_counts=True)
+    order = np.lexsort((first_index, -counts))
+    return values[order].tolist(), counts[order]
+
+
+def crosstab(row_column, col_column):
+    """
+    Joint distribution of two columns
+    @returns list of row values, list of column values and NumPy matrix of counts (rows x columns), both sorted
+    """
+    import numpy as np
+
+    row_values, row_index = np.unique(row_column, return_inverse=True)
+    col_values, col_index = np.unique(col_column, return_inverse=True)
+    counts = np.bincount(row_index * len(col_values) + col_index, minlength=len(row_values) * len(col_values))
+    return row_values.tolist(), col_values.tolist(), counts.reshape(len(row_values), len(col_values))
+
+
+def compute_cplc_stats(table: dict):
+    """
+    @param table: table as returned by build_cplc_table
+    @returns hash map with counts of COUNTED_FIELDS and cross-tabulations of CROSSTABS and TREND (JSON serializable)
+    """
+    stats = {'cards': len(table['CardName']), 'counts': {}, 'crosstabs': {}}
+    for field in COUNTED_FIELDS:
+        values, counts = count_values(table[field])
+        stats['counts'][field] = dict(zip(values, counts.tolist()))
+
+    for row_field, col_field in CROSSTABS + [TREND]:
+        rows, cols, counts = crosstab(table[row_field], table[col_field])
+        stats['crosstabs']['{} x {}'.format(row_field, col_field)] = {'rows': rows, 'columns': cols,
+                                                                      'counts': counts.tolist()}
+    return stats
+
+
+def export_cplc_stats(stats: dict, output_dir: str):
+    """
+    Stores statistics as cplc_stats.json and CSV files (one per counted field and cross-tabulation)
+    @param stats: statistics as returned by compute_cplc_stats
+    @param output_dir: directory for the output files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'cplc_stats.json'), 'w') as f:
+        json.dump(stats, f, indent=2)
+
+    for field, counts in stats['counts'].items():
+        with open(os.path.join(output_dir, 'cplc_counts_{}.csv'.format(field)), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([field, 'count'])
+            writer.writerows(counts.items())
+
+    for name, table in stats['crosstabs'].items():
+        file_name = 'cplc_{}.csv'.format(name.replace(' x ', '_x_'))
+        with open(os.path.join(output_dir, file_name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow([name] + table['columns'])
+            for row, counts in zip(table['rows'], table['counts']):
+                writer.writerow([row] + counts)
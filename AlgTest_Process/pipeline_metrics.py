@@ -0,0 +1,156 @@
+# Timers and counters of the processing stages of process_results, per stage and per processed file.
+# Processing code calls count(), which does nothing unless metrics are collected (see start_collecting). Files processed
+# by process_results.process_files are measured by measure_file, also in worker processes - their counters are
+# returned together with the results and merged into the stage in the main process.
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_collector = None
+_counters = None  # counters of the currently measured file or stage, None if metrics are not collected
+
+
+def count(name: str, value: int = 1):
+    if _counters is not None:
+        _counters[name] += value
+
+
+def is_collecting():
+    return _collector is not None
+
+
+class MetricsCollector:
+    def __init__(self):
+        self.stages = {}  # stage name -> {'seconds', 'files', 'counters'}
+        self.files = {}  # file name -> stage name -> {'seconds', counters...}
+        self.stage_name = None
+
+    def add_file(self, filename: str, seconds: float, counters: Counter):
+        stage = self.stages[self.stage_name]
+        stage['files'] += 1
+        stage['counters'].update(counters)
+        file_stages = self.files.setdefault(filename, {})
+        file_stages[self.stage_name] = dict(counters, seconds=seconds)
+
+    def create_report(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage['counters'], seconds=stage['seconds'], files=stage['files'])
+            if stage['files'] > 0 and stage['seconds'] > 0:
+                stages[name]['files/s'] = stage['files'] / stage['seconds']
+        return {'total seconds': sum(stage['seconds'] for stage in self.stages.values()),
+                'stages': stages,
+                'files': self.files}
+
+
+def start_collecting():
+    global _collector
+    _collector = MetricsCollector()
+    return _collector
+
+
+@contextmanager
+def stage(name: str):
+    # wall time of the stage, counters outside of measured files are added to the stage directly
+    global _counters
+    if _collector is None:
+        yield
+        return
+
+    stage_metrics = _collector.stages.setdefault(name, {'seconds': 0.0, 'files': 0, 'counters': Counter()})
+    _collector.stage_name = name
+    _counters = stage_metrics['counters']
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_metrics['seconds'] += time.perf_counter() - start
+        _collector.stage_name = None
+        _counters = None
+
+
+def measure_file(process_file, filename: str):
+    # runs process_file(filename), returns its result, wall time and counters (picklable, usable in worker processes)
+    global _counters
+    outer_counters = _counters
+    _counters = Counter()
+    start = time.perf_counter()
+    try:
+        result = process_file(filename)
+        return result, time.perf_counter() - start, _counters
+    finally:
+        _counters = outer_counters
+
+
+def add_file_results(files: list, measured_results: list):
+    # merges metrics of measured files into the current stage, returns plain results
+    results = []
+    for filename, (result, seconds, counters) in zip(files, measured_results):
+        if _collector is not None and _collector.stage_name is not None:
+            _collector.add_file(filename, seconds, counters)
+        results.append(result)
+    return results
+
+
+@contextmanager
+def profile(profiler: str, output_file: str):
+    """
+    Profiles the code of the with block
+    @param profiler: 'cprofile' (output for pstats / snakeviz), 'pyinstrument' (optional dependency, HTML output if
+                     output_file ends with .html, text otherwise) or None for no profiling
+    """
+    if profiler is None:
+        yield
+    elif profiler == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_file)
+    else:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_file, 'w') as f:
+                f.write(profiler.output_html() if output_file.endswith('.html') else profiler.output_text())
+
+
+def format_prometheus(report: dict, prefix: str = 'process_results'):
+    # text exposition format, per stage only (per file metrics would have too high cardinality)
+    lines = ['# TYPE {}_seconds gauge'.format(prefix),
+             '{}_seconds{{stage="total"}} {}'.format(prefix, report['total seconds'])]
+    counter_names = sorted(set(name for stage in report['stages'].values() for name in stage
+                               if name not in ('seconds', 'files/s')))
+    for name, stage in report['stages'].items():
+        lines.append('{}_seconds{{stage="{}"}} {}'.format(prefix, name, stage['seconds']))
+    for counter_name in counter_names:
+        metric = '{}_{}_total'.format(prefix, counter_name.replace(' ', '_').replace('/', '_per_'))
+        lines.append('# TYPE {} counter'.format(metric))
+        for name, stage in report['stages'].items():
+            if counter_name in stage:
+                lines.append('{}{{stage="{}"}} {}'.format(metric, name, stage[counter_name]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(file_name: str, output_format: str = None):
+    """
+    Stores metrics of all stages as JSON or Prometheus text file
+    @param output_format: 'json' or 'prometheus', given by extension of file_name if not set ('.prom' for Prometheus)
+    """
+    report = _collector.create_report()
+    if output_format is None:
+        output_format = 'prometheus' if file_name.endswith('.prom') else 'json'
+    with open(file_name, 'w') as f:
+        if output_format == 'prometheus':
+            f.write(format_prometheus(report))
+        else:
+            json.dump(report, f, indent=2)
+    return report
@@ -1,13 +1,24 @@
+import hashlib
 import json
 import click
 from pathlib import Path
 import os
+import sys
+from collections import Counter, deque
+from functools import partial
+from multiprocessing import Pool
+
+import pipeline_metrics
+import profile_reader
 
 MEASUREMENT_CATEGORIES = ["MESSAGE DIGEST", "RANDOM GENERATOR", "CIPHER", "SIGNATURE", "CHECKSUM",
              "AESKey", "DESKey", "KoreanSEEDKey", "DSAPrivateKey", "DSAPublicKey",
              "ECF2MPublicKey", "ECF2MPrivateKey", "ECFPPrivateKey", "ECFPPublicKey", "HMACKey",
              "RSAPrivateKey", "RSAPublicKey", "RSAPrivateCRTKey", "KEY PAIR", "UTIL",
              "SWALGS", "KEYAGREEMENT"]
+CATEGORY_PREFIXES = tuple(MEASUREMENT_CATEGORIES)
+HEAD_SECTIONS = ['INFO:', 'JCSystem.getVersion()', 'JavaCard support version', 'CPLC;']
+SECTION_PREFIXES = tuple(HEAD_SECTIONS) + CATEGORY_PREFIXES  # lines starting the sections (and ending the categories)
 
 CARD_EXCEPTION_TO_STRING = {
     'f101': 'CryptoException_ILLEGAL_VALUE',
@@ -40,6 +51,17 @@ CARD_EXCEPTION_TO_STRING = {
     '6f00': 'Exception_GENERIC'
 }
 
+MANIFEST_FILE_NAME = 'process_results.manifest'
+PIPELINE_VERSION = 2  # increase when processing changes, results stored in manifest by older version are dropped
+NOT_CACHED = object()
+OPERATIONS_INDEX_EXTENSION = '.index'  # sidecar of profile json with card name and status of all measured operations
+OPERATIONS_INDEX_VERSION = 2  # increase when content of the sidecar index changes
+OPERATION_INDEX_FILE_NAME = 'process_results.opindex'  # cross-card index of all operations, see OperationIndex
+ALREADY_MEASURED_FILE_NAME = '{}____PERFORMANCE_SYMMETRIC_ASYMMETRIC_DATAFIXED__already_measured.list'  # by card name
+CHECK_TOLERANCE = 0.05  # maximal relative difference of min/max op time from average, as in PerformanceTesting
+REPAIRED_LINE_MARKERS = ['method name:;', 'UNKONWN_ERROR-card_has_return_value']  # all repairs change only such lines
+REPAIR_LOOKAHEAD_LINES = 6  # repair_missing_variable_data_lengths reads up to 6 lines following the method line
+
 def search_files(folder):
     for root, dirs, files in os.walk(folder):
         yield from [os.path.join(root, x) for x in files]
@@ -58,46 +80,146 @@ def get_files_to_process(walk_dir: Path, required_extension: str):
     return files_to_process
 
 
-def extract_section(lines: list, start_string: str, perf_measurement: bool):
-    all_sections = []
-    i = 0
-    while i < len(lines):
-        if lines[i].startswith(start_string):  # detect start of the section to extract
-            just_entered = True
-            section_items = {}
-            while i < len(lines) and len(lines[i]) > 0:  # process section till its end (newline)
-                if not just_entered and lines[i].startswith(start_string):   # check if we hit another section
-                    # we hit start fo another section - finish and let next section to be processed
-                    i = i - 1
-                    break
-
-                pos = lines[i].find(';')
-                if pos == -1:
-                    pos = len(lines[i])
-                if pos > 0:
-                    key = lines[i][0: pos].strip()
-                    if lines[i].find('method name:;') != -1:
-                        # do not strip ending ; for line with method for variable data measurements, strip only starting
-                        # method_name;data_length;
-                        value = lines[i][pos:].lstrip(';').strip()
-                    else:
-                        # strip ending ;
-                        value = lines[i][pos:].strip().strip(';').strip()
+def parse_section_line(section_items: dict, line: str, perf_measurement: bool):
+    pos = line.find(';')
+    if pos == -1:
+        pos = len(line)
+    if pos > 0:
+        key = line[0: pos].strip()
+        if line.find('method name:;') != -1:
+            # do not strip ending ; for line with method for variable data measurements, strip only starting
+            # method_name;data_length;
+            value = line[pos:].lstrip(';').strip()
+        else:
+            # strip ending ;
+            value = line[pos:].strip().strip(';').strip()
+
+        if perf_measurement and len(value) == 0:  # error status like NO_SUCH_ALGORITHM
+            section_items['status'] = key
+        else:
+            if line.find('Exception') != -1:  # various exceptions
+                section_items['status'] = key
+            else:
+                section_items[key] = value
+
+
+class SectionExtractor:
+    # incremental version of extract_section, consumes one line at a time
+    def __init__(self, start_string: str, perf_measurement: bool):
+        self.start_string = start_string
+        self.perf_measurement = perf_measurement
+        self.sections = []
+        self.section_items = None
+
+    def feed(self, line: str):
+        if self.section_items is not None:
+            if len(line) == 0:  # section ends with empty line
+                self.close()
+                return
+            if line.startswith(self.start_string):  # we hit start of another section - finish the current one
+                self.close()
+
+        if self.section_items is None:
+            if not line.startswith(self.start_string):
+                return
+            self.section_items = {}
+
+        parse_section_line(self.section_items, line, self.perf_measurement)
+
+    def close(self):
+        if self.section_items is not None:
+            self.sections.append(self.section_items)
+            self.section_items = None
+
+
+class Measurement:
+    # compact record of one measurement item of a parsed profile, so that many profiles can be held in memory
+    # keys of the item are shared by all records with the same layout, method names and statuses are interned
+    __slots__ = ('keys', 'values')
+    layouts = {}
+    interned_keys = ('method name:', 'measurement config:', 'status')
+
+    def __init__(self, item: dict):
+        keys = tuple(item.keys())
+        self.keys = Measurement.layouts.setdefault(keys, keys)
+        self.values = tuple(sys.intern(value) if key in Measurement.interned_keys else value
+                            for key, value in item.items())
+
+    def get(self, key: str, default=None):
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            return default
+
+    def __getitem__(self, key: str):
+        return self.values[self.keys.index(key)]
+
+    def __contains__(self, key: str):
+        return key in self.keys
+
+    @property
+    def method_name(self):
+        return self.get('method name:')
+
+    @property
+    def status(self):
+        return self.get('status')
+
+    def to_item(self):
+        return dict(zip(self.keys, self.values))
+
+
+def measurement_to_json(obj):
+    # usable as json.dump(..., default=measurement_to_json), produces the same layout as item dicts
+    if isinstance(obj, Measurement):
+        return obj.to_item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+class CategoryExtractor:
+    # collects measurements from all '<category>' ... '<category> - END' blocks, blocks without END are dropped
+    # measurements are stored as Measurement records by method name when their block ends, later measurement of the same
+    # method replaces the earlier one (e.g., in concatenated outputs of several sessions)
+    def __init__(self, category: str):
+        self.category = category
+        self.end_string = category + ' - END'
+        self.block = None
+        self.items = {}
+        self.duplicates = []  # method names measured more than once, in the order of occurrence
+        self.num_items = 0
+
+    def feed(self, line: str):
+        if self.block is None:
+            if not line.startswith(self.category):
+                return
+            self.block = SectionExtractor('method name:;', True)
+
+        if line.startswith(self.end_string):
+            self.block.close()
+            self.add_items(self.block.sections)
+            self.block = None
+        else:
+            self.block.feed(line)
+
+    def add_items(self, sections: list):
+        for item in sections:
+            if len(item.keys()) == 7:  # add explicit OK for correctly measured sections
+                item['status'] = 'OK'
+
+            method_name = sys.intern(item['method name:'])
+            if method_name in self.items:
+                self.duplicates.append(method_name)
+            self.items[method_name] = Measurement(item)
+        self.num_items += len(sections)
 
-                    if perf_measurement and len(value) == 0:  # error status like NO_SUCH_ALGORITHM
-                        section_items['status'] = key
-                    else:
-                        if lines[i].find('Exception') != -1:  # various exceptions
-                            section_items['status'] = key
-                        else:
-                            section_items[key] = value
-                i = i + 1
-                just_entered = False
 
-            all_sections.append(section_items)
-        i = i + 1
+def extract_section(lines: list, start_string: str, perf_measurement: bool):
+    extractor = SectionExtractor(start_string, perf_measurement)
+    for line in lines:
+        extractor.feed(line)
+    extractor.close()
 
-    return all_sections
+    return extractor.sections
 
 
 def update_if_not_empty(struct: dict, values: list):
@@ -105,255 +227,907 @@ def update_if_not_empty(struct: dict, values: list):
         struct.update(values[0])
 
 
-def convert_to_json(walk_dir: str):
+class ProfileExtractor:
+    # all sections of a profile, consumes lines (without line ends) in the order of the file
+    def __init__(self):
+        self.head_extractors = [SectionExtractor(start_string, False) for start_string in HEAD_SECTIONS]
+        self.categories = [CategoryExtractor(category) for category in MEASUREMENT_CATEGORIES]
+        self.open_categories = []
+        self.num_lines = 0
+
+    def feed_lines(self, lines):
+        head_extractors = self.head_extractors
+        categories = self.categories
+        open_categories = self.open_categories
+        num_lines = 0
+        for line in lines:
+            num_lines += 1
+            for extractor in head_extractors:
+                extractor.feed(line)
+
+            if line.startswith(CATEGORY_PREFIXES):
+                for extractor in categories:
+                    extractor.feed(line)
+                open_categories = [extractor for extractor in categories if extractor.block is not None]
+            elif open_categories:
+                for extractor in open_categories:
+                    extractor.feed(line)
+
+        self.open_categories = open_categories
+        self.num_lines += num_lines
+
+    def create_values(self, last_lines: list, filename: str, typed: bool = False):
+        # last_lines - summary printed at the very end of the file
+        info, jcsystem_version, jcsupport_version, cplc = self.head_extractors
+        for extractor in self.head_extractors:
+            extractor.close()
+
+        values = {}
+        values['Info'] = {}
+        update_if_not_empty(values['Info'], info.sections)
+        update_if_not_empty(values['Info'], extract_section(last_lines, 'Total test time:;', False))
+        update_if_not_empty(values['Info'], extract_section(last_lines, 'Total human interventions (retries with physical resets etc.):;', False))
+        update_if_not_empty(values['Info'], extract_section(last_lines, 'Total reconnects to card:;', False))
+
+        values['JCSystem'] = {}
+        update_if_not_empty(values['JCSystem'], jcsystem_version.sections)
+        update_if_not_empty(values['JCSystem'], jcsupport_version.sections)
+
+        values['CPLC'] = {}
+        update_if_not_empty(values['CPLC'], cplc.sections)
+
+        values['Measurements'] = {}
+        for extractor in self.categories:
+            values['Measurements'][extractor.category] = extractor.items
+            for method_name in extractor.duplicates:
+                print('Already exists ' + method_name + filename)
+                pipeline_metrics.count('duplicate measurements')
+
+        pipeline_metrics.count('lines scanned', self.num_lines)
+        pipeline_metrics.count('sections found', sum(len(extractor.sections) for extractor in self.head_extractors) +
+                               sum(extractor.num_items for extractor in self.categories))
+        if typed:
+            values['Measurements'] = parse_typed_measurements(values['Measurements'])
+
+        return values
+
+
+def parse_profile(lines, filename: str, typed: bool = False):
+    # single pass over the profile lines, all sections are extracted at once
+    # typed=True returns measurements with numbers already parsed (see parse_typed_measurements)
+    profile = ProfileExtractor()
+    last_lines = deque(maxlen=10)  # summary is printed at the very end of the file
+
+    def strip_lines():
+        for line in lines:
+            line = line.rstrip('\n')
+            last_lines.append(line)
+            yield line
+
+    profile.feed_lines(strip_lines())
+
+    # same window as lines[len(lines) - 10:], which is shorter for files with 6-9 lines only
+    if 5 < profile.num_lines < 10:
+        last_lines = list(last_lines)[profile.num_lines - 10:]
+
+    return profile.create_values(last_lines, filename, typed)
+
+
+def is_section_boundary(line: str, line_corrected: str):
+    # repair of the line may change where sections start or end (see find_section_spans), lines end with '\n'
+    if line.endswith('\n') != line_corrected.endswith('\n'):
+        return True
+    for text in [line.rstrip('\n'), line_corrected.rstrip('\n')]:
+        if len(text) == 0 or text.startswith(SECTION_PREFIXES) or '\n' in text or '\r' in text:
+            return True
+    return False
+
+
+class MappedProfileParser:
+    # parses memory-mapped profile in the order of the file, only the lines of sections and the summary are decoded
+    # chunks of the file repaired meanwhile (see get_repaired_chunks) are parsed from the repaired lines, so the
+    # repaired profile is parsed without mapping and scanning the rewritten file again
+    def __init__(self, data):
+        self.data = data
+        self.profile = ProfileExtractor()
+        blocks = {category: category + ' - END' for category in MEASUREMENT_CATEGORIES}
+        self.spans = profile_reader.find_section_spans(data, HEAD_SECTIONS, blocks)
+        self.next_span = 0
+        self.position = 0  # data before position is parsed
+        self.last_lines_start = profile_reader.get_last_lines_start(data, 10)  # summary is printed at the very end
+        self.repaired_last_lines = {}  # offset of the line -> repaired line of the summary
+        self.sections_changed = False  # repairs changed the sections, only the rewritten file can be parsed
+
+    def get_spans(self, end: int):
+        # parts of the sections between position and end, position is moved to end
+        spans = []
+        while self.next_span < len(self.spans):
+            start, span_end = self.spans[self.next_span]
+            start = max(start, self.position)
+            if start >= end:
+                break
+            spans.append((start, min(span_end, end)))
+            if span_end > end:
+                break
+            self.next_span += 1
+        self.position = end
+        return spans
+
+    def feed_data(self, end: int):
+        for start, stop in self.get_spans(end):
+            pipeline_metrics.count('bytes decoded', stop - start)
+            self.profile.feed_lines(profile_reader.decode_lines(self.data, start, stop))
+
+    def feed_repaired(self, start: int, end: int, lines: list, lines_corrected: list):
+        # data[start:end] decoded into lines (with line ends) was repaired into lines_corrected
+        if self.sections_changed:
+            return
+        self.feed_data(start)
+
+        # lone '\r' line ends are rewritten to '\n', the sections of the rewritten file may differ then
+        if len(lines_corrected) != len(lines) or \
+                profile_reader.LONE_CARRIAGE_RETURN.search(self.data, start, end) is not None or \
+                any(line != line_corrected and is_section_boundary(line, line_corrected)
+                    for line, line_corrected in zip(lines, lines_corrected)):
+            self.sections_changed = True
+            return
+
+        # lines are split only at '\n' here, index of the line at offset is the number of '\n' before it
+        position, index = start, 0
+        for span_start, span_end in self.get_spans(end):
+            first = index + self.data[position:span_start].count(b'\n')
+            position, index = span_end, first + self.data[span_start:span_end].count(b'\n')
+            span_text = ''.join(lines_corrected[first:index] if span_end < end else lines_corrected[first:])
+            span_lines = span_text.split('\n')
+            if span_lines[-1] == '':  # text ends with line end
+                span_lines.pop()
+            self.profile.feed_lines(span_lines)
+
+        if end > self.last_lines_start:
+            tail_start = max(start, self.last_lines_start)
+            first = self.data[start:tail_start].count(b'\n')
+            for offset, line, line_corrected in zip(profile_reader.get_line_offsets(self.data, tail_start, end),
+                                                    lines[first:], lines_corrected[first:]):
+                if line != line_corrected:
+                    self.repaired_last_lines[offset] = line_corrected.rstrip('\n')
+
+    def create_values(self, filename: str, typed: bool = False):
+        self.feed_data(len(self.data))
+
+        last_lines = list(profile_reader.decode_lines(self.data, self.last_lines_start, len(self.data)))
+        if self.repaired_last_lines:
+            offsets = profile_reader.get_line_offsets(self.data, self.last_lines_start, len(self.data))
+            last_lines = [self.repaired_last_lines.get(offset, line) for offset, line in zip(offsets, last_lines)]
+        # same window as lines[len(lines) - 10:], which is shorter for files with 6-9 lines only
+        return self.profile.create_values(last_lines[len(last_lines) - 10:], filename, typed)
+
+
+def parse_mapped_profile(data, filename: str, typed: bool = False):
+    # same as parse_profile for memory-mapped file, only the lines of sections and the summary are decoded
+    return MappedProfileParser(data).create_values(filename, typed)
+
+
+def init_worker():
+    # progress of workers shares one output, keep the printed lines whole (line buffered on the same file descriptor),
+    # stdout without a file descriptor (e.g., StringIO of click CliRunner or Jupyter) is kept as inherited
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        return
+    sys.stdout = open(fileno, 'w', buffering=1, encoding=sys.stdout.encoding, errors=sys.stdout.errors, closefd=False)
+
+
+def process_files(process_file, files: list, jobs: int):
+    # files are independent, results are always returned in the order of files
+    measured = pipeline_metrics.is_collecting()
+    if measured:  # time and counters of every file are returned together with its result
+        process_file = partial(pipeline_metrics.measure_file, process_file)
+
+    if jobs > 1:
+        pool = Pool(jobs, initializer=init_worker)
+        try:
+            results = pool.map(process_file, files, chunksize=1)
+        finally:
+            pool.close()  # let the workers exit normally so their output is flushed
+            pool.join()
+    else:
+        results = [process_file(filename) for filename in files]
+
+    return pipeline_metrics.add_file_results(files, results) if measured else results
+
+
+class Manifest:
+    # results of already processed files, valid while file size, mtime (or content hash) and pipeline version match
+    def __init__(self, walk_dir: str, pipeline_version: str):
+        self.walk_dir = walk_dir
+        self.file_name = os.path.join(walk_dir, MANIFEST_FILE_NAME)
+        self.pipeline_version = pipeline_version
+        self.entries = {}
+        self.seen = set()
+        if os.path.isfile(self.file_name):
+            with open(self.file_name) as f:
+                self.entries = json.load(f)
+
+    def find_entry(self, filename: str):
+        path = os.path.relpath(filename, self.walk_dir)
+        self.seen.add(path)
+        entry = self.entries.get(path)
+        if entry is None or entry['pipeline version'] != self.pipeline_version:
+            return None
+
+        stat = os.stat(filename)
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] != stat.st_mtime_ns:
+            if entry['sha256'] != profile_reader.hash_file(filename):
+                return None
+            entry['mtime'] = stat.st_mtime_ns  # only touched, content is the same
+
+        return entry
+
+    def get(self, filename: str, key: str):
+        entry = self.find_entry(filename)
+        if entry is None or key not in entry['results']:
+            return NOT_CACHED
+        return entry['results'][key]
+
+    def update(self, filename: str, key: str, value):
+        entry = self.find_entry(filename)
+        if entry is None:
+            stat = os.stat(filename)
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': profile_reader.hash_file(filename),
+                     'pipeline version': self.pipeline_version, 'results': {}}
+            self.entries[os.path.relpath(filename, self.walk_dir)] = entry
+        entry['results'][key] = value
+
+    def save(self):
+        # entries of removed files are dropped
+        entries = {path: entry for path, entry in self.entries.items() if path in self.seen}
+        temp_file_name = self.file_name + '.tmp'
+        with open(temp_file_name, 'w') as write_file:
+            json.dump(entries, write_file, indent=1, sort_keys=False)
+        os.replace(temp_file_name, self.file_name)
+
+
+def process_files_cached(process_file, files: list, jobs: int, manifest: Manifest, key: str):
+    # same as process_files, but results of unchanged files are taken from manifest (if provided)
+    if manifest is None:
+        return process_files(process_file, files, jobs)
+
+    results = {filename: manifest.get(filename, key) for filename in files}
+    files_to_process = [filename for filename in files if results[filename] is NOT_CACHED]
+    pipeline_metrics.count('manifest hits', len(files) - len(files_to_process))
+    for filename, result in zip(files_to_process, process_files(process_file, files_to_process, jobs)):
+        manifest.update(filename, key, result)
+        results[filename] = result
+
+    return [results[filename] for filename in files]
+
+
+def is_profile_json(values):
+    # json files of the results directory are not only converted profiles, e.g. stats.json written to the current
+    # directory is found there as well when the results directory is processed from within
+    return isinstance(values, dict) and 'Measurements' in values
+
+
+def create_operations_index(values: dict):
+    # operations in the order of categories and measurements as [method name, status, data length, avg/min/max op],
+    # status (or op time) is None if not present in the profile
+    operations = {}
+    for category, category_items in values['Measurements'].items():
+        operations[category] = []
+        for method_name, item in category_items.items():
+            data_length = parse_operation_info(item.get('operation info:', '')).get('data length',
+                                                                                    split_method_name(method_name)[1])
+            op_stats = parse_labeled_values(item.get('operation stats (ms/op):', ''))
+            operations[category].append([method_name, item.get('status'), data_length, op_stats.get('avg op'),
+                                         op_stats.get('min op'), op_stats.get('max op')])
+    return {'Card name': values['Info'].get('Card name'), 'Operations': operations}
+
+
+def iterate_operations_index(index: dict):
+    # (category, method name, status, data length, avg op, min op, max op) for all operations in the index
+    for category, operations in index['Operations'].items():
+        for operation in operations:
+            yield (category, *operation)
+
+
+def write_profile_json(json_file_name: str, values: dict):
+    with open(json_file_name, "w") as write_file:
+        json.dump(values, write_file, indent=2, sort_keys=False, default=measurement_to_json)
+
+    # small sidecar index, statistics over all profiles do not need to parse the whole json again
+    stat = os.stat(json_file_name)
+    pipeline_metrics.count('bytes written', stat.st_size)
+    index = create_operations_index(values)
+    index['version'] = OPERATIONS_INDEX_VERSION
+    index['json size'] = stat.st_size
+    index['json mtime'] = stat.st_mtime_ns
+    with open(json_file_name + OPERATIONS_INDEX_EXTENSION, "w") as write_file:
+        json.dump(index, write_file)
+
+
+def load_operations_index(json_file_name: str):
+    # index is used only if it belongs to the current json, otherwise the whole json is parsed
+    # None for json which is not a profile (see is_profile_json)
+    try:
+        with open(json_file_name + OPERATIONS_INDEX_EXTENSION) as index_file:
+            index = json.load(index_file)
+        stat = os.stat(json_file_name)
+        if index['version'] == OPERATIONS_INDEX_VERSION and index['json size'] == stat.st_size and \
+                index['json mtime'] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    pipeline_metrics.count('index misses')
+    with open(json_file_name) as json_file:
+        values = json.load(json_file)
+    return create_operations_index(values) if is_profile_json(values) else None
+
+
+def convert_file_to_json(filename: str):
+    print(filename)
+
+    with profile_reader.map_file(filename) as data:
+        pipeline_metrics.count('bytes read', len(data))
+        values = parse_mapped_profile(data, filename)
+
+    write_profile_json(filename + ".json", values)
+
+
+def convert_to_json(walk_dir: str, jobs: int = 1):
     files = get_files_to_process(walk_dir, '.csv')
+    process_files(convert_file_to_json, files, jobs)
 
-    for filename in files:
-        print(filename)
-
-        with open(filename) as f:
-            values = {}
-            lines_temp = f.readlines()
-            lines = [line.rstrip('\n') for line in lines_temp]
-
-            values['Info'] = {}
-            update_if_not_empty(values['Info'], extract_section(lines, 'INFO:', False))
-            update_if_not_empty(values['Info'], extract_section(lines[len(lines) - 10:], 'Total test time:;', False))
-            update_if_not_empty(values['Info'], extract_section(lines[len(lines) - 10:], 'Total human interventions (retries with physical resets etc.):;', False))
-            update_if_not_empty(values['Info'], extract_section(lines[len(lines) - 10:], 'Total reconnects to card:;', False))
-
-            values['JCSystem'] = {}
-            update_if_not_empty(values['JCSystem'], extract_section(lines, 'JCSystem.getVersion()', False))
-            update_if_not_empty(values['JCSystem'], extract_section(lines, 'JavaCard support version', False))
-
-            values['CPLC'] = {}
-            update_if_not_empty(values['CPLC'], extract_section(lines, 'CPLC;', False))
-
-            values['Measurements'] = {}
-            for category in MEASUREMENT_CATEGORIES:
-                values['Measurements'][category] = {}
-                # find start and end of the specific category
-                i = 0
-                start_index = -1
-                end_index = -1
-                while i < len(lines):
-                    if lines[i].startswith(category):
-                        start_index = i
-                        # find end of section
-                        while i < len(lines):
-                            if lines[i].startswith(category + ' - END'):
-                                end_index = i
-                                break
-                            i = i + 1
-
-                        if start_index > -1 and end_index > -1:
-                            section_data = extract_section(lines[start_index: end_index], 'method name:;', True)
-                            for item in section_data:
-                                if len(item.keys()) == 7:  # add explicit OK for correctly measured sections
-                                    item['status'] = 'OK'
-
-                                if item['method name:'] in values['Measurements'][category].keys():
-                                    print('Already exists ' + item['method name:'] + filename)
-                                values['Measurements'][category][item['method name:']] = item
-
-                    i = i + 1
-
-            with open(filename + ".json", "w") as write_file:
-                json.dump(values, write_file, indent=2, sort_keys=False)
-
-
-            # # sanity check
-            # for item in values['Measurements']:
-            #     for item2 in item:
-            #         lines.remove()
-
-
-def prepare_missing_measurements(walk_dir: str):
-    files = get_files_to_process(walk_dir, '.json')
-    for filename in files:
-        print(filename)
-        with open(filename) as json_file:
-            measurements = json.load(json_file)
-
-            # find all properly measured operations
-            correctly_measured = []
-            measured_with_errors = []
-            msr = measurements['Measurements']
-            for category in msr:
-                for ops in msr[category].keys():
-                    if 'status' not in msr[category][ops]:
-                        print(msr[category][ops])
-                    status = msr[category][ops]['status']
-                    if status == 'OK' or status == 'NO_SUCH_ALGORITHM' or status.find('FUNC_NOT_SUPPORTED') != -1:
-                        correctly_measured.append(ops + '\n')
-                        measured_with_errors.append(ops + '\n')
-                    else:
-                        measured_with_errors.append(ops + ' ' + status + '\n')
 
-            print(filename)
-            out_file_name = walk_dir + measurements['Info']['Card name'].replace(' ', '_') + '____PERFORMANCE_SYMMETRIC_ASYMMETRIC_DATAFIXED__already_measured.list'
-            correctly_measured.sort()
-            measured_with_errors.sort()
-            with open(out_file_name, 'w') as f:
-                f.writelines(correctly_measured)
-            with open(out_file_name + '.with_errors', 'w') as f:
-                f.writelines(measured_with_errors)
+def is_correctly_measured(status: str):
+    # operation measured or reported as not supported, no need to measure it again
+    return status == 'OK' or status == 'NO_SUCH_ALGORITHM' or status.find('FUNC_NOT_SUPPORTED') != -1
 
 
-def fix_missing_underscores(walk_dir: str, correct_ops_names: list):
+def collect_measured_operations(filename: str):
+    print(filename)
+    index = load_operations_index(filename)
+    if index is None:
+        return None
+
+    # find all properly measured operations
+    correctly_measured = []
+    measured_with_errors = []
+    for _, ops, status, *_ in iterate_operations_index(index):
+        if status is None:
+            raise KeyError('status of {} missing in {}'.format(ops, filename))
+        if is_correctly_measured(status):
+            correctly_measured.append(ops + '\n')
+            measured_with_errors.append(ops + '\n')
+        else:
+            measured_with_errors.append(ops + ' ' + status + '\n')
+
+    print(filename)
+    correctly_measured.sort()
+    measured_with_errors.sort()
+
+    if index['Card name'] is None:
+        raise KeyError('Card name missing in {}'.format(filename))
+    return index['Card name'], correctly_measured, measured_with_errors
+
+
+def prepare_missing_measurements(walk_dir: str, jobs: int = 1, manifest: Manifest = None):
+    files = get_files_to_process(walk_dir, '.json')
+    # files are written here in the order of inputs, so the result for the same card name is deterministic
+    for measured in process_files_cached(collect_measured_operations, files, jobs, manifest, 'measured operations'):
+        if measured is None:
+            continue
+        card_name, correctly_measured, measured_with_errors = measured
+        out_file_name = walk_dir + ALREADY_MEASURED_FILE_NAME.format(card_name.replace(' ', '_'))
+        with open(out_file_name, 'w') as f:
+            f.writelines(correctly_measured)
+        with open(out_file_name + '.with_errors', 'w') as f:
+            f.writelines(measured_with_errors)
+
+
+def write_lines_atomic(filename: str, lines: list):
+    # readers of the file never see partially written content
+    temp_file_name = filename + '.tmp'
+    with open(temp_file_name, 'w') as f_write:
+        f_write.writelines(lines)
+    os.replace(temp_file_name, filename)
+
+
+def get_repaired_chunks(data, repairs: list, parser: MappedProfileParser = None):
+    # repairs change only lines with REPAIRED_LINE_MARKERS, they are applied on chunks of the file with such lines only
+    # repaired chunks are passed to the parser (if given) in the order of the file
+    for start, end in profile_reader.find_marked_chunks(data, REPAIRED_LINE_MARKERS, REPAIR_LOOKAHEAD_LINES):
+        pipeline_metrics.count('bytes decoded', end - start)
+        lines = list(profile_reader.decode_lines(data, start, end, keepends=True))
+        lines_corrected = lines
+        for repair in repairs:
+            lines_corrected = repair(lines_corrected)
+
+        if lines_corrected != lines:
+            pipeline_metrics.count('lines rewritten', sum(line != line_corrected
+                                                          for line, line_corrected in zip(lines, lines_corrected)))
+            if parser is not None:
+                parser.feed_repaired(start, end, lines, lines_corrected)
+            yield start, end, profile_reader.encode_lines(lines_corrected, data, start, end)
+
+
+def repair_file(filename: str, repairs: list, parse: bool = False):
+    # parse=True returns also values of the repaired profile (see parse_profile), None is returned otherwise
+    print(filename)
+
+    # repairs are applied one after another on the mapped file, only the chunks with repaired lines are decoded and the
+    # file is rewritten only once (if changed), readers of the file never see partially written content
+    # the profile is parsed from the same mapping during the repair, with repaired chunks taken from the repair
+    values = None
+    with profile_reader.map_file(filename) as data:
+        pipeline_metrics.count('bytes read', len(data))
+        parser = MappedProfileParser(data) if parse else None
+        temp_file_name = profile_reader.write_replaced(data, filename, get_repaired_chunks(data, repairs, parser))
+        if parse and not parser.sections_changed:
+            values = parser.create_values(filename)
+
+    if temp_file_name is not None:
+        os.replace(temp_file_name, filename)
+        pipeline_metrics.count('files rewritten')
+
+    if parse and values is None:
+        # repaired lines start or end sections, the rewritten file has to be parsed again
+        pipeline_metrics.count('repaired files parsed again')
+        with profile_reader.map_file(filename) as data:
+            values = parse_mapped_profile(data, filename)
+    return values
+
+
+def repair_files(walk_dir: str, repairs: list, jobs: int = 1):
     files = get_files_to_process(walk_dir, '.csv')
+    process_files(partial(repair_file, repairs=repairs), files, jobs)
+
+
+def repair_file_and_convert_to_json(filename: str, repairs: list):
+    values = repair_file(filename, repairs, parse=True)
+    write_profile_json(filename + ".json", values)
 
+
+def repair_and_convert_to_json(walk_dir: str, repairs: list, jobs: int = 1, manifest: Manifest = None):
+    files = get_files_to_process(walk_dir, '.csv')
+    if manifest is not None:
+        # skip unchanged files with json already available
+        files = [filename for filename in files
+                 if manifest.get(filename, 'converted') is NOT_CACHED or not os.path.isfile(filename + '.json')]
+
+    process_files(partial(repair_file_and_convert_to_json, repairs=repairs), files, jobs)
+
+    if manifest is not None:
+        for filename in files:
+            manifest.update(filename, 'converted', True)  # file is stored as repaired
+
+
+class MultiPatternMatcher:
+    # Aho-Corasick automaton built once for all patterns, text is scanned once regardless of number of patterns
+    def __init__(self, patterns: list):
+        self.patterns = patterns
+        no_match = len(patterns)
+        self.goto = [{}]
+        self.first_pattern = [no_match]  # lowest index of pattern ending in given state (directly or via fail links)
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.first_pattern.append(no_match)
+                state = next_state
+            self.first_pattern[state] = min(self.first_pattern[state], index)
+
+        # breadth-first computation of fail links, shorter states are always finished first
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.first_pattern[state] = min(self.first_pattern[state], self.first_pattern[0])
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.first_pattern[next_state] = min(self.first_pattern[next_state],
+                                                     self.first_pattern[self.fail[next_state]])
+
+    def find_first(self, text: str):
+        # returns index of the first pattern (in the order of patterns) occurring anywhere in text, -1 if none
+        goto = self.goto
+        fail = self.fail
+        first_pattern = self.first_pattern
+        state = 0
+        best = first_pattern[0]
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if first_pattern[state] < best:
+                best = first_pattern[state]
+
+        return best if best < len(self.patterns) else -1
+
+
+def repair_missing_underscores(lines: list, correct_ops_names: list, matcher: MultiPatternMatcher):
+    lines_corrected = []
+    for line in lines:
+        line_corrected = line
+        if line.find('method name:;') != -1:
+            line_updated = False
+            # two specifically known issues
+            if line.find('TYPE_EC_FP PRIVATE LENGTH_EC_FP') != -1:
+                line_corrected = line.replace('TYPE_EC_FP PRIVATE LENGTH_EC_FP', 'TYPE_EC_FP_PRIVATE LENGTH_EC_FP')
+                line_updated = True
+            if line.find('TYPE_DSA_PRIVATE LENGTH DSA_1024') != -1:
+                line_corrected = line.replace('TYPE_DSA_PRIVATE LENGTH DSA_1024', 'TYPE_DSA_PRIVATE LENGTH_DSA_1024')
+                line_updated = True
+
+            # all other potential issues against known-good template, first operation in template order wins
+            if not line_updated:
+                i = matcher.find_first(line)
+                if i != -1:
+                    name_no_underscore = matcher.patterns[i]
+                    pos = line.find(name_no_underscore)
+                    print('  ' + line)
+                    pre_part = line[0:pos]
+                    post_part = line[pos + len(name_no_underscore):]
+                    line_corrected = pre_part + correct_ops_names[i].strip() + post_part
+        lines_corrected.append(line_corrected)
+
+    return lines_corrected
+
+
+def get_missing_underscores_repair(correct_ops_names: list):
     # create list of operations without underscores
     correct_ops_names_no_underscore = []
     for item in correct_ops_names:
         correct_ops_names_no_underscore.append(item.replace('_', ' ').strip())
 
-    for filename in files:
-        print(filename)
-
-        change_found = False
-        with open(filename) as f:
-            values = {}
-            lines = f.readlines()
-            lines_corrected = []
-            for line in lines:
-                i = 0
-                line_corrected = line
-                if line.find('method name:;') != -1:
-                    line_updated = False
-                    # two specifically known issues
-                    if line.find('TYPE_EC_FP PRIVATE LENGTH_EC_FP') != -1:
-                        line_corrected = line.replace('TYPE_EC_FP PRIVATE LENGTH_EC_FP', 'TYPE_EC_FP_PRIVATE LENGTH_EC_FP')
-                        line_updated = change_found = True
-                    if line.find('TYPE_DSA_PRIVATE LENGTH DSA_1024') != -1:
-                        line_corrected = line.replace('TYPE_DSA_PRIVATE LENGTH DSA_1024', 'TYPE_DSA_PRIVATE LENGTH_DSA_1024')
-                        line_updated = change_found = True
-
-                    # all other potential issues against known-good template
-                    if not line_updated:
-                        while i < len(correct_ops_names_no_underscore):
-                            pos = line.find(correct_ops_names_no_underscore[i])
-                            if pos != -1:
-                                print('  ' + line)
-                                pre_part = line[0:pos]
-                                post_part = line[pos + len(correct_ops_names_no_underscore[i]):]
-                                line_corrected = pre_part + correct_ops_names[i].strip() + post_part
-                                change_found = True
-                                break
-                            i = i + 1
-                lines_corrected.append(line_corrected)
-
-            if change_found:
-                with open(filename, 'w') as f_write:
-                    f_write.writelines(lines_corrected)
-
-
-def fix_missing_variable_data_lengths(walk_dir: str):
-    files = get_files_to_process(walk_dir, '.csv')
-
-    for filename in files:
-        print(filename)
-
-        change_found = False
-        with open(filename) as f:
-            values = {}
-            lines = f.readlines()
-            lines_corrected = []
-            index = 0
-            while index < len(lines):
-                line = lines[index]
-                i = 0
-                line_corrected = line
-                if line.find('method name:;') != -1:
-                    if line.rstrip().endswith('()'):  # add data length only to the measurements where it is missing
-                        # Option 1: look ahead and extract length from measurement config
-                        config_line = lines[index + 1]
-                        if config_line.find('measurement config:') == -1:
-                            print('ERROR: missing measurement config on line ' + str(index + 1))
+    return partial(repair_missing_underscores, correct_ops_names=correct_ops_names,
+                   matcher=MultiPatternMatcher(correct_ops_names_no_underscore))
+
+
+def fix_missing_underscores(walk_dir: str, correct_ops_names: list, jobs: int = 1):
+    repair_files(walk_dir, [get_missing_underscores_repair(correct_ops_names)], jobs)
+
+
+def repair_missing_variable_data_lengths(lines: list):
+    lines_corrected = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        line_corrected = line
+        if line.find('method name:;') != -1:
+            if line.rstrip().endswith('()'):  # add data length only to the measurements where it is missing
+                # Option 1: look ahead and extract length from measurement config
+                config_line = lines[index + 1]
+                if config_line.find('measurement config:') == -1:
+                    print('ERROR: missing measurement config after ' + line.strip())
+                else:
+                    # measurement config:;appletPrepareINS;34;appletMeasureINS;41;config;00 15 00 02 ff ff ff ff ff ff 00 06 00 10 ff ff ff ff 00 05 00 01
+                    pos = config_line.find(';config;') + 44  # jump to payload with data length
+                    data_len_chars = config_line[pos: pos + 5].replace(' ', '')
+                    data_len = int(data_len_chars, 16)
+                    data_len_verif = 0
+                    # do sanity check, data_len shall be 16, 32, 64, 128, 256 or 512 or not higher than 512
+                    if data_len not in [16, 32, 64, 128, 256, 512]:
+                    #if data_len > 512:
+                        print('WARNING: unexpected variable data length ' + str(data_len))
+                    else:
+                        # verify against 'data length' item in 'operation info:' (if available)
+                        info_line = lines[index + 6]
+                        if info_line.find('operation info:') != -1:
+                            # operation info:;data length;16;total iterations;250;total invocations;250;
+                            # operation info:;data length;-1;total iterations;250;total invocations;250;
+                            items = info_line.split(';')
+                            data_len_verif = int(items[2])
+
+                        if data_len_verif == 0 or data_len == data_len_verif:
+                            line_corrected = '{};{};\n'.format(line.strip(), data_len)
                         else:
-                            # measurement config:;appletPrepareINS;34;appletMeasureINS;41;config;00 15 00 02 ff ff ff ff ff ff 00 06 00 10 ff ff ff ff 00 05 00 01
-                            pos = config_line.find(';config;') + 44  # jump to payload with data length
-                            data_len_chars = config_line[pos: pos + 5].replace(' ', '')
-                            data_len = int(data_len_chars, 16)
-                            data_len_verif = 0
-                            # do sanity check, data_len shall be 16, 32, 64, 128, 256 or 512 or not higher than 512
-                            if data_len not in [16, 32, 64, 128, 256, 512]:
-                            #if data_len > 512:
-                                print('WARNING: unexpected variable data length ' + str(data_len))
-                            else:
-                                # verify against 'data length' item in 'operation info:' (if available)
-                                info_line = lines[index + 6]
-                                if info_line.find('operation info:') != -1:
-                                    # operation info:;data length;16;total iterations;250;total invocations;250;
-                                    # operation info:;data length;-1;total iterations;250;total invocations;250;
-                                    items = info_line.split(';')
-                                    data_len_verif = int(items[2])
-
-                                if data_len_verif == 0 or data_len == data_len_verif:
-                                    line_corrected = '{};{};\n'.format(line.strip(), data_len)
-                                    change_found = True
-                                else:
-                                    print('ERROR: mismatch in extracted data lengths ' + str(data_len) + ' vs. ' + str(data_len_verif))
-
-                lines_corrected.append(line_corrected)
-                index = index + 1
-
-            if change_found:
-                with open(filename, 'w') as f_write:
-                    f_write.writelines(lines_corrected)
-
-
-def fix_error_codes(walk_dir: str):
-    files = get_files_to_process(walk_dir, '.csv')
+                            print('ERROR: mismatch in extracted data lengths ' + str(data_len) + ' vs. ' + str(data_len_verif))
+
+        lines_corrected.append(line_corrected)
+        index = index + 1
+
+    return lines_corrected
+
 
-    for filename in files:
-        print(filename)
+def fix_missing_variable_data_lengths(walk_dir: str, jobs: int = 1):
+    repair_files(walk_dir, [repair_missing_variable_data_lengths], jobs)
 
-        change_found = False
-        with open(filename) as f:
-            lines = f.readlines()
-            lines_corrected = []
-            index = 0
-            while index < len(lines):
-                line = lines[index]
-                i = 0
-                line_corrected = line
-                if line.find('UNKONWN_ERROR-card_has_return_value') != -1:
-                    pos = line.find('UNKONWN_ERROR-card_has_return_value') + len('UNKONWN_ERROR-card_has_return_value') + 1
-                    error_code = line[pos:]
-                    error_code = error_code.strip()
 
-                    line_corrected = CARD_EXCEPTION_TO_STRING.get(error_code, error_code) + ' (' + error_code + ')\n'
-                    change_found = True
+def repair_error_codes(lines: list):
+    lines_corrected = []
+    for line in lines:
+        line_corrected = line
+        if line.find('UNKONWN_ERROR-card_has_return_value') != -1:
+            pos = line.find('UNKONWN_ERROR-card_has_return_value') + len('UNKONWN_ERROR-card_has_return_value') + 1
+            error_code = line[pos:]
+            error_code = error_code.strip()
 
-                lines_corrected.append(line_corrected)
-                index = index + 1
+            line_corrected = CARD_EXCEPTION_TO_STRING.get(error_code, error_code) + ' (' + error_code + ')\n'
 
-            if change_found:
-                with open(filename, 'w') as f_write:
-                    f_write.writelines(lines_corrected)
+        lines_corrected.append(line_corrected)
 
+    return lines_corrected
 
-def compute_stats(walk_dir: str):
-    stats = {}
+
+def fix_error_codes(walk_dir: str, jobs: int = 1):
+    repair_files(walk_dir, [repair_error_codes], jobs)
+
+
+def count_operations(filename: str):
+    # number of occurrences of all operations and of their statuses (OK, NO_SUCH_ALGORITHM, exceptions...)
+    stats = Counter()
+    status_stats = {}
+    index = load_operations_index(filename)
+    if index is None:
+        return stats, status_stats
+
+    for _, ops, status, *_ in iterate_operations_index(index):
+        stats[ops] += 1
+        op_status_stats = status_stats.setdefault(ops, {})
+        status = status if status is not None else 'MISSING'
+        op_status_stats[status] = op_status_stats.get(status, 0) + 1
+
+    return stats, status_stats
+
+
+def compute_stats(walk_dir: str, jobs: int = 1, manifest: Manifest = None):
+    stats = Counter()
+    status_stats = {}
 
     files = get_files_to_process(walk_dir, '.json')
-    for filename in files:
-        with open(filename) as json_file:
-            measurements = json.load(json_file)
-
-            # find all properly measured operations
-            msr = measurements['Measurements'];
-            for category in msr:
-                for ops in msr[category].keys():
-                    if ops not in stats:
-                        stats[ops] = 0
-                    stats[ops] = stats[ops] + 1
+    # partial counters are merged in the order of files to keep the order of equally frequent operations stable
+    for file_stats, file_status_stats in process_files_cached(count_operations, files, jobs, manifest, 'operations count'):
+        stats.update(file_stats)
+        for ops, op_status_stats in file_status_stats.items():
+            status_stats.setdefault(ops, Counter()).update(op_status_stats)
 
     stats_sorted = dict(sorted(stats.items(), key=lambda item: item[1]))
     with open("stats.json", "w") as write_file:
         json.dump(stats_sorted, write_file, indent=2, sort_keys=False)
 
+    # statuses of operations in the same order, most frequent status first
+    status_stats_sorted = {ops: dict(status_stats[ops].most_common()) for ops in stats_sorted}
+    with open("stats_status.json", "w") as write_file:
+        json.dump(status_stats_sorted, write_file, indent=2, sort_keys=False)
+
+
+class OperationIndex:
+    # inverted index over all cards: operation (method name without data length) -> measurements on cards
+    COLUMNS = ['card', 'file', 'category', 'status', 'data length', 'avg op', 'min op', 'max op']
+
+    def __init__(self, operations: dict):
+        self.operations = operations  # operation -> list of rows with COLUMNS
+
+    @classmethod
+    def load(cls, file_name: str):
+        with open(file_name) as f:
+            return cls(json.load(f)['operations'])
+
+    def save(self, file_name: str):
+        write_lines_atomic(file_name, [json.dumps({'columns': self.COLUMNS, 'operations': self.operations})])
+
+    def find_operations(self, text: str):
+        # names of all indexed operations containing given text
+        return sorted(operation for operation in self.operations if text in operation)
+
+    def query(self, operation: str, status: str = None, data_length: int = None, sort_by: str = 'avg op'):
+        # measurements of operation on all cards as dicts with COLUMNS, optionally filtered by status and data length,
+        # sorted by given column (rows without the value are last)
+        rows = [dict(zip(self.COLUMNS, row)) for row in self.operations.get(operation, [])]
+        rows = [row for row in rows if (status is None or row['status'] == status) and
+                (data_length is None or row['data length'] == data_length)]
+        rows.sort(key=lambda row: (row[sort_by] is None, row[sort_by] if row[sort_by] is not None else 0))
+        return rows
+
+
+def build_operation_index(walk_dir: str, jobs: int = 1):
+    # cross-card index built from the sidecar indexes written during the conversion
+    files = get_files_to_process(walk_dir, '.json')
+    operations = {}
+    for filename, index in zip(files, process_files(load_operations_index, files, jobs)):
+        if index is None:
+            continue
+        card_name = index['Card name'] if index['Card name'] is not None else os.path.basename(filename)
+        path = os.path.relpath(filename, walk_dir)
+        for category, method_name, status, data_length, avg_op, min_op, max_op in iterate_operations_index(index):
+            operation = split_method_name(method_name)[0]
+            operations.setdefault(operation, []).append([card_name, path, category, status, data_length,
+                                                         avg_op, min_op, max_op])
+
+    operation_index = OperationIndex(operations)
+    operation_index.save(os.path.join(walk_dir, OPERATION_INDEX_FILE_NAME))
+    return operation_index
+
+
+def parse_measured_values(value: str):
+    # '0.52;0.61;0.55' -> [0.52, 0.61, 0.55], items which are not numbers (e.g., CHECK) are skipped
+    values = []
+    for item in value.split(';'):
+        try:
+            values.append(float(item))
+        except ValueError:
+            pass
+    return values
+
+
+def parse_labeled_values(value: str):
+    # 'avg op:;0.52;min op:;0.50;max op:;0.61;;CHECK' -> {'avg op': 0.52, 'min op': 0.50, 'max op': 0.61}
+    items = value.split(';')
+    labeled_values = {}
+    for label, item in zip(items, items[1:]):
+        if label.endswith(':'):
+            try:
+                labeled_values[label[:-1]] = float(item)
+            except ValueError:
+                pass
+    return labeled_values
+
+
+def parse_operation_info(value: str):
+    # 'data length;16;total iterations;250;total invocations;250' -> {'data length': 16, 'total iterations': 250, ...}
+    items = value.split(';')
+    operation_info = {}
+    for label, item in zip(items[0::2], items[1::2]):
+        try:
+            operation_info[label] = int(item)
+        except ValueError:
+            pass
+    return operation_info
+
+
+def split_method_name(method_name: str):
+    # 'ALG_SHA MessageDigest_doFinal();16;' -> ('ALG_SHA MessageDigest_doFinal()', 16), no data length -> -1
+    if method_name.endswith(';'):
+        name, _, data_length = method_name.rstrip(';').rpartition(';')
+        if data_length.isdigit():
+            return name, int(data_length)
+    return method_name, -1
+
+
+def compute_op_stats(records: list):
+    # recompute avg/min/max op and CHECK flag from raw measurements of all records at once, same way as
+    # PerformanceTesting.perftest_measure does (raw value is time of all repeated operations in one measurement)
+    import numpy as np
+
+    lengths = np.array([len(record['raw']) for record in records], dtype=np.int64)
+    iterations = np.array([record['total iterations'] for record in records], dtype=np.float64)
+    avg_op = np.zeros(len(records))
+    min_op = np.zeros(len(records))
+    max_op = np.zeros(len(records))
+
+    measured = lengths > 0
+    if np.any(measured):
+        raw = np.concatenate([record['raw'] for record in records])
+        offsets = (np.cumsum(lengths) - lengths)[measured]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            repeats = iterations[measured] / lengths[measured]  # operations repeated in a single measurement
+            valid = iterations[measured] > 0
+            avg_op[measured] = np.where(valid, np.add.reduceat(raw, offsets) / iterations[measured], 0)
+            min_op[measured] = np.where(valid, np.minimum.reduceat(raw, offsets) / repeats, 0)
+            max_op[measured] = np.where(valid, np.maximum.reduceat(raw, offsets) / repeats, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        check = (min_op / avg_op < 1 - CHECK_TOLERANCE) | (max_op / avg_op > 1 + CHECK_TOLERANCE)
+    check &= measured
+
+    for index, record in enumerate(records):
+        record['computed avg op'] = float(avg_op[index])
+        record['computed min op'] = float(min_op[index])
+        record['computed max op'] = float(max_op[index])
+        record['check'] = bool(check[index])
+
+
+def parse_typed_measurement(method_name: str, item: dict):
+    import numpy as np
+
+    method, data_length = split_method_name(method_name)
+    operation_info = parse_operation_info(item.get('operation info:', ''))
+    op_stats = parse_labeled_values(item.get('operation stats (ms/op):', ''))
+    return {'method': method,
+            'status': item.get('status', ''),
+            'data length': operation_info.get('data length', data_length),
+            'total iterations': operation_info.get('total iterations', 0),
+            'total invocations': operation_info.get('total invocations', 0),
+            'baseline': np.array(parse_measured_values(item.get('baseline measurements (ms):', '')), dtype=np.float64),
+            'raw': np.array(parse_measured_values(item.get('operation raw measurements (ms):', '')), dtype=np.float64),
+            'avg op': op_stats.get('avg op', float('nan')),
+            'min op': op_stats.get('min op', float('nan')),
+            'max op': op_stats.get('max op', float('nan'))}
+
+
+def parse_typed_measurements(measurements: dict):
+    # typed counterpart of values['Measurements'] with the same category/method name keys
+    typed_measurements = {}
+    records = []
+    for category, items in measurements.items():
+        typed_measurements[category] = {}
+        for method_name, item in items.items():
+            record = parse_typed_measurement(method_name, item)
+            typed_measurements[category][method_name] = record
+            records.append(record)
+
+    compute_op_stats(records)
+    return typed_measurements
+
+
+def collect_measurement_rows(filename: str):
+    with open(filename) as json_file:
+        measurements = json.load(json_file)
+    if not is_profile_json(measurements):
+        return []
+
+    card_name = measurements['Info'].get('Card name', os.path.basename(filename))
+    rows = []
+    for category, items in measurements['Measurements'].items():
+        for method_name, item in items.items():
+            method, data_length = split_method_name(method_name)
+            operation_info = parse_operation_info(item.get('operation info:', ''))
+            data_length = operation_info.get('data length', data_length)
+            op_stats = parse_labeled_values(item.get('operation stats (ms/op):', ''))
+            rows.append((card_name, category, method_name, method, data_length, item.get('status', ''),
+                         op_stats.get('avg op', float('nan')), op_stats.get('min op', float('nan')),
+                         op_stats.get('max op', float('nan')), operation_info.get('total iterations', 0),
+                         parse_measured_values(item.get('baseline measurements (ms):', '')),
+                         parse_measured_values(item.get('operation raw measurements (ms):', ''))))
+    return rows
+
+
+def build_measurement_table(walk_dir: str, jobs: int = 1):
+    # single columnar table with one row per (card, category, method, data length) as NumPy columns
+    # baseline and raw measurements of row i are values[offsets[i]:offsets[i + 1]]
+    import numpy as np  # numpy is required only for the columnar output
+
+    files = get_files_to_process(walk_dir, '.json')
+    files_rows = process_files(collect_measurement_rows, files, jobs)
+    rows = [row for file_rows in files_rows for row in file_rows]
+    profile = [os.path.relpath(filename, walk_dir) for filename, file_rows in zip(files, files_rows) for _ in file_rows]
+    card, category, operation, method, data_length, status, avg_op, min_op, max_op, total_iterations, baseline, raw = \
+        zip(*rows) if len(rows) > 0 else [()] * 12
+
+    return {'card': np.array(card, dtype=np.str_),
+            'profile': np.array(profile, dtype=np.str_),  # profile JSON file, relative to walk_dir
+            'category': np.array(category, dtype=np.str_),
+            'operation': np.array(operation, dtype=np.str_),  # method name key as in the profile JSON
+            'method': np.array(method, dtype=np.str_),
+            'data_length': np.array(data_length, dtype=np.int32),
+            'status': np.array(status, dtype=np.str_),
+            'avg_op': np.array(avg_op, dtype=np.float64),
+            'min_op': np.array(min_op, dtype=np.float64),
+            'max_op': np.array(max_op, dtype=np.float64),
+            'total_iterations': np.array(total_iterations, dtype=np.int64),
+            'baseline_offsets': np.cumsum([0] + [len(values) for values in baseline], dtype=np.int64),
+            'baseline': np.array([value for values in baseline for value in values], dtype=np.float64),
+            'raw_offsets': np.cumsum([0] + [len(values) for values in raw], dtype=np.int64),
+            'raw': np.array([value for values in raw for value in values], dtype=np.float64)}
+
+
+def export_measurement_table(walk_dir: str, output_file: str, jobs: int = 1):
+    # table of build_measurement_table stored as NumPy .npz, the table is returned for further stages
+    import numpy as np
+
+    table = build_measurement_table(walk_dir, jobs)
+    np.savez_compressed(output_file, **table)
+    return table
+
+
+def load_measurement_table(file_name: str):
+    import numpy as np
+
+    with np.load(file_name) as table:
+        return {column: table[column] for column in table.files}
+
 
 def create_sorted_already_measured_list(directory: str):
     with open(directory + 'template____PERFORMANCE_SYMMETRIC_ASYMMETRIC_DATAFIXED__already_measured.list') as f:
@@ -373,23 +1147,131 @@ def create_sorted_already_measured_list(directory: str):
     return all_to_measure_ops
 
 
-@click.command()
-@click.argument("directory", required=True, type=str)
-@click.option("--output-dir", "output_dir", type=str,  help="Base path for output.")
-def main(directory: str, output_dir: str):
-    all_to_measure_ops = create_sorted_already_measured_list(directory)
+class DefaultCommandGroup(click.Group):
+    # 'process_results.py DIRECTORY [OPTIONS]' runs the processing command, other commands are selected by name
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args.insert(0, 'process')
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup)
+def cli():
+    pass
+
+
+def process_directory(directory: str, jobs: int = 1, incremental: bool = False, columnar_output: str = None,
+                      remeasure_plan_dir: str = None, scalability_output: str = None):
+    with pipeline_metrics.stage('templates'):
+        all_to_measure_ops = create_sorted_already_measured_list(directory)
+
+    manifest = None
+    if incremental:
+        # repairs depend on the template, so the manifest is valid only for the same template
+        templates_hash = hashlib.sha256(''.join(all_to_measure_ops).encode()).hexdigest()
+        manifest = Manifest(directory, '{}-{}'.format(PIPELINE_VERSION, templates_hash[:16]))
+
+    repairs = [repair_error_codes,  # error codes not translated into human readable string _
+               get_missing_underscores_repair(all_to_measure_ops),  # some file had incorrect naming for measured values without _
+               repair_missing_variable_data_lengths]
 
-    fix_error_codes(directory)  # error codes not translated into human readable string _
+    with pipeline_metrics.stage('repair_and_convert_to_json'):
+        repair_and_convert_to_json(directory, repairs, jobs, manifest)  # fix known issues in csv and convert it to json
 
-    fix_missing_underscores(directory, all_to_measure_ops)  # some file had incorrect naming for measured values without _
-    fix_missing_variable_data_lengths(directory)
+    with pipeline_metrics.stage('prepare_missing_measurements'):
+        prepare_missing_measurements(directory, jobs, manifest)  # prepare *__already_measured.list files to collect missing measurements
 
-    convert_to_json(directory)  # from csv to json
+    with pipeline_metrics.stage('build_operation_index'):
+        build_operation_index(directory, jobs)  # cross-card index of operations, see query command
 
-    prepare_missing_measurements(directory)  # prepare *__already_measured.list files to collect missing measurements
+    with pipeline_metrics.stage('compute_stats'):
+        compute_stats(directory, jobs, manifest)
 
-    compute_stats(directory)
+    # columnar table is built once for all stages using it
+    table = None
+    if columnar_output:
+        with pipeline_metrics.stage('export_measurement_table'):
+            table = export_measurement_table(directory, columnar_output, jobs)
+    elif remeasure_plan_dir or scalability_output:
+        with pipeline_metrics.stage('build_measurement_table'):
+            table = build_measurement_table(directory, jobs)
+
+    if remeasure_plan_dir:
+        import remeasure_plan  # imports this module, numpy is required only for the plans
+        with pipeline_metrics.stage('remeasure_plan'):
+            # planned operations are removed from *__already_measured.list written by prepare_missing_measurements
+            remeasure_plan.plan_directory(directory, remeasure_plan_dir, table)
+
+    if scalability_output:
+        import scalability
+        with pipeline_metrics.stage('scalability'):
+            scalability.export_curves(scalability.build_curves(table), scalability_output)
+
+    if manifest is not None:
+        manifest.save()
+
+
+@cli.command("process")
+@click.argument("directory", required=True, type=str)
+@click.option("--output-dir", "output_dir", type=str,  help="Base path for output.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used to process the files in parallel.")
+@click.option("--incremental", "incremental", is_flag=True, default=False,
+              help="Process only new or changed files, results for the others are taken from the manifest.")
+@click.option("--columnar-output", "columnar_output", type=str,
+              help="Store all measurements also into a single columnar table (NumPy .npz) at given path.")
+@click.option("--remeasure-plan", "remeasure_plan_dir", type=str,
+              help="Plan re-measurement of missing, failed and noisy operations of every card into given directory "
+                   "(see remeasure_plan), planned operations are removed from the already measured lists.")
+@click.option("--scalability-output", "scalability_output", type=str,
+              help="Fit time vs. data length curves of every profile and store them at given path (NumPy .npz, see "
+                   "scalability).")
+@click.option("--metrics-output", "metrics_output", type=str,
+              help="Store time and counters of every stage and file at given path (JSON, or Prometheus text for .prom).")
+@click.option("--metrics-format", "metrics_format", type=click.Choice(['json', 'prometheus']),
+              help="Format of the metrics, given by extension of --metrics-output if not set.")
+@click.option("--profile", "profiler", type=click.Choice(['cprofile', 'pyinstrument']),
+              help="Profile the processing (main process only, use --jobs 1 to include processing of the files).")
+@click.option("--profile-output", "profile_output", type=str,
+              help="Output of the profiler [default: process_results.prof for cprofile, process_results.html for "
+                   "pyinstrument].")
+def main(directory: str, output_dir: str, jobs: int, incremental: bool, columnar_output: str, remeasure_plan_dir: str,
+         scalability_output: str, metrics_output: str, metrics_format: str, profiler: str, profile_output: str):
+    if metrics_output:
+        pipeline_metrics.start_collecting()
+    if profiler and not profile_output:
+        profile_output = 'process_results.prof' if profiler == 'cprofile' else 'process_results.html'
+
+    try:
+        with pipeline_metrics.profile(profiler, profile_output):
+            process_directory(directory, jobs, incremental, columnar_output, remeasure_plan_dir, scalability_output)
+    except ImportError as e:
+        if profiler == 'pyinstrument' and e.name == 'pyinstrument':
+            raise click.ClickException('pyinstrument is not installed (pip install pyinstrument)')
+        raise
+
+    if metrics_output:
+        report = pipeline_metrics.write_report(metrics_output, metrics_format)
+        print('Processed in {:.2f} s, metrics stored in {}'.format(report['total seconds'], metrics_output))
+
+
+@cli.command()
+@click.argument("directory", required=True, type=str)
+@click.argument("operation", required=True, type=str)
+@click.option("--status", "status", type=str, help="Only measurements with given status (e.g., OK).")
+@click.option("--data-length", "data_length", type=int, help="Only measurements with given data length.")
+@click.option("--sort-by", "sort_by", type=click.Choice(['avg op', 'min op', 'max op', 'card', 'data length']),
+              default='avg op', show_default=True)
+def query(directory: str, operation: str, status: str, data_length: int, sort_by: str):
+    """Which cards measured OPERATION and how fast, from the index built by processing of DIRECTORY."""
+    operation_index = OperationIndex.load(os.path.join(directory, OPERATION_INDEX_FILE_NAME))
+    operations = [operation] if operation in operation_index.operations else operation_index.find_operations(operation)
+    for name in operations:
+        print(name)
+        for row in operation_index.query(name, status, data_length, sort_by):
+            print('  {};{};{};{};{};{}'.format(row['card'], row['status'], row['data length'], row['avg op'],
+                                               row['min op'], row['max op']))
 
 
 if __name__ == "__main__":
-    main()
+    cli()
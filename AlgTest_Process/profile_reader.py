@@ -0,0 +1,207 @@
+# Memory-mapped reading of profile CSVs. The file is scanned as bytes for the lines of interest and only the spans with
+# them are decoded (in chunks of at most about CHUNK_SIZE bytes), so memory used for a profile does not grow with the
+# file size (e.g., for concatenated outputs of several measurement sessions). Decoded lines are the same as lines of the
+# file opened in text mode (default encoding, universal newlines).
+import hashlib
+import locale
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from itertools import chain
+
+ENCODING = locale.getpreferredencoding(False)  # default encoding of open()
+CHUNK_SIZE = 1 << 20  # longer spans are decoded in chunks of whole lines
+EMPTY_LINE = re.compile(rb'\n\r?\n')
+LINE_END = re.compile(rb'\r\n?|\n')  # line ends as split by decode_lines
+LONE_CARRIAGE_RETURN = re.compile(rb'\r(?!\n)')
+
+
+@contextmanager
+def map_file(filename: str):
+    # read-only memory map of the file (empty bytes for empty file, which can not be mapped)
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def hash_file(filename: str):
+    # SHA-256 of the file content, read in chunks (also used to detect unchanged files with a new mtime)
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_line_end(data, position: int):
+    # offset after the end of line containing position
+    newline = data.find(b'\n', position)
+    return len(data) if newline == -1 else newline + 1
+
+
+def decode_lines(data, start: int, end: int, keepends: bool = False):
+    """
+    Decodes lines of data[start:end], start must be at the beginning of a line
+    @param keepends: keep '\n' at the end of lines (as readlines() does), line ends are stripped otherwise
+    """
+    while start < end:
+        stop = end
+        if end - start > CHUNK_SIZE:
+            newline = data.rfind(b'\n', start, start + CHUNK_SIZE)
+            stop = newline + 1 if newline != -1 else min(get_line_end(data, start + CHUNK_SIZE), end)
+        text = data[start:stop].decode(ENCODING).replace('\r\n', '\n').replace('\r', '\n')
+        lines = text.split('\n')
+        last_line = lines.pop()  # empty if the chunk ends with a line end
+        if keepends:
+            lines = [line + '\n' for line in lines]
+        yield from lines
+        if last_line:
+            yield last_line
+        start = stop
+
+
+def get_line_offsets(data, start: int, end: int):
+    # offsets of the lines of data[start:end] in the order of decode_lines, followed by end
+    offsets = [start] + [match.end() for match in LINE_END.finditer(data, start, end)]
+    if offsets[-1] != end:
+        offsets.append(end)
+    return offsets
+
+
+def get_last_lines_start(data, count: int):
+    # offset of the last count lines of data (0 if there are less), lines are found by scanning from the end
+    start = len(data) - 1 if data[-1:] == b'\n' else len(data)
+    for _ in range(count):
+        start = data.rfind(b'\n', 0, start)
+        if start == -1:
+            break
+    return start + 1
+
+
+def find_line_starts(data, strings: list):
+    """
+    Finds lines beginning with any of strings, searched as '\n' + string (much faster than a regular expression anchored
+    at line starts)
+    @returns generator of (offset of the line, the longest of strings the line begins with) in the order of data
+    """
+    strings = sorted(set(strings), key=len, reverse=True)
+    for string in strings:
+        if data[:len(string)] == string:
+            yield 0, string
+            break
+    pattern = re.compile(b'\n(' + b'|'.join(re.escape(string) for string in strings) + b')')
+    for match in pattern.finditer(data):
+        yield match.start() + 1, match.group(1)
+
+
+def merge_span(spans: list, start: int, end: int):
+    # spans are added in the order of start, overlapping spans are merged
+    if spans and start < spans[-1][1]:
+        spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+    else:
+        spans.append((start, end))
+
+
+def find_section_spans(data, start_strings: list, blocks: dict):
+    """
+    Finds parts of data with sections, each part starts at the beginning of a line
+    @param start_strings: section starts with a line beginning with a start string and ends with an empty line
+    @param blocks: hash map of start string -> end string, block starts with a line beginning with the start string and
+                   ends with a line beginning with the end string, blocks without end are not included
+    @returns sorted list of non-overlapping (start, end) byte offsets
+    """
+    start_strings = [string.encode(ENCODING) for string in start_strings]
+    blocks = {start.encode(ENCODING): end.encode(ENCODING) for start, end in blocks.items()}
+    strings = start_strings + list(blocks)
+    # all strings the line begins with, given the longest one
+    prefixes = {string: [prefix for prefix in strings if string.startswith(prefix)] for string in strings}
+    spans = []
+    end_lines = {}  # end string -> offset of the last found end line (-1 if there is none), valid for later starts
+    for start, string in find_line_starts(data, strings):
+        end = start
+        for prefix in prefixes[string]:
+            if prefix in blocks:
+                end_string = blocks[prefix]
+                if data[start:start + len(end_string)] == end_string:
+                    continue
+                end_line = end_lines.get(end_string)
+                if end_line is None or -1 < end_line < start:
+                    end_line = end_lines[end_string] = data.find(b'\n' + end_string, start)
+                if end_line != -1:
+                    end = max(end, get_line_end(data, end_line + 1))
+            else:
+                empty_line = EMPTY_LINE.search(data, start)
+                end = max(end, empty_line.end() if empty_line is not None else len(data))
+        if end > start:
+            merge_span(spans, start, end)
+    return spans
+
+
+def find_marked_chunks(data, markers: list, lookahead: int, chunk_size: int = CHUNK_SIZE):
+    """
+    Splits data into chunks of whole lines (of about chunk_size bytes), lines following a line containing any of the
+    markers (up to lookahead lines) are always in the same chunk as the marked line
+    @returns list of (start, end) byte offsets of the chunks with at least one marked line
+    """
+    markers = [marker.encode(ENCODING) for marker in markers]
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = get_line_end(data, min(start + chunk_size, len(data)) - 1)
+        while end < len(data):
+            # the last marked line before the end, if it is closer than lookahead lines, the end is moved after them
+            lookahead_start = end
+            for _ in range(lookahead):
+                lookahead_start = max(start, data.rfind(b'\n', start, lookahead_start - 1) + 1)
+                if lookahead_start == start:
+                    break
+            marked = max(data.rfind(marker, lookahead_start, end) for marker in markers)
+            if marked == -1:
+                break
+            end = get_line_end(data, marked)
+            for _ in range(lookahead):
+                end = get_line_end(data, end)
+
+        if any(data.find(marker, start, end) != -1 for marker in markers):
+            chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def encode_lines(lines: list, data, start: int, end: int):
+    # lines replacing data[start:end], with the same line ends as the replaced part
+    text = ''.join(lines)
+    if data.find(b'\r\n', start, end) != -1:
+        text = text.replace('\n', '\r\n')
+    return text.encode(ENCODING)
+
+
+def write_replaced(data, filename: str, replacements):
+    """
+    Writes data with replaced parts into a temporary file next to filename, unchanged parts are written directly from
+    the mapped data. The caller replaces filename by the temporary file after the data is unmapped.
+    @param replacements: iterable of (start, end, bytes) sorted by start, non-overlapping
+    @returns name of the temporary file, None if there is no replacement (nothing is written)
+    """
+    replacements = iter(replacements)
+    first = next(replacements, None)
+    if first is None:
+        return None
+
+    temp_file_name = filename + '.tmp'
+    try:
+        with open(temp_file_name, 'wb') as f, memoryview(data) as view:
+            position = 0
+            for start, end, replacement in chain([first], replacements):
+                f.write(view[position:start])
+                f.write(replacement)
+                position = end
+            f.write(view[position:])
+    except BaseException:
+        os.remove(temp_file_name)  # replacements failed, the file stays unchanged
+        raise
+    return temp_file_name
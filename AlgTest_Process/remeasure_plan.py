@@ -0,0 +1,329 @@
+# Prioritized re-measurement plan for every card, packed into measurement sessions with limited card time.
+# Operations are planned for every test type separately, operations measured with variable data (DATADEPEND) are keyed
+# by method name with data length ('name;16;'), but template lists contain only the method name.
+# Operations to (re-)measure on a card are
+#   missing - listed in template____..._already_measured.list file of the test type, but not found in any profile of
+#             the card, only for cards with measurements of the test type
+#   error   - found, but never measured correctly (see process_results.is_correctly_measured)
+#   noisy   - measured OK, but flagged noisy by robust_stats
+# Expected time of an operation on the card (sum of raw and baseline measurements) is taken from the card itself,
+# otherwise median over the most similar cards (see card_similarity), otherwise median over all cards, summed over all
+# data lengths of DATADEPEND operations.
+# Operations are ordered by reason (as above) and expected time (fastest first) and packed first-fit into sessions.
+# For every session, *_already_measured.list files with all other operations are written, so AlgTestJClient measures
+# only the operations of the session. Planned operations are also removed from the already measured list of the card
+# written by process_results.prepare_missing_measurements, so the client does not skip them when run without sessions.
+# process_results runs the planner after prepare_missing_measurements if given --remeasure-plan.
+import json
+import os
+import click
+import card_similarity
+import process_results
+import robust_stats
+
+TEST_TYPES = ['DATAFIXED', 'DATADEPEND']
+TEMPLATE_FILE_NAME = 'template____PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}__already_measured.list'
+SESSION_FILE_NAME = '{}____PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}__already_measured.session{}.list'
+PLAN_FILE_NAME = '{}__remeasure_plan.json'
+REASONS = ['missing', 'error', 'noisy']
+DEFAULT_OPERATION_TIME_MS = 10000  # expected time of operation never measured on any card
+DEFAULT_SESSION_BUDGET_S = 3600
+
+
+def load_templates(walk_dir: str):
+    """
+    @returns hash map of test type -> sorted list of all operations to measure
+    """
+    templates = {}
+    for test_type in TEST_TYPES:
+        with open(os.path.join(walk_dir, TEMPLATE_FILE_NAME.format(test_type))) as f:
+            templates[test_type] = sorted(line.rstrip('\n') for line in f if line.strip())
+    return templates
+
+
+def get_measurement_times(table: dict):
+    """
+    @returns on-card time (ms) of every row of the measurement table, NaN if not measured
+    """
+    import numpy as np
+
+    times = np.zeros(len(table['card']))
+    for column in ['raw', 'baseline']:
+        sums = np.concatenate([[0], np.cumsum(table[column])])
+        offsets = table[column + '_offsets']
+        times += sums[offsets[1:]] - sums[offsets[:-1]]
+    return np.where(np.diff(table['raw_offsets']) > 0, times, np.nan)
+
+
+def build_time_matrix(table: dict, cards: list, operations: list):
+    """
+    @returns matrix cards x operations with median on-card time of the operation on the card (ms), NaN if not measured
+    """
+    import numpy as np
+
+    times = get_measurement_times(table)
+    measured = np.isfinite(times)
+    card_index = np.searchsorted(cards, table['card'][measured])
+    operation_index = np.searchsorted(operations, table['operation'][measured])
+    keys = card_index * len(operations) + operation_index
+
+    # median of every (card, operation) from values sorted by key and time
+    order = np.lexsort((times[measured], keys))
+    keys, values = keys[order], times[measured][order]
+    unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    medians = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+    matrix = np.full((len(cards), len(operations)), np.nan)
+    matrix.flat[unique_keys] = medians
+    return matrix
+
+
+def estimate_times(time_matrix, similar_indices: list):
+    """
+    @param similar_indices: list of indices of similar cards for every card
+    @returns matrix cards x operations with expected on-card time (ms)
+    """
+    import warnings
+    import numpy as np
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN slices
+        all_cards = np.nanmedian(time_matrix, axis=0) if len(time_matrix) > 0 else np.full(time_matrix.shape[1], np.nan)
+        expected = time_matrix.copy()
+        for card, similar in enumerate(similar_indices):
+            if len(similar) > 0:
+                unknown = np.isnan(expected[card])
+                expected[card, unknown] = np.nanmedian(time_matrix[similar][:, unknown], axis=0)
+    expected = np.where(np.isnan(expected), all_cards, expected)
+    return np.where(np.isnan(expected), DEFAULT_OPERATION_TIME_MS, expected)
+
+
+def get_test_types(table: dict):
+    """
+    @returns test type (one of TEST_TYPES) of every row of the measurement table, DATADEPEND if the key of the operation
+             has data length
+    """
+    import numpy as np
+
+    return np.where(table['operation'] != table['method'], 'DATADEPEND', 'DATAFIXED')
+
+
+def select_rows(table: dict, test_types, test_type: str):
+    """
+    @returns hash map of columns card, operation (measured key), status and name (operation as listed in the template of
+             the test type) of the rows of the test type
+    """
+    selected = test_types == test_type
+    rows = {column: table[column][selected] for column in ['card', 'operation', 'status']}
+    rows['name'] = table['method' if test_type == 'DATADEPEND' else 'operation'][selected]
+    return rows
+
+
+def get_operation_times(expected, keys: list, rows: dict, operations: list):
+    """
+    @param expected: matrix cards x keys with expected time of every measured key (ms)
+    @param rows: rows of one test type (see select_rows)
+    @returns matrix cards x operations with expected time of the operation summed over all its keys (ms),
+             DEFAULT_OPERATION_TIME_MS if not measured on any card
+    """
+    import numpy as np
+
+    operation_keys, key_rows = np.unique(rows['operation'], return_index=True)
+    times = np.zeros((len(expected), len(operations)))
+    np.add.at(times.T, np.searchsorted(operations, rows['name'][key_rows]),
+              expected[:, np.searchsorted(keys, operation_keys)].T)
+    return np.where(np.isin(operations, rows['name']), times, DEFAULT_OPERATION_TIME_MS)
+
+
+def find_operations_to_measure(rows: dict, noisy, cards: list, operations: list, template_operations: list):
+    """
+    @param rows: rows of one test type (see select_rows)
+    @param operations: sorted list of names of all operations of the test type
+    @returns list of hash maps operation -> reason (one of REASONS) for every card
+    """
+    import numpy as np
+
+    status = rows['status']
+    # there are only a few distinct statuses, process_results decides which of them are correct
+    statuses, status_index = np.unique(status, return_inverse=True)
+    correct = np.array([process_results.is_correctly_measured(str(value)) for value in statuses],
+                       dtype=bool)[status_index.reshape(-1)]
+    noisy_ok = noisy & (status == 'OK')
+    card_index = np.searchsorted(cards, rows['card'])
+    keys, key_rows, key_index = np.unique(rows['operation'], return_index=True, return_inverse=True)
+
+    # the best measurement of the key on the card decides: 0 - correct, 1 - noisy, 2 - error, -1 - not measured
+    key_state = np.full((len(cards), len(keys)), 3, dtype=np.int8)
+    np.minimum.at(key_state, (card_index, key_index.reshape(-1)),
+                  np.where(correct & ~noisy_ok, 0, np.where(noisy_ok, 1, 2)))
+    key_state[key_state == 3] = -1
+    # the worst measured key (data length) decides for the operation, 3 - missing
+    state = np.full((len(cards), len(operations)), -1, dtype=np.int8)
+    np.maximum.at(state.T, np.searchsorted(operations, rows['name'][key_rows]), key_state.T)
+    state[state == -1] = 3
+
+    # operations of the template are missing only on cards with measurements of the test type
+    in_template = np.isin(operations, template_operations)
+    has_test_type = np.isin(np.arange(len(cards)), card_index)
+    reasons = {1: 'noisy', 2: 'error', 3: 'missing'}
+    to_measure = []
+    for card in range(len(cards)):
+        pending = (state[card] > 0) & ((state[card] < 3) | (in_template & has_test_type[card]))
+        to_measure.append({operations[index]: reasons[int(state[card, index])] for index in np.flatnonzero(pending)})
+    return to_measure
+
+
+def pack_sessions(operations: list, session_budget_ms: float):
+    """
+    First-fit packing of operations in given order, operation longer than the budget gets its own session
+    @param operations: list of (test type, operation, reason, expected time in ms) ordered by priority
+    @returns list of sessions, each a list of operations
+    """
+    sessions = []
+    remaining = []
+    for operation in operations:
+        expected_ms = operation[-1]
+        for index, session in enumerate(sessions):
+            if expected_ms <= remaining[index]:
+                session.append(operation)
+                remaining[index] -= expected_ms
+                break
+        else:
+            sessions.append([operation])
+            remaining.append(session_budget_ms - expected_ms)
+    return sessions
+
+
+def create_plans(table: dict, templates: dict, session_budget_ms: float, top_k: int = 5, noisy=None):
+    """
+    @param table: columnar measurement table (see process_results.build_measurement_table)
+    @param noisy: noisy flag for every row of the table, computed by robust_stats if not given
+    @returns hash map of card name -> list of sessions, each a list of (test type, operation, reason, expected time in
+             ms)
+    """
+    import numpy as np
+
+    if noisy is None:
+        noisy = robust_stats.compute_robust_stats(table)['noisy']
+    cards, _, support, log_time = card_similarity.build_feature_matrix(table)
+    keys = np.unique(table['operation']).tolist()
+
+    similar = card_similarity.find_similar_cards(cards, support, log_time, top_k)
+    similar_indices = [np.searchsorted(cards, [item['card'] for item in similar[card]]).astype(np.int64)
+                       for card in cards]
+    expected = estimate_times(build_time_matrix(table, cards, keys), similar_indices)
+
+    items = [[] for _ in cards]
+    test_types = get_test_types(table)
+    for test_type in TEST_TYPES:
+        rows = select_rows(table, test_types, test_type)
+        operations = np.union1d(np.unique(rows['name']), templates.get(test_type, [])).tolist()
+        operation_times = get_operation_times(expected, keys, rows, operations)
+        operation_index = {operation: index for index, operation in enumerate(operations)}
+        to_measure = find_operations_to_measure(rows, noisy[test_types == test_type], cards, operations,
+                                                templates.get(test_type, []))
+        for card in range(len(cards)):
+            items[card].extend((test_type, operation, reason, float(operation_times[card, operation_index[operation]]))
+                               for operation, reason in to_measure[card].items())
+
+    plans = {}
+    for card, card_items in enumerate(items):
+        card_items.sort(key=lambda item: (REASONS.index(item[2]), item[3], item[0], item[1]))
+        plans[cards[card]] = pack_sessions(card_items, session_budget_ms)
+    return plans
+
+
+def write_plans(plans: dict, templates: dict, output_dir: str):
+    # plan overview as JSON and already measured lists for every session of every card
+    os.makedirs(output_dir, exist_ok=True)
+    for card_name, sessions in plans.items():
+        card_file_name = card_name.replace(' ', '_')
+        plan = [{'session': number,
+                 'expected time (s)': sum(item[3] for item in session) / 1000,
+                 'operations': [{'test type': test_type, 'operation': operation, 'reason': reason,
+                                 'expected time (ms)': expected_ms}
+                                for test_type, operation, reason, expected_ms in session]}
+                for number, session in enumerate(sessions, start=1)]
+        with open(os.path.join(output_dir, PLAN_FILE_NAME.format(card_file_name)), 'w') as f:
+            json.dump(plan, f, indent=2)
+
+        for number, session in enumerate(sessions, start=1):
+            session_operations = set(item[:2] for item in session)
+            for test_type, operations in templates.items():
+                file_name = SESSION_FILE_NAME.format(card_file_name, test_type, number)
+                with open(os.path.join(output_dir, file_name), 'w') as f:
+                    f.writelines(operation + '\n' for operation in operations
+                                 if (test_type, operation) not in session_operations)
+
+
+def get_template_key(operation: str):
+    # (test type, operation as listed in the template) of the measured key (see get_test_types)
+    method, _ = process_results.split_method_name(operation)
+    return ('DATAFIXED', operation) if method == operation else ('DATADEPEND', method)
+
+
+def exclude_planned_operations(plans: dict, walk_dir: str):
+    """
+    Removes operations planned for re-measurement (e.g., noisy ones, which are measured correctly) from the already
+    measured lists of the cards (see process_results.prepare_missing_measurements)
+    @returns number of removed operations
+    """
+    removed = 0
+    for card_name, sessions in plans.items():
+        card_file_name = card_name.replace(' ', '_')
+        file_name = os.path.join(walk_dir, process_results.ALREADY_MEASURED_FILE_NAME.format(card_file_name))
+        if not os.path.isfile(file_name):
+            continue
+        planned = set(item[:2] for session in sessions for item in session)
+        with open(file_name) as f:
+            lines = f.readlines()
+        kept = [line for line in lines if get_template_key(line.rstrip('\n')) not in planned]
+        if len(kept) != len(lines):
+            process_results.write_lines_atomic(file_name, kept)
+            removed += len(lines) - len(kept)
+    return removed
+
+
+def plan_directory(directory: str, output_dir: str, table: dict,
+                   session_budget_ms: float = DEFAULT_SESSION_BUDGET_S * 1000, top_k: int = 5):
+    """
+    Plans re-measurement of all cards of the directory, writes the plans and session lists into output_dir and removes
+    the planned operations from the already measured lists in the directory
+    @param table: columnar measurement table of the profiles in the directory
+    @returns hash map of card name -> list of sessions (see create_plans)
+    """
+    templates = load_templates(directory)
+
+    plans = create_plans(table, templates, session_budget_ms, top_k)
+    write_plans(plans, templates, output_dir)
+    exclude_planned_operations(plans, directory)
+    return plans
+
+
+@click.command()
+@click.argument("directory", required=True, type=click.Path(exists=True, file_okay=False))
+@click.option("--table", "table_file", type=click.Path(exists=True, dir_okay=False),
+              help="Columnar measurement table (.npz) of the profiles, built from DIRECTORY if not given.")
+@click.option("--output-dir", "output_dir", type=str, default='remeasure_plan', show_default=True,
+              help="Directory for the plans and session lists.")
+@click.option("--session-budget", "session_budget", type=click.FloatRange(min=0, min_open=True),
+              default=DEFAULT_SESSION_BUDGET_S, show_default=True, help="Card time available in one session (s).")
+@click.option("--top-k", "top_k", type=click.IntRange(min=1), default=5, show_default=True,
+              help="Number of similar cards used to estimate time of operations not measured on the card.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used to read the profiles.")
+def main(directory: str, table_file: str, output_dir: str, session_budget: float, top_k: int, jobs: int):
+    """Re-measurement plan of every card, DIRECTORY contains profile JSONs and template lists of operations."""
+    if table_file:
+        table = process_results.load_measurement_table(table_file)
+    else:
+        table = process_results.build_measurement_table(directory, jobs)
+
+    plans = plan_directory(directory, output_dir, table, session_budget * 1000, top_k)
+    for card_name, sessions in plans.items():
+        print('{}: {} operations in {} sessions'.format(card_name, sum(len(session) for session in sessions),
+                                                        len(sessions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Robust statistics of operation times recomputed from raw measurements ('operation raw measurements (ms):').
+# PerformanceTesting reports only avg/min/max op and a CHECK flag, which are sensitive to single outliers (e.g., a card
+# reset or a garbage collection during one measurement). Here every measurement is described by median, trimmed mean,
+# median absolute deviation, percentiles and bootstrap confidence interval of the median, all per single operation.
+# Rows of the columnar measurement table are grouped by the number of raw measurements, so every group is a dense
+# matrix and all statistics of the group are computed by single NumPy calls.
+import csv
+import click
+import process_results
+
+PERCENTILES = [5, 25, 75, 95]
+TRIM_PROPORTION = 0.1  # trimmed from each side for trimmed mean
+MIN_SAMPLES = 3  # measurements with less raw values are always noisy
+MAX_RELATIVE_MAD = 0.05  # same tolerance as CHECK of PerformanceTesting, but for median absolute deviation
+MAX_RELATIVE_CI_WIDTH = 0.1
+BOOTSTRAP_RESAMPLES = 1000
+BOOTSTRAP_CHUNK_VALUES = 1 << 22  # maximal number of resampled values held in memory at once
+
+STATS_COLUMNS = ['samples', 'median', 'trimmed_mean', 'mad'] + ['p{:02d}'.format(p) for p in PERCENTILES] + \
+                ['ci_low', 'ci_high', 'noisy']
+KEY_COLUMNS = ['card', 'category', 'method', 'data_length', 'status']
+
+
+def get_op_times(table: dict):
+    """
+    @param table: columnar measurement table (see process_results.build_measurement_table)
+    @returns number of raw values per row and all raw values converted to time of a single operation (ms/op),
+             raw value is time of total iterations / number of raw values operations
+    """
+    import numpy as np
+
+    samples = np.diff(table['raw_offsets'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        repeats = np.where(table['total_iterations'] > 0, table['total_iterations'] / samples, np.nan)
+    return samples, table['raw'] / np.repeat(repeats, samples)
+
+
+def bootstrap_median_ci(values, confidence: float, resamples: int, rng):
+    """
+    @param values: matrix rows x samples, every row sorted
+    @returns lower and upper bound of percentile bootstrap confidence interval of median of every row
+    """
+    import numpy as np
+
+    rows, samples = values.shape
+    # median of a resample of sorted values depends only on the resampled positions, the same resamples of positions
+    # are used for all rows
+    positions = np.sort(rng.integers(0, samples, size=(resamples, samples)), axis=1)
+    lower, upper = positions[:, (samples - 1) // 2], positions[:, samples // 2]
+    low = np.empty(rows)
+    high = np.empty(rows)
+    chunk = max(1, BOOTSTRAP_CHUNK_VALUES // resamples)
+    for start in range(0, rows, chunk):
+        block = values[start:start + chunk]
+        medians = (block[:, lower] + block[:, upper]) / 2
+        low[start:start + chunk], high[start:start + chunk] = \
+            np.percentile(medians, [50 * (1 - confidence), 50 * (1 + confidence)], axis=1)
+    return low, high
+
+
+def compute_robust_stats(table: dict, confidence: float = 0.95, resamples: int = BOOTSTRAP_RESAMPLES,
+                         max_relative_mad: float = MAX_RELATIVE_MAD,
+                         max_relative_ci_width: float = MAX_RELATIVE_CI_WIDTH, seed: int = 0):
+    """
+    @param table: columnar measurement table (see process_results.build_measurement_table)
+    @returns hash map of KEY_COLUMNS and STATS_COLUMNS -> NumPy array with one item per row of the table. Statistics
+             are in ms/op, NaN for rows without raw measurements. Row is noisy if it has less than MIN_SAMPLES raw
+             values, non-positive median, or too wide MAD or confidence interval relative to the median.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    samples, op_times = get_op_times(table)
+    starts = table['raw_offsets'][:-1]
+    stats = {column: np.full(len(samples), np.nan) for column in STATS_COLUMNS}
+    stats['samples'] = samples
+
+    for count in np.unique(samples[samples > 0]).tolist():
+        rows = np.flatnonzero(samples == count)
+        values = np.sort(op_times[starts[rows, None] + np.arange(count)], axis=1)
+        median = np.median(values, axis=1)
+        trim = int(count * TRIM_PROPORTION)
+        stats['median'][rows] = median
+        stats['trimmed_mean'][rows] = values[:, trim:count - trim].mean(axis=1)
+        stats['mad'][rows] = np.median(np.abs(values - median[:, None]), axis=1)
+        for p, percentile in zip(PERCENTILES, np.percentile(values, PERCENTILES, axis=1)):
+            stats['p{:02d}'.format(p)][rows] = percentile
+        stats['ci_low'][rows], stats['ci_high'][rows] = bootstrap_median_ci(values, confidence, resamples, rng)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_mad = stats['mad'] / stats['median']
+        relative_ci_width = (stats['ci_high'] - stats['ci_low']) / stats['median']
+    measured = samples > 0
+    stats['noisy'] = measured & ((samples < MIN_SAMPLES) | ~(stats['median'] > 0) |
+                                 ~(relative_mad <= max_relative_mad) | ~(relative_ci_width <= max_relative_ci_width))
+
+    for column in KEY_COLUMNS:
+        stats[column] = table[column]
+    return stats
+
+
+def export_robust_stats(stats: dict, output_file: str):
+    import numpy as np
+
+    np.savez_compressed(output_file, **stats)
+
+
+def load_robust_stats(file_name: str):
+    import numpy as np
+
+    with np.load(file_name) as stats:
+        return {column: stats[column] for column in stats.files}
+
+
+def export_noisy_csv(stats: dict, output_file: str):
+    # noisy measurements only, one per line, candidates for re-measurement
+    columns = KEY_COLUMNS + [column for column in STATS_COLUMNS if column != 'noisy']
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in zip(*[stats[column][stats['noisy']].tolist() for column in columns]):
+            writer.writerow(row)
+
+
+@click.command()
+@click.argument("source", required=True, type=click.Path(exists=True))
+@click.option("--output", "output_file", type=str, default='robust_stats.npz', show_default=True,
+              help="Output table with statistics of every measurement (NumPy .npz).")
+@click.option("--noisy-csv", "noisy_csv", type=str, default='noisy_measurements.csv', show_default=True,
+              help="Output CSV with noisy measurements only.")
+@click.option("--confidence", "confidence", type=click.FloatRange(min=0, max=1, min_open=True, max_open=True),
+              default=0.95, show_default=True, help="Confidence level of bootstrap intervals.")
+@click.option("--resamples", "resamples", type=click.IntRange(min=1), default=BOOTSTRAP_RESAMPLES, show_default=True,
+              help="Number of bootstrap resamples.")
+@click.option("--max-relative-mad", "max_relative_mad", type=float, default=MAX_RELATIVE_MAD, show_default=True,
+              help="Measurements with larger median absolute deviation relative to median are noisy.")
+@click.option("--max-relative-ci-width", "max_relative_ci_width", type=float, default=MAX_RELATIVE_CI_WIDTH,
+              show_default=True, help="Measurements with wider confidence interval relative to median are noisy.")
+@click.option("--seed", "seed", type=int, default=0, show_default=True, help="Seed of bootstrap resampling.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used to read the profiles.")
+def main(source: str, output_file: str, noisy_csv: str, confidence: float, resamples: int, max_relative_mad: float,
+         max_relative_ci_width: float, seed: int, jobs: int):
+    """Robust statistics from raw measurements, SOURCE is a directory with profile JSONs or a columnar table (.npz)."""
+    if source.endswith('.npz'):
+        table = process_results.load_measurement_table(source)
+    else:
+        table = process_results.build_measurement_table(source, jobs)
+
+    stats = compute_robust_stats(table, confidence, resamples, max_relative_mad, max_relative_ci_width, seed)
+    print('{} measurements, {} with raw values, {} noisy'.format(len(stats['samples']), int((stats['samples'] > 0).sum()),
+                                                               int(stats['noisy'].sum())))
+    export_robust_stats(stats, output_file)
+    export_noisy_csv(stats, noisy_csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Scalability curves of operations measured with variable data lengths (Python counterpart of ScalabilityGraph of
+# AlgTestProcess). Measurements of one profile, category and method with different data lengths (method name keys
+# 'ALG_SHA MessageDigest_doFinal();16;', '...;32;', ...) are grouped into a single curve and fitted by
+#   avg op time (ms) = intercept + slope * data length (bytes)
+# All curves are fitted at once by grouped sums over the columnar measurement table.
+# Curves are per profile file, several profiles of the same card (e.g., of different sessions) are fitted separately.
+# Curves are stored as a single .npz with one row per curve, points of curve i are values[offsets[i]:offsets[i + 1]].
+# process_results runs build_curves as a stage if given --scalability-output.
+import json
+import click
+import process_results
+
+CURVE_COLUMNS = ['profile', 'card', 'category', 'method', 'intercept', 'slope', 'rms_residual', 'r2', 'throughput', 'offsets',
+                 'data_length', 'avg_op', 'residual']
+
+
+def build_curves(table: dict):
+    """
+    Groups variable data length measurements (status OK) into curves and fits them
+    @param table: columnar measurement table (see process_results.build_measurement_table)
+    @returns hash map of CURVE_COLUMNS -> NumPy array. Only curves with at least two distinct data lengths are kept.
+             throughput is in bytes per second estimated from the slope (inf if the slope is not positive).
+    """
+    import numpy as np
+
+    # only keys with data length are variable data measurements, fixed length ones have data length in operation info
+    selected = (table['operation'] != table['method']) & (table['data_length'] > 0) & (table['status'] == 'OK') & \
+               np.isfinite(table['avg_op']) & (table['avg_op'] > 0)
+    profile = table['profile'][selected] if 'profile' in table else table['card'][selected]  # table of older version
+    card = table['card'][selected]
+    category = table['category'][selected]
+    method = table['method'][selected]
+    data_length = table['data_length'][selected].astype(np.int64)
+    avg_op = table['avg_op'][selected]
+
+    # curve of every point, points sorted by curve and data length
+    keys = card
+    for column in [profile, category, method]:
+        keys = np.char.add(np.char.add(keys, '\x1f'), column)
+    curve_keys, curve_index = np.unique(keys, return_inverse=True)
+    order = np.lexsort((data_length, curve_index))
+    curve_index, data_length, avg_op = curve_index[order], data_length[order], avg_op[order]
+
+    # drop curves with a single distinct data length, slope is not defined for them
+    _, distinct_first = np.unique(curve_index * (data_length.max(initial=0) + 1) + data_length, return_index=True)
+    kept = np.bincount(curve_index[distinct_first], minlength=len(curve_keys)) >= 2
+    in_kept = kept[curve_index]
+    curve_keys = curve_keys[kept]
+    curve_index = (np.cumsum(kept) - 1)[curve_index[in_kept]]
+    data_length, avg_op = data_length[in_kept], avg_op[in_kept]
+
+    # least squares fit of all curves, data lengths centered on curve mean for numerical stability
+    curves = len(curve_keys)
+    points = np.bincount(curve_index, minlength=curves)
+    mean_length = np.bincount(curve_index, data_length, minlength=curves) / np.maximum(points, 1)
+    mean_time = np.bincount(curve_index, avg_op, minlength=curves) / np.maximum(points, 1)
+    dx = data_length - mean_length[curve_index]
+    dy = avg_op - mean_time[curve_index]
+    sxx = np.bincount(curve_index, dx * dx, minlength=curves)
+    sxy = np.bincount(curve_index, dx * dy, minlength=curves)
+    syy = np.bincount(curve_index, dy * dy, minlength=curves)
+    slope = sxy / np.where(sxx > 0, sxx, 1)
+    intercept = mean_time - slope * mean_length
+    residual = avg_op - (intercept[curve_index] + slope[curve_index] * data_length)
+    sse = np.bincount(curve_index, residual * residual, minlength=curves)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(syy > 0, 1 - sse / syy, 1.0)
+        throughput = np.where(slope > 0, 1000 / slope, np.inf)
+
+    names = np.array([key.split('\x1f') for key in curve_keys.tolist()], dtype=np.str_).reshape(curves, 4)
+    return {'profile': names[:, 1],
+            'card': names[:, 0],
+            'category': names[:, 2],
+            'method': names[:, 3],
+            'intercept': intercept,
+            'slope': slope,
+            'rms_residual': np.sqrt(sse / np.maximum(points, 1)),
+            'r2': r2,
+            'throughput': throughput,
+            'offsets': np.concatenate([[0], np.cumsum(points)]).astype(np.int64),
+            'data_length': data_length.astype(np.int32),
+            'avg_op': avg_op,
+            'residual': residual}
+
+
+def export_curves(curves: dict, output_file: str):
+    import numpy as np
+
+    np.savez_compressed(output_file, **curves)
+
+
+def load_curves(file_name: str):
+    import numpy as np
+
+    with np.load(file_name) as curves:
+        return {column: curves[column] for column in curves.files}
+
+
+def curves_to_json(curves: dict):
+    """
+    @returns hash map of profile -> card name and hash map of category -> method name -> curve with fit and points
+             (JSON serializable)
+    """
+    result = {}
+    offsets = curves['offsets']
+    for index, (profile, card, category, method) in enumerate(zip(curves['profile'].tolist(), curves['card'].tolist(),
+                                                                  curves['category'].tolist(),
+                                                                  curves['method'].tolist())):
+        points = slice(offsets[index], offsets[index + 1])
+        profile_curves = result.setdefault(profile, {'Card name': card, 'Curves': {}})
+        profile_curves['Curves'].setdefault(category, {})[method] = {
+            'intercept (ms)': float(curves['intercept'][index]),
+            'slope (ms/byte)': float(curves['slope'][index]),
+            'rms residual (ms)': float(curves['rms_residual'][index]),
+            'r2': float(curves['r2'][index]),
+            'throughput (bytes/s)': float(curves['throughput'][index]),
+            'data length': curves['data_length'][points].tolist(),
+            'avg op': curves['avg_op'][points].tolist(),
+            'residual': curves['residual'][points].tolist()}
+    return result
+
+
+@click.command()
+@click.argument("source", required=True, type=click.Path(exists=True))
+@click.option("--output", "output_file", type=str, default='scalability.npz', show_default=True,
+              help="Output table with fitted curves (NumPy .npz).")
+@click.option("--json-output", "json_output", type=str, help="Store the curves also as JSON at given path.")
+@click.option("--jobs", "jobs", type=click.IntRange(min=1), default=1, show_default=True,
+              help="Number of worker processes used to read the profiles.")
+def main(source: str, output_file: str, json_output: str, jobs: int):
+    """Fits time vs. data length curves, SOURCE is a directory with profile JSONs or a columnar table (.npz)."""
+    if source.endswith('.npz'):
+        table = process_results.load_measurement_table(source)
+    else:
+        table = process_results.build_measurement_table(source, jobs)
+
+    curves = build_curves(table)
+    print('{} curves, {} points'.format(len(curves['card']), len(curves['data_length'])))
+    export_curves(curves, output_file)
+    if json_output:
+        with open(json_output, 'w') as f:
+            json.dump(curves_to_json(curves), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
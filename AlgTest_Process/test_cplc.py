@@ -0,0 +1,86 @@
+# Tests of reading CPLC info from profiles, lines as printed by AlgTestJClient (CardMngr.PrintCPLCInfo)
+import json
+
+import cplc
+import cplc_stats
+
+CPLC_BLOCK = '''CPLC;
+CPLC.ICFabricator;{};Infineon
+CPLC.ICType;{}
+CPLC.OperatingSystemID;4791
+CPLC.OperatingSystemReleaseDate;{};(Y DDD) date in that year
+CPLC.OperatingSystemReleaseLevel;1000
+'''
+
+
+def write_profile(directory, sessions: list):
+    filename = str(directory / 'Test_Card_ALGSUPPORT__3b_00.csv')
+    with open(filename, 'w') as f:
+        for fabricator, ic_type, release_date in sessions:
+            f.write('Card ATR;3b 00\n\n' + CPLC_BLOCK.format(fabricator, ic_type, release_date) +
+                    '\nJCSystem.getVersion()[Major.Minor];2.2;\n')
+    return filename
+
+
+def test_read_cplc_values(tmp_path):
+    values = cplc.read_cplc_values(write_profile(tmp_path, [('4090', '5032', '0352')]))
+
+    assert values == {'ICFabricator': '4090', 'ICType': '5032', 'OperatingSystemID': '4791',
+                      'OperatingSystemReleaseDate': '0352', 'OperatingSystemReleaseLevel': '1000',
+                      'CardName': 'Test Card '}
+
+
+def test_read_cplc_values_concatenated_sessions(tmp_path):
+    # concatenated profile of several sessions, the last CPLC block wins
+    values = cplc.read_cplc_values(write_profile(tmp_path, [('4090', '5032', '0352'), ('4790', '5040', '1208')]))
+
+    assert (values['ICFabricator'], values['ICType'], values['OperatingSystemReleaseDate']) == ('4790', '5040', '1208')
+
+
+def test_read_cplc_values_without_cplc(tmp_path):
+    filename = str(tmp_path / 'Test_Card_ALGSUPPORT__3b_00.csv')
+    with open(filename, 'w') as f:
+        f.write('Card ATR;3b 00\n\nJCSystem.getVersion()[Major.Minor];2.2;\n')
+
+    assert cplc.read_cplc_values(filename) is None
+
+
+def test_cplc_cache_with_decoded_names(tmp_path, monkeypatch):
+    profiles = tmp_path / 'results'
+    profiles.mkdir()
+    write_profile(profiles, [('4790', '5040', '2081')])
+    cache_file = str(tmp_path / cplc.CPLC_CACHE_FILE_NAME)
+    cplc.process_jcalgtest_files(str(profiles), {}, [], cache_file)
+
+    # names are decoded once, repeated runs take them from the cache
+    def decode_cplc_values(cplc_values):
+        raise AssertionError('decoded again')
+    monkeypatch.setattr(cplc_stats, 'decode_cplc_values', decode_cplc_values)
+    files_with_cplc = {}
+    cplc.process_jcalgtest_files(str(profiles), files_with_cplc, [], cache_file)
+    values, = files_with_cplc.values()
+    cards, _ = cplc.build_cplc_graph(files_with_cplc)
+    table = cplc_stats.build_cplc_table(files_with_cplc)
+
+    assert values['FabricatorName'] == 'NXP' and values['OSReleaseYear'] == '2012'
+    assert cards[0]['nodes'][0][0] == 'NXP'
+    assert table['Fabricator'].tolist() == ['NXP'] and table['OSReleaseYear'].tolist() == ['2012']
+
+
+def test_cplc_cache_decoding_changed(tmp_path, monkeypatch):
+    profiles = tmp_path / 'results'
+    profiles.mkdir()
+    write_profile(profiles, [('4790', '5040', '2081')])
+    cache_file = str(tmp_path / cplc.CPLC_CACHE_FILE_NAME)
+    cplc.process_jcalgtest_files(str(profiles), {}, [], cache_file)
+
+    # names cached by other decoding tables are decoded again from the cached values
+    monkeypatch.setattr(cplc, 'get_decoding_version', lambda: 'changed')
+    files_with_cplc = {}
+    monkeypatch.setattr(cplc, 'read_cplc_values', None)  # the profile is not read again
+    cplc.process_jcalgtest_files(str(profiles), files_with_cplc, [], cache_file)
+    with open(cache_file) as f:
+        cache = json.load(f)
+
+    assert list(files_with_cplc.values())[0]['FabricatorName'] == 'NXP'
+    assert cache['decoding'] == 'changed'
@@ -0,0 +1,25 @@
+# Tests of CPLC statistics, OS release dates are in CPLC 'Y DDD' format (last digit of the year and day in that year)
+import pytest
+
+import cplc_stats
+
+
+@pytest.mark.parametrize('os_id, os_date, year', [
+    ('4051', '6138', '2006'),  # known release
+    ('0011', '5273', '2005'),  # known release listed with a year of another digit, only its decade is used
+    ('4791', '9123', '2009'),  # unknown release, decade of the closest known release of the OS (2008)
+    ('4700', 'e4d8', '2015'),  # not Y DDD date, year of the known release
+    ('4791', '0400', cplc_stats.UNKNOWN_YEAR),  # day out of range
+    ('ffff', '5123', cplc_stats.UNKNOWN_YEAR),  # unknown OS
+    ('', '', cplc_stats.UNKNOWN_YEAR)])
+def test_get_os_release_year(os_id: str, os_date: str, year: str):
+    assert cplc_stats.get_os_release_year(os_id, os_date) == year
+
+
+def test_os_release_year_trend():
+    files_with_cplc = {'a': {'CardName': 'NXP JCOP', 'OperatingSystemID': '4791', 'OperatingSystemReleaseDate': '2081'},
+                       'b': {'CardName': 'NXP JCOP', 'OperatingSystemID': '4791', 'OperatingSystemReleaseDate': '1200'},
+                       'c': {'CardName': 'Unknown card'}}
+    stats = cplc_stats.compute_cplc_stats(cplc_stats.build_cplc_table(files_with_cplc))
+
+    assert stats['counts']['OSReleaseYear'] == {'2012': 1, '2011': 1, cplc_stats.UNKNOWN_YEAR: 1}
@@ -0,0 +1,227 @@
+# Regression tests of profile conversion against json produced by the original implementation (extract_section over
+# all lines of the file, repairs rewriting the whole file one after another), stored in test_data
+import io
+import json
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+import benchmark
+import pipeline_metrics
+import process_results
+import profile_reader
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+PROFILES = ['sample_PERFORMANCE', 'concatenated_sessions_PERFORMANCE', 'short_7_lines_PERFORMANCE',
+            'short_4_lines_PERFORMANCE']
+SAMPLE_OPS_NAMES = ['TYPE_RSA_CRT_PRIVATE LENGTH_RSA_1024 ALG_RSA_SHA_PKCS1 Signature_sign()\n']
+# seed (also profile index), number of operations per category, variable data, legacy
+SYNTHETIC_PROFILES = [(1, 3, False, False), (2, 1, True, False), (3, 3, False, True), (4, 1, True, True)]
+
+
+def read_test_data(name: str):
+    with open(os.path.join(TEST_DATA, name), newline='') as f:
+        return f.read()
+
+
+def to_json(values: dict):
+    return json.dumps(values, indent=2, sort_keys=False, default=process_results.measurement_to_json)
+
+
+def get_repairs(correct_ops_names: list):
+    # the same repairs as process_directory applies
+    return [process_results.repair_error_codes, process_results.get_missing_underscores_repair(correct_ops_names),
+            process_results.repair_missing_variable_data_lengths]
+
+
+def write_profile(directory, name: str, text: str, newline: str = '\n'):
+    filename = str(directory / (name + '.csv'))
+    with open(filename, 'w', newline='') as f:
+        f.write(text.replace('\n', newline))
+    return filename
+
+
+def write_synthetic_profile(directory, seed: int, num_ops: int, variable_data: bool, legacy: bool):
+    lines = benchmark.generate_profile(random.Random(seed), seed, num_ops, variable_data, legacy)
+    return write_profile(directory, 'synthetic_PERFORMANCE', '\n'.join(lines) + '\n')
+
+
+def get_synthetic_ops_names(num_ops: int):
+    return sorted(benchmark.get_synthetic_ops_name(category, op_index) + '\n'
+                  for category in process_results.MEASUREMENT_CATEGORIES for op_index in range(num_ops))
+
+
+@pytest.fixture(params=[profile_reader.CHUNK_SIZE, 64], ids=['default chunks', 'small chunks'])
+def chunk_size(request, monkeypatch):
+    # small chunks split the sections and repaired lines across several decoded chunks
+    monkeypatch.setattr(profile_reader, 'CHUNK_SIZE', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('name', PROFILES)
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['LF', 'CRLF'])
+def test_parse_profile(tmp_path, name: str, newline: str):
+    filename = write_profile(tmp_path, name, read_test_data(name + '.csv'), newline)
+    with open(filename) as f:
+        values = process_results.parse_profile(f, filename)
+
+    assert to_json(values) == read_test_data(name + '.json')
+
+
+@pytest.mark.parametrize('name', PROFILES)
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['LF', 'CRLF'])
+def test_parse_mapped_profile(tmp_path, chunk_size: int, name: str, newline: str):
+    filename = write_profile(tmp_path, name, read_test_data(name + '.csv'), newline)
+    with profile_reader.map_file(filename) as data:
+        values = process_results.parse_mapped_profile(data, filename)
+
+    assert to_json(values) == read_test_data(name + '.json')
+
+
+def test_parse_empty_profile(tmp_path):
+    filename = write_profile(tmp_path, 'empty', '')
+    with profile_reader.map_file(filename) as data:
+        values = process_results.parse_mapped_profile(data, filename)
+
+    assert to_json(values) == to_json(process_results.parse_profile([], filename))
+
+
+def test_measurement_to_json():
+    # measurements are held as Measurement records, serialized in the same layout as the item dicts
+    with open(os.path.join(TEST_DATA, 'sample_PERFORMANCE.csv')) as f:
+        values = process_results.parse_profile(f, 'sample_PERFORMANCE.csv')
+    expected = json.loads(read_test_data('sample_PERFORMANCE.json'))
+
+    for category, items in values['Measurements'].items():
+        assert list(items) == list(expected['Measurements'][category])
+        for method_name, item in items.items():
+            assert isinstance(item, process_results.Measurement)
+            assert item.method_name == expected['Measurements'][category][method_name]['method name:']
+            assert item.status == expected['Measurements'][category][method_name].get('status')
+            assert json.dumps(item, default=process_results.measurement_to_json) == \
+                json.dumps(expected['Measurements'][category][method_name])
+            assert process_results.Measurement(item.to_item()).to_item() == item.to_item()
+
+    with pytest.raises(TypeError):
+        json.dumps({'a': object()}, default=process_results.measurement_to_json)
+
+
+@pytest.mark.parametrize('name', PROFILES)
+def test_convert_file_to_json(tmp_path, name: str):
+    filename = write_profile(tmp_path, name, read_test_data(name + '.csv'))
+    process_results.convert_file_to_json(filename)
+
+    with open(filename + '.json') as f:
+        assert f.read() == read_test_data(name + '.json')
+    with open(filename + '.json' + process_results.OPERATIONS_INDEX_EXTENSION) as f:
+        index = json.load(f)
+    assert index['Card name'] == json.loads(read_test_data(name + '.json'))['Info'].get('Card name')
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['LF', 'CRLF'])
+def test_repair_file_and_convert_to_json(tmp_path, chunk_size: int, newline: str):
+    filename = write_profile(tmp_path, 'sample_PERFORMANCE', read_test_data('sample_PERFORMANCE.csv'), newline)
+    process_results.repair_file_and_convert_to_json(filename, get_repairs(SAMPLE_OPS_NAMES))
+
+    with open(filename + '.json') as f:
+        assert f.read() == read_test_data('sample_PERFORMANCE.repaired.json')
+    # line ends of the file are kept
+    with open(filename, newline='') as f:
+        assert f.read() == read_test_data('sample_PERFORMANCE.repaired.csv').replace('\n', newline)
+
+
+def repair_file_with_metrics(monkeypatch, filename: str, repairs: list):
+    monkeypatch.setattr(pipeline_metrics, '_collector', None)  # restored after the test
+    collector = pipeline_metrics.start_collecting()
+    with pipeline_metrics.stage('repair'):
+        values = process_results.repair_file(filename, repairs, parse=True)
+    return values, collector.create_report()['stages']['repair']
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['LF', 'CRLF'])
+def test_repair_file_parse(tmp_path, monkeypatch, chunk_size: int, newline: str):
+    # repaired profile is parsed from the repaired chunks, the rewritten file is not parsed again
+    filename = write_profile(tmp_path, 'sample_PERFORMANCE', read_test_data('sample_PERFORMANCE.csv'), newline)
+    values, counters = repair_file_with_metrics(monkeypatch, filename, get_repairs(SAMPLE_OPS_NAMES))
+
+    assert to_json(values) == read_test_data('sample_PERFORMANCE.repaired.json')
+    assert counters['files rewritten'] == 1
+    assert 'repaired files parsed again' not in counters
+
+
+def test_repair_file_parse_changed_sections(tmp_path, monkeypatch):
+    # untranslated error code is written as it is, here it starts a line with category name and so a new category block
+    text = read_test_data('sample_PERFORMANCE.csv').replace('UNKONWN_ERROR-card_has_return_value;6f00',
+                                                            'UNKONWN_ERROR-card_has_return_value;CIPHER')
+    filename = write_profile(tmp_path, 'sample_PERFORMANCE', text)
+    values, counters = repair_file_with_metrics(monkeypatch, filename, get_repairs(SAMPLE_OPS_NAMES))
+
+    with open(filename) as f:
+        assert to_json(values) == to_json(process_results.parse_profile(f, filename))
+    assert counters['repaired files parsed again'] == 1
+
+
+def test_repair_file_unchanged(tmp_path):
+    # already repaired file is not rewritten
+    filename = write_profile(tmp_path, 'sample_PERFORMANCE', read_test_data('sample_PERFORMANCE.repaired.csv'))
+    mtime = os.stat(filename).st_mtime_ns
+    process_results.repair_file(filename, get_repairs(SAMPLE_OPS_NAMES))
+
+    assert os.stat(filename).st_mtime_ns == mtime
+    assert not os.path.exists(filename + '.tmp')
+
+
+@pytest.mark.parametrize('seed, num_ops, variable_data, legacy', SYNTHETIC_PROFILES)
+def test_synthetic_profile(tmp_path, seed: int, num_ops: int, variable_data: bool, legacy: bool):
+    filename = write_synthetic_profile(tmp_path, seed, num_ops, variable_data, legacy)
+    if legacy:
+        process_results.repair_file_and_convert_to_json(filename, get_repairs(get_synthetic_ops_names(num_ops)))
+    else:
+        process_results.convert_file_to_json(filename)
+
+    with open(filename + '.json') as f:
+        assert f.read() == read_test_data('synthetic_{}.json'.format(seed))
+
+
+def test_convert_to_json_directory(tmp_path):
+    for name in PROFILES:
+        shutil.copy(os.path.join(TEST_DATA, name + '.csv'), str(tmp_path))
+    process_results.convert_to_json(str(tmp_path) + os.sep, jobs=2)
+
+    for name in PROFILES:
+        with open(str(tmp_path / (name + '.csv.json'))) as f:
+            assert f.read() == read_test_data(name + '.json')
+
+
+@pytest.mark.parametrize('incremental', [False, True], ids=['full', 'incremental'])
+def test_process_directory_from_within(tmp_path, monkeypatch, incremental: bool):
+    # stats.json and stats_status.json are written to the current directory, repeated runs from within the results
+    # directory find them among the profile json files
+    shutil.copy(os.path.join(TEST_DATA, 'sample_PERFORMANCE.csv'), str(tmp_path))
+    for test_type in ['DATAFIXED', 'DATADEPEND']:
+        with open(str(tmp_path / 'template____PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}__already_measured.list'.format(
+                test_type)), 'w') as f:
+            f.writelines(SAMPLE_OPS_NAMES)
+    monkeypatch.chdir(tmp_path)
+
+    directory = str(tmp_path) + os.sep
+    process_results.process_directory(directory, incremental=incremental, columnar_output='measurements.npz')
+    with open('stats.json') as f:
+        stats = f.read()
+    process_results.process_directory(directory, incremental=incremental, columnar_output='measurements.npz')
+
+    with open('stats.json') as f:
+        assert f.read() == stats
+    assert len(json.loads(stats)) == sum(len(items) for items in json.loads(
+        read_test_data('sample_PERFORMANCE.repaired.json'))['Measurements'].values())
+    operation_index = process_results.OperationIndex.load(process_results.OPERATION_INDEX_FILE_NAME)
+    assert {row[1] for rows in operation_index.operations.values() for row in rows} == {'sample_PERFORMANCE.csv.json'}
+
+
+def test_process_files_without_stdout_file_descriptor(monkeypatch):
+    # workers inherit stdout which can not be reopened, they must start anyway
+    monkeypatch.setattr(sys, 'stdout', io.StringIO())
+    assert process_results.process_files(len, ['a', 'bc', 'def'], 2) == [1, 2, 3]
@@ -0,0 +1,92 @@
+# Tests of re-measurement plans on a synthetic results directory (see benchmark.write_corpus), profiles of every card
+# are measured with either fixed (DATAFIXED) or variable data (DATADEPEND)
+import json
+import os
+
+import numpy as np
+import pytest
+
+import benchmark
+import process_results
+import remeasure_plan
+
+EXTRA_OPERATION = 'TYPE_EXTRA ALG_EXTRA_{} Extra_op()'  # in the template of the test type, not measured on any card
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('corpus')) + os.sep
+    benchmark.write_corpus(directory, 6, num_ops=2, variable_fraction=0.5, legacy_fraction=0, seed=3)
+    process_results.convert_to_json(directory)
+    table = process_results.build_measurement_table(directory)
+    templates = remeasure_plan.load_templates(directory)
+    for test_type in remeasure_plan.TEST_TYPES:
+        templates[test_type] = sorted(templates[test_type] + [EXTRA_OPERATION.format(test_type)])
+    return table, templates
+
+
+def get_card_test_types(table: dict):
+    test_types = remeasure_plan.get_test_types(table)
+    return {card: set(test_types[table['card'] == card]) for card in np.unique(table['card'])}
+
+
+def test_missing_operations_of_card_test_type(corpus):
+    table, templates = corpus
+    card_test_types = get_card_test_types(table)
+    assert {test_type for test_types in card_test_types.values() for test_type in test_types} == \
+        set(remeasure_plan.TEST_TYPES)
+
+    plans = remeasure_plan.create_plans(table, templates, 3600 * 1000, noisy=np.zeros(len(table['card']), dtype=bool))
+    for card, sessions in plans.items():
+        missing = {(test_type, operation) for session in sessions
+                   for test_type, operation, reason, _ in session if reason == 'missing'}
+        # data dependent operations are listed in the template without data lengths of their measured keys
+        assert missing == {(test_type, EXTRA_OPERATION.format(test_type)) for test_type in card_test_types[card]}
+        for session in sessions:
+            for test_type, operation, _, expected_ms in session:
+                assert test_type in card_test_types[card]
+                assert operation in templates[test_type] or operation in table['method']
+                assert expected_ms > 0
+
+
+def test_session_lists(corpus, tmp_path):
+    table, templates = corpus
+    plans = remeasure_plan.create_plans(table, templates, 3600 * 1000, noisy=np.zeros(len(table['card']), dtype=bool))
+    remeasure_plan.write_plans(plans, templates, str(tmp_path))
+
+    for card, sessions in plans.items():
+        for number, session in enumerate(sessions, start=1):
+            for test_type in remeasure_plan.TEST_TYPES:
+                file_name = remeasure_plan.SESSION_FILE_NAME.format(card.replace(' ', '_'), test_type, number)
+                with open(str(tmp_path / file_name)) as f:
+                    already_measured = [line.rstrip('\n') for line in f]
+                # only operations of the session with the same test type are measured
+                assert sorted(already_measured + [item[1] for item in session if item[0] == test_type]) == \
+                    templates[test_type]
+
+
+def test_process_directory_with_plan(tmp_path, monkeypatch):
+    # plans are created by the processing, the client skips only operations which are not planned
+    directory = str(tmp_path / 'results') + os.sep
+    benchmark.write_corpus(directory, 4, num_ops=2, variable_fraction=0.5, legacy_fraction=0, seed=5)
+    monkeypatch.chdir(tmp_path)
+    process_results.process_directory(directory, remeasure_plan_dir=str(tmp_path / 'plans'))
+
+    table = process_results.build_measurement_table(directory)
+    removed = 0
+    for card_name in np.unique(table['card']).tolist():
+        card_file_name = card_name.replace(' ', '_')
+        with open(str(tmp_path / 'plans' / remeasure_plan.PLAN_FILE_NAME.format(card_file_name))) as f:
+            planned = {(item['test type'], item['operation']) for session in json.load(f)
+                       for item in session['operations']}
+        with open(directory + process_results.ALREADY_MEASURED_FILE_NAME.format(card_file_name)) as f:
+            already_measured = [line.rstrip('\n') for line in f]
+        correctly_measured = [operation for card, operation, status in zip(table['card'], table['operation'],
+                                                                           table['status'])
+                              if card == card_name and process_results.is_correctly_measured(str(status))]
+
+        assert planned
+        assert already_measured == sorted(operation for operation in correctly_measured
+                                          if remeasure_plan.get_template_key(operation) not in planned)
+        removed += len(correctly_measured) - len(already_measured)
+    assert removed > 0  # noisy operations are measured correctly, but planned
@@ -0,0 +1,64 @@
+# Tests of scalability curves on a hand-made measurement table (see process_results.build_measurement_table) and on
+# profiles processed by process_results
+import os
+import shutil
+
+import numpy as np
+
+import process_results
+import scalability
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+
+METHOD = 'TYPE_HMAC LENGTH_HMAC_SHA_256_BLOCK_64 ALG_HMAC_SHA_256 Signature_sign()'
+
+
+def create_table(rows: list):
+    # rows of (operation, data length, avg op), the same card, profile and category, status OK
+    operations, data_lengths, avg_ops = zip(*rows)
+    return {'card': np.array(['Card'] * len(rows)),
+            'profile': np.array(['Card_PERFORMANCE.csv.json'] * len(rows)),
+            'category': np.array(['SIGNATURE'] * len(rows)),
+            'operation': np.array(operations),
+            'method': np.array([METHOD] * len(rows)),
+            'data_length': np.array(data_lengths, dtype=np.int32),
+            'status': np.array(['OK'] * len(rows)),
+            'avg_op': np.array(avg_ops)}
+
+
+def test_build_curves():
+    table = create_table([(METHOD + ';16;', 16, 2.0), (METHOD + ';64;', 64, 4.0), (METHOD + ';32;', 32, 2.5)])
+    curves = scalability.build_curves(table)
+
+    assert curves['method'].tolist() == [METHOD]
+    assert curves['offsets'].tolist() == [0, 3]
+    assert curves['data_length'].tolist() == [16, 32, 64]
+    assert curves['slope'][0] > 0
+
+
+def test_build_curves_fixed_length_measurement():
+    # measurement with fixed data length (from operation info, no data length in the key) is not a point of the curve
+    table = create_table([(METHOD + ';16;', 16, 2.0), (METHOD + ';64;', 64, 4.0), (METHOD, 256, 100.0)])
+    curves = scalability.build_curves(table)
+
+    assert curves['data_length'].tolist() == [16, 64]
+    assert np.allclose(curves['residual'], 0)
+    assert len(scalability.build_curves(create_table([(METHOD + ';16;', 16, 2.0), (METHOD, 256, 100.0)]))['card']) == 0
+
+
+def test_build_curves_of_profiles(tmp_path, monkeypatch):
+    # profiles of the same card (e.g., of several sessions) have separate curves, built by processing of the directory
+    for name in ['session1_PERFORMANCE.csv', 'session2_PERFORMANCE.csv']:
+        shutil.copy(os.path.join(TEST_DATA, 'sample_PERFORMANCE.csv'), str(tmp_path / name))
+    for test_type in ['DATAFIXED', 'DATADEPEND']:
+        with open(str(tmp_path / 'template____PERFORMANCE_SYMMETRIC_ASYMMETRIC_{}__already_measured.list'.format(
+                test_type)), 'w') as f:
+            f.write('TYPE_RSA_CRT_PRIVATE LENGTH_RSA_1024 ALG_RSA_SHA_PKCS1 Signature_sign()\n')
+    monkeypatch.chdir(tmp_path)
+    process_results.process_directory(str(tmp_path) + os.sep, scalability_output='scalability.npz')
+    curves = scalability.load_curves('scalability.npz')
+
+    assert curves['profile'].tolist() == ['session1_PERFORMANCE.csv.json', 'session2_PERFORMANCE.csv.json']
+    assert len(set(curves['card'].tolist())) == 1
+    assert curves['offsets'].tolist() == [0, 3, 6]
+    assert list(scalability.curves_to_json(curves)) == curves['profile'].tolist()